@@ -0,0 +1,276 @@
+"""Benchmark the generator -> producer -> WebSocket fan-out hot path.
+
+Runs the same loop as generate_data(): DeadlineScheduler, generate_tick and
+settle_tick with the rate controller, KafkaWrapper's in-flight accounting and
+the broadcaster, with an in-memory Kafka producer and no-op WebSocket clients,
+over a grid of sensor counts, frequencies and client counts. Ticks are paced
+by the scheduler at the case's frequency, so a case reports whether that rate
+can be held as well as the unpaced capacity. Results are written as JSON so runs from two commits can be
+compared:
+
+    python benchmarks/hot_path.py --output before.json
+    python benchmarks/hot_path.py --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from time import monotonic
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import kafka_utils  # noqa: E402
+from broadcaster import Broadcaster  # noqa: E402
+from generator import IndustrialSensorGenerator  # noqa: E402
+from kafka_utils import KafkaWrapper  # noqa: E402
+from metrics import TickMetrics  # noqa: E402
+from pipeline import broadcast_batch, broadcast_states, generate_tick, settle_tick  # noqa: E402
+from rate_control import RateController  # noqa: E402
+from scheduler import DeadlineScheduler, apply_groups  # noqa: E402
+from states import StateLog  # noqa: E402
+
+class FakeFuture:
+    """Already-completed produce future that fires callbacks immediately"""
+
+    def add_callback(self, callback, *args, **kwargs):
+        callback(*args, None, **kwargs)
+        return self
+
+    def add_errback(self, errback, *args, **kwargs):
+        return self
+
+class FakeProducer:
+    """In-memory KafkaProducer built from the wrapper's real producer config.
+
+    send() runs the configured key and value serializers, like kafka-python
+    does (including for keyless sends), so their cost and their failures
+    show up here. Serialized records are held until flush(), as in the
+    producer's accumulator.
+    """
+
+    def __init__(self, value_serializer, key_serializer, **config):
+        self.value_serializer = value_serializer
+        self.key_serializer = key_serializer
+        self.messages = 0
+        self.bytes = 0
+        self.buffered = []
+
+    def send(self, topic, value=None, partition=None, headers=None, key=None):
+        record = (self.key_serializer(key), self.value_serializer(value))
+        self.buffered.append(record)
+        self.bytes += len(record[1])
+        self.messages += 1
+        return FakeFuture()
+
+    def metrics(self):
+        return {}
+
+    def flush(self, timeout=None):
+        self.buffered = []
+
+class FakeWebSocket:
+    """WebSocket that accepts frames without doing any I/O"""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    async def send_text(self, frame: str):
+        self.frames += 1
+        self.bytes += len(frame)
+
+    async def close(self, code: int = 1000):
+        pass
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def drain(broadcaster: Broadcaster):
+    """Yield to sender tasks until every client queue is empty"""
+    while any(client.queue for client in broadcaster.clients.values()):
+        await asyncio.sleep(0)
+
+async def run_case(sensors: int, frequency_hz: float, clients: int, ticks: int,
+                   value_format: str) -> Dict[str, Any]:
+    generator = IndustrialSensorGenerator(seed=0)
+    generator.resize_range(range(sensors))
+
+    kafka = KafkaWrapper("bench:9092", max_in_flight=sensors * 2, value_format=value_format)
+    kafka_utils.KafkaProducer = FakeProducer
+    kafka.connect()
+    producer = kafka.producer
+
+    broadcaster = Broadcaster(max_queue=sensors + 1)
+    state_log = StateLog()
+    websockets = [FakeWebSocket() for _ in range(clients)]
+    for websocket in websockets:
+        broadcaster.register(websocket)
+
+    scheduler = DeadlineScheduler(frequency_hz)
+    apply_groups(scheduler, generator, frequency_hz, None)
+    controller = RateController()
+    tick_metrics = TickMetrics()
+
+    def on_batch(batch):
+        broadcast_batch(broadcaster, batch)
+
+    async def tick(groups):
+        generate_tick(generator, kafka, controller, groups,
+                      on_batch if broadcaster.clients else None, tick_metrics)
+        await settle_tick(kafka, scheduler, controller, tick_metrics)
+        state_log.apply(generator.drain_state_changes())
+        if broadcaster.clients:
+            broadcast_states(broadcaster, state_log)
+        await drain(broadcaster)
+
+    await tick(list(scheduler.groups.values()))  # Warm up
+
+    tick_times = []
+    late = 0
+    generated = controller.generated
+    started = time.perf_counter()
+    for _ in range(ticks):
+        # Paced by the scheduler's absolute deadlines, as generate_data() is
+        due = await scheduler.next_due()
+        tick_started = time.perf_counter()
+        await tick(due)
+        tick_times.append(time.perf_counter() - tick_started)
+        # Overran into the next deadline
+        if monotonic() > min(group.deadline for group in due):
+            late += 1
+    period = 1.0 / frequency_hz
+    # The last tick's period counts too, so a case that keeps up reports exactly its rate
+    elapsed = max(time.perf_counter() - started, ticks * period)
+    readings = controller.generated - generated
+
+    # Separate pass for memory so tracing overhead does not skew timings. Blocks
+    # still allocated once the tick's readings are generated, buffered in the
+    # producer and queued for clients, before the flush releases them;
+    # temporaries freed within the stages are not counted
+    groups = list(scheduler.groups.values())
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    generate_tick(generator, kafka, controller, groups,
+                  on_batch if broadcaster.clients else None, tick_metrics)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    await settle_tick(kafka, scheduler, controller, tick_metrics)
+    await drain(broadcaster)
+
+    for client in list(broadcaster.clients.values()):
+        broadcaster.unregister(client)
+    await asyncio.sleep(0)
+
+    p50 = percentile(tick_times, 50)
+    return {
+        "sensors": sensors,
+        "frequency_hz": frequency_hz,
+        "clients": clients,
+        "value_format": value_format,
+        "ticks": ticks,
+        # Achieved at the paced frequency, and what back-to-back ticks would reach
+        "readings_per_sec": round(readings / elapsed, 1),
+        "capacity_readings_per_sec": round(readings / sum(tick_times), 1),
+        "late_ticks": late,
+        "missed_ticks": sum(group.missed_ticks for group in scheduler.groups.values()),
+        "readings_shed": controller.shed,
+        "rate_scale": round(controller.scale, 3),
+        "tick_ms": {
+            "p50": round(p50 * 1000, 3),
+            "p95": round(percentile(tick_times, 95) * 1000, 3),
+            "p99": round(percentile(tick_times, 99) * 1000, 3),
+            "max": round(max(tick_times) * 1000, 3)
+        },
+        # Fraction of the tick period the median tick uses; above 1.0 the rate cannot be held
+        "budget_used": round(p50 * frequency_hz, 3),
+        "allocated_blocks_per_reading": round(blocks / sensors, 2),
+        "tracemalloc_peak_bytes_per_reading": round((peak - baseline) / sensors, 1),
+        "kafka_bytes_per_reading": round(producer.bytes / producer.messages, 1),
+        "ws_bytes_per_client_tick": round(
+            sum(ws.bytes for ws in websockets) / max(clients, 1) / (ticks + 2), 1
+        )
+    }
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(results: List[Dict[str, Any]], baseline_path: str):
+    """Print readings/sec and p99 tick time relative to a previous run"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    def key(case):
+        return (case["sensors"], case["frequency_hz"], case["clients"], case["value_format"])
+
+    previous = {key(case): case for case in baseline["results"]}
+    print(f"\nvs {baseline['revision']}:")
+    for case in results:
+        old = previous.get(key(case))
+        if not old:
+            continue
+        # Paced throughput is capped by the frequency, so compare capacity
+        speedup = case["capacity_readings_per_sec"] / old.get(
+            "capacity_readings_per_sec", old["readings_per_sec"]
+        )
+        p99 = case["tick_ms"]["p99"] / old["tick_ms"]["p99"]
+        print(f"  sensors={case['sensors']:>6} hz={case['frequency_hz']:>5} clients={case['clients']:>3} "
+              f"{case['value_format']:>4}: throughput x{speedup:.2f}, p99 tick x{p99:.2f}")
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the sensor backend hot path")
+    parser.add_argument("--sensors", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--frequency", type=float, nargs="+", default=[1.0, 10.0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[0, 1, 10])
+    parser.add_argument("--format", nargs="+", default=["json"], dest="formats")
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    args = parser.parse_args(argv)
+
+    results = []
+    grid = itertools.product(args.sensors, args.frequency, args.clients, args.formats)
+    for sensors, frequency_hz, clients, value_format in grid:
+        case = asyncio.run(run_case(sensors, frequency_hz, clients, args.ticks, value_format))
+        results.append(case)
+        print(f"sensors={sensors:>6} hz={frequency_hz:>5} clients={clients:>3} {value_format:>4}: "
+              f"{case['readings_per_sec']:>10.0f} readings/s "
+              f"(capacity {case['capacity_readings_per_sec']:.0f}), "
+              f"p50 {case['tick_ms']['p50']:.2f}ms p99 {case['tick_ms']['p99']:.2f}ms, "
+              f"budget {case['budget_used']:.2f}, late {case['late_ticks']}/{case['ticks']}, "
+              f"{case['allocated_blocks_per_reading']:.2f} blocks/reading, "
+              f"tracemalloc peak {case['tracemalloc_peak_bytes_per_reading']:.0f} B/reading")
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {len(results)} cases to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from time import monotonic
+from typing import Any, Deque, Dict, Iterable, Optional, Tuple, Union
+
+from fastapi import WebSocket
+
+from generator import SensorBatch
+from states import StateLog
+from subscriptions import Subscription
+
+Frame = Union[str, bytes]
+
+# Slow-consumer policies applied when a client's queue is full
+DROP_OLDEST = "drop_oldest"  # Discard the oldest queued frame
+COALESCE = "coalesce"        # Keep only the most recent frame
+DISCONNECT = "disconnect"    # Close the client's connection
+POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+class BroadcastClient:
+    """A connected WebSocket with its own bounded frame queue"""
+
+    def __init__(self, client_id: int, websocket: WebSocket, max_queue: int):
+        self.client_id = client_id
+        self.websocket = websocket
+        # (queued at, frame, carries sensor states)
+        self.queue: Deque[Tuple[float, Frame, bool]] = deque()
+        self.max_queue = max_queue
+        self.ready = asyncio.Event()
+        self.closing = False
+        self.evicted = False
+        self.task: Optional[asyncio.Task] = None
+        # None until the client subscribes; such clients get one JSON frame per reading
+        self.subscription: Optional[Subscription] = None
+        self.last_batch_at = 0.0
+        # Sensor state version last queued; None means the next states frame is a snapshot
+        self.state_version: Optional[int] = None
+
+        self.sent = 0
+        self.dropped = 0
+        self.last_send_latency = 0.0
+        self.connected_at = monotonic()
+
+    def lag_seconds(self) -> float:
+        """Age of the oldest frame still waiting to be sent"""
+        if not self.queue:
+            return 0.0
+        return monotonic() - self.queue[0][0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self.queue),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "lag_seconds": round(self.lag_seconds(), 3),
+            "last_send_latency": round(self.last_send_latency, 4),
+            "connected_seconds": round(monotonic() - self.connected_at, 1),
+            "state_version": self.state_version,
+            "subscription": self.subscription.describe() if self.subscription else None
+        }
+
+class Broadcaster:
+    """Fan frames out to WebSocket clients without blocking the caller.
+
+    Each frame is serialized once and appended to every client's queue; a
+    per-client sender task drains the queue, so a slow browser only falls
+    behind itself instead of stalling generation.
+    """
+
+    def __init__(self, max_queue: int = 1000, policy: str = DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow client policy: {policy}")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.clients: Dict[int, BroadcastClient] = {}
+        self.frames_broadcast = 0
+        self.frames_dropped = 0
+        self.disconnected_slow = 0
+        self._next_id = 0
+        self.logger = logging.getLogger(__name__)
+
+    def register(self, websocket: WebSocket) -> BroadcastClient:
+        """Track an accepted WebSocket and start its sender task"""
+        client = BroadcastClient(self._next_id, websocket, self.max_queue)
+        self._next_id += 1
+        client.task = asyncio.create_task(self._sender(client))
+        self.clients[client.client_id] = client
+        return client
+
+    def unregister(self, client: BroadcastClient):
+        """Stop a client's sender task and forget it"""
+        self.clients.pop(client.client_id, None)
+        client.closing = True
+        client.ready.set()
+
+    def subscribe(self, client: BroadcastClient, subscription: Optional[Subscription]):
+        """Switch a client to batched frames; None returns it to per-reading frames"""
+        was_receiving_states = client.subscription is None or client.subscription.states
+        client.subscription = subscription
+        client.last_batch_at = 0.0
+        if subscription is not None and subscription.states_since is not None:
+            client.state_version = subscription.states_since
+        elif not was_receiving_states:
+            # Changes were not sent while it was opted out
+            client.state_version = None
+
+    def send_to(self, client: BroadcastClient, message: Dict[str, Any]):
+        """Queue a message for one client, behind whatever it has queued already"""
+        self._enqueue(client, monotonic(), json.dumps(message, separators=(',', ':')))
+
+    def broadcast(self, message: Dict[str, Any],
+                  clients: Optional[Iterable[BroadcastClient]] = None):
+        """Serialize a message once and queue it for every client, or only the given ones"""
+        clients = list(self.clients.values()) if clients is None else list(clients)
+        if not clients:
+            return
+        self.broadcast_text(json.dumps(message, separators=(',', ':')), clients)
+
+    def broadcast_text(self, frame: Frame, clients: Optional[Iterable[BroadcastClient]] = None):
+        """Queue an already serialized frame for every client, or only the given ones"""
+        now = monotonic()
+        self.frames_broadcast += 1
+        for client in list(self.clients.values()) if clients is None else clients:
+            self._enqueue(client, now, frame)
+
+    def broadcast_batch(self, batch: SensorBatch):
+        """Queue one frame per subscribed client holding only what it subscribed to.
+
+        Clients whose max rate has not elapsed skip the tick. Each distinct
+        subscription is filtered and encoded once, however many clients share it.
+        """
+        now = monotonic()
+        frames: Dict[Tuple, Optional[Frame]] = {}
+        for client in list(self.clients.values()):
+            subscription = client.subscription
+            if subscription is None or now - client.last_batch_at < subscription.min_interval:
+                continue
+            if subscription.key not in frames:
+                frames[subscription.key] = subscription.encode(batch, subscription.select(batch))
+            frame = frames[subscription.key]
+            if frame is not None:
+                client.last_batch_at = now
+                self._enqueue(client, now, frame)
+        self.frames_broadcast += len(frames)
+
+    def broadcast_states(self, log: StateLog, clients: Iterable[BroadcastClient]):
+        """Bring each client's sensor states up to the log's version.
+
+        Clients at the same version share one frame: the changes since that
+        version, or a snapshot if the log no longer reaches back to it.
+        """
+        now = monotonic()
+        frames: Dict[Optional[int], str] = {}
+        for client in clients:
+            if client.state_version == log.version:
+                continue
+            if client.state_version not in frames:
+                frames[client.state_version] = json.dumps(
+                    log.message_since(client.state_version), separators=(',', ':')
+                )
+            frame = frames[client.state_version]
+            # Set first: dropping an older states frame below resets it to None
+            client.state_version = log.version
+            self._enqueue(client, now, frame, states=True)
+        self.frames_broadcast += len(frames)
+
+    def _enqueue(self, client: BroadcastClient, now: float, frame: Frame, states: bool = False):
+        if len(client.queue) >= client.max_queue:
+            if self.policy == DISCONNECT:
+                self.logger.warning(f"Disconnecting slow websocket client {client.client_id}")
+                self.disconnected_slow += 1
+                client.evicted = True
+                self.unregister(client)
+                return
+            if self.policy == COALESCE:
+                client.dropped += len(client.queue)
+                self.frames_dropped += len(client.queue)
+                dropped_states = any(queued[2] for queued in client.queue)
+                client.queue.clear()
+            else:
+                dropped_states = client.queue.popleft()[2]
+                client.dropped += 1
+                self.frames_dropped += 1
+            if dropped_states:
+                # Later changes build on the lost ones, so resync from a snapshot
+                client.state_version = None
+        client.queue.append((now, frame, states))
+        client.ready.set()
+
+    async def _sender(self, client: BroadcastClient):
+        try:
+            while True:
+                await client.ready.wait()
+                client.ready.clear()
+                if client.closing:
+                    break
+                while client.queue and not client.closing:
+                    _, frame, _ = client.queue.popleft()
+                    started = monotonic()
+                    if isinstance(frame, bytes):
+                        await client.websocket.send_bytes(frame)
+                    else:
+                        await client.websocket.send_text(frame)
+                    client.last_send_latency = monotonic() - started
+                    client.sent += 1
+        except Exception as e:
+            self.logger.error(f"Error sending to websocket {client.client_id}: {e}")
+            self.clients.pop(client.client_id, None)
+        if client.evicted:
+            try:
+                await client.websocket.close(code=1008)
+            except Exception:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return broadcaster totals and per-client lag metrics"""
+        return {
+            "policy": self.policy,
+            "max_queue": self.max_queue,
+            "frames_broadcast": self.frames_broadcast,
+            "frames_dropped": self.frames_dropped,
+            "disconnected_slow": self.disconnected_slow,
+            "clients": {
+                client_id: client.get_stats()
+                for client_id, client in self.clients.items()
+            }
+        }
@@ -1,10 +1,21 @@
 from dataclasses import dataclass
 import numpy as np
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import random
+import re
 import time
 import logging
 
+# Anomaly types with a modelled effect, indexed by their code in SensorFleet
+ANOMALY_TYPES = ("temperature_spike", "vibration_fault", "pressure_drop")
+
+_SENSOR_NUMBER = re.compile(r"sensor_(0|[1-9][0-9]*)$")
+
+def sensor_number(sensor_id: str) -> Optional[int]:
+    """i for a canonical sensor_{i} ID, None for any other ID"""
+    match = _SENSOR_NUMBER.match(sensor_id)
+    return int(match.group(1)) if match else None
+
 @dataclass
 class SensorConfig:
     base_temperature: float
@@ -14,127 +25,562 @@ class SensorConfig:
     drift_rate: float
     maintenance_cycle: int  # Hours until maintenance needed
     last_maintenance: float  # Timestamp of last maintenance
-    
+
+class SensorFleet:
+    """Struct-of-arrays registry of every sensor's parameters and anomaly state.
+
+    Sensors named sensor_{i} are stored by number only: their ID strings are
+    formatted on demand and number_slot maps a number straight to its slot, so
+    a large range of sensors costs a few dozen bytes each. Any other ID (test
+    sensors) is kept in small dicts on the side.
+    """
+
+    FIELDS = {
+        "number": np.int64,  # i for sensor_{i}, -1 for a named sensor
+        "base_temperature": np.float32,
+        "base_vibration": np.float32,
+        "base_pressure": np.float32,
+        "noise_level": np.float32,
+        "drift_rate": np.float32,
+        "maintenance_cycle": np.float32,
+        "last_maintenance": np.float64,
+        "is_test": np.bool_,
+        "anomaly_active": np.bool_,
+        "anomaly_code": np.int16,  # Index into anomaly_names, -1 for none
+        "anomaly_severity": np.float32,
+        "anomaly_duration": np.float32,
+        "anomaly_start": np.float64,
+        "group": np.int16,  # Scheduler group index, 0 for the default group
+        "seq": np.int64,  # Sequence number of the sensor's next reading
+    }
+
+    def __init__(self, capacity: int = 64):
+        self.size = 0
+        self._capacity = capacity
+        for name, dtype in self.FIELDS.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.number_slot = np.full(capacity, -1, dtype=np.int32)
+        self.named_index: Dict[str, int] = {}
+        self.slot_names: Dict[int, str] = {}
+        # Anomaly types seen so far; the first len(ANOMALY_TYPES) have a modelled effect
+        self.anomaly_names: List[str] = list(ANOMALY_TYPES)
+        # Anomaly state changes since the last drain: the new state, or None once cleared
+        self.state_changes: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    def _grow(self, capacity: int):
+        for name in self.FIELDS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+        self._capacity = capacity
+
+    def _reserve(self, extra: int, max_number: int = -1):
+        if self.size + extra > self._capacity:
+            self._grow(max(self._capacity * 2, self.size + extra))
+        if max_number >= len(self.number_slot):
+            grown = np.full(max(len(self.number_slot) * 2, max_number + 1), -1, dtype=np.int32)
+            grown[:len(self.number_slot)] = self.number_slot
+            self.number_slot = grown
+
+    def slot(self, sensor_id: str) -> Optional[int]:
+        """Slot of a sensor, or None if it does not exist"""
+        number = sensor_number(sensor_id)
+        if number is None:
+            return self.named_index.get(sensor_id)
+        if number < len(self.number_slot) and self.number_slot[number] >= 0:
+            return int(self.number_slot[number])
+        return None
+
+    def sensor_id(self, slot: int) -> str:
+        number = self.number[slot]
+        return f"sensor_{number}" if number >= 0 else self.slot_names[slot]
+
+    def ids(self, slots: Optional[np.ndarray] = None) -> List[str]:
+        """Sensor IDs for the given sorted slots, or for every slot in order"""
+        numbers = self.number[:self.size] if slots is None else self.number[slots]
+        ids = [f"sensor_{number}" for number in numbers.tolist()]
+        for slot, name in self.slot_names.items():
+            if slots is None:
+                ids[slot] = name
+            else:
+                position = int(np.searchsorted(slots, slot))
+                if position < len(slots) and slots[position] == slot:
+                    ids[position] = name
+        return ids
+
+    def add(self, sensor_id: str, config: SensorConfig, is_test: bool = False):
+        """Append a sensor, or overwrite its slot if it already exists"""
+        slot = self.slot(sensor_id)
+        if slot is None:
+            number = sensor_number(sensor_id)
+            self._reserve(1, -1 if number is None else number)
+            slot = self.size
+            self.size += 1
+            if number is None:
+                self.number[slot] = -1
+                self.named_index[sensor_id] = slot
+                self.slot_names[slot] = sensor_id
+            else:
+                self.number[slot] = number
+                self.number_slot[number] = slot
+
+        self.base_temperature[slot] = config.base_temperature
+        self.base_vibration[slot] = config.base_vibration
+        self.base_pressure[slot] = config.base_pressure
+        self.noise_level[slot] = config.noise_level
+        self.drift_rate[slot] = config.drift_rate
+        self.maintenance_cycle[slot] = config.maintenance_cycle
+        self.last_maintenance[slot] = config.last_maintenance
+        self.is_test[slot] = is_test
+        if self.anomaly_active[slot]:
+            self.state_changes[sensor_id] = None
+        self.anomaly_active[slot] = False
+        self.anomaly_code[slot] = -1
+        self.group[slot] = 0
+        self.seq[slot] = 0
+
+    def add_numbers(self, numbers: np.ndarray, params: Dict[str, np.ndarray]):
+        """Append sensor_{i} for every i in numbers, with per-sensor parameter columns"""
+        count = len(numbers)
+        if not count:
+            return
+        self._reserve(count, int(numbers.max()))
+        new = slice(self.size, self.size + count)
+        for name in self.FIELDS:
+            getattr(self, name)[new] = params.get(name, 0)
+        self.number[new] = numbers
+        self.anomaly_code[new] = -1
+        self.number_slot[numbers] = np.arange(new.start, new.stop, dtype=np.int32)
+        self.size += count
+
+    def remove(self, sensor_id: str):
+        """Remove a sensor by moving the last slot into its place"""
+        slot = self.slot(sensor_id)
+        if slot is None:
+            return
+        if self.anomaly_active[slot]:
+            self.state_changes[sensor_id] = None
+        last = self.size - 1
+        self._forget(slot)
+        if slot != last:
+            for name in self.FIELDS:
+                column = getattr(self, name)
+                column[slot] = column[last]
+            number = self.number[slot]
+            if number >= 0:
+                self.number_slot[number] = slot
+            else:
+                moved_id = self.slot_names.pop(last)
+                self.slot_names[slot] = moved_id
+                self.named_index[moved_id] = slot
+        self.size = last
+
+    def remove_slots(self, slots: np.ndarray):
+        """Remove many sensors at once, compacting the survivors in order"""
+        if not len(slots):
+            return
+        active = slots[self.anomaly_active[slots]]
+        if len(active):
+            self.state_changes.update(dict.fromkeys(self.ids(np.sort(active))))
+        numbers = self.number[slots]
+        self.number_slot[numbers[numbers >= 0]] = -1
+        for slot in slots[numbers < 0].tolist():
+            self._forget(slot)
+
+        keep = np.ones(self.size, dtype=bool)
+        keep[slots] = False
+        # Slots before the first removal stay where they are
+        first = int(slots.min())
+        survivors = first + np.flatnonzero(keep[first:])
+        size = self.size - len(slots)
+        moved = slice(first, size)
+        for name in self.FIELDS:
+            column = getattr(self, name)
+            column[moved] = column[survivors]
+
+        moved_numbers = self.number[moved]
+        numbered = moved_numbers >= 0
+        self.number_slot[moved_numbers[numbered]] = first + np.flatnonzero(numbered)
+        if self.slot_names:
+            removed_before = np.cumsum(~keep)
+            renamed = {
+                slot - int(removed_before[slot]): sensor_id
+                for slot, sensor_id in self.slot_names.items()
+            }
+            self.slot_names = renamed
+            self.named_index = {sensor_id: slot for slot, sensor_id in renamed.items()}
+        self.size = size
+
+    def _forget(self, slot: int):
+        number = self.number[slot]
+        if number >= 0:
+            self.number_slot[number] = -1
+        else:
+            del self.named_index[self.slot_names.pop(slot)]
+
+    def set_anomaly(self, slot: int, anomaly_type: str, severity: float,
+                    duration: float, start_time: float):
+        """Start an anomaly; types without a modelled effect are labelled only"""
+        if anomaly_type not in self.anomaly_names:
+            self.anomaly_names.append(anomaly_type)
+        self.anomaly_active[slot] = True
+        self.anomaly_code[slot] = self.anomaly_names.index(anomaly_type)
+        self.anomaly_severity[slot] = severity
+        self.anomaly_duration[slot] = duration
+        self.anomaly_start[slot] = start_time
+        self.state_changes[self.sensor_id(slot)] = {
+            "anomaly_active": True,
+            "anomaly_type": anomaly_type
+        }
+
+    def clear_anomalies(self, slots: np.ndarray):
+        """End the anomalies of the given sorted slots"""
+        self.anomaly_active[slots] = False
+        self.state_changes.update(dict.fromkeys(self.ids(slots)))
+
+class SensorBatch:
+    """Columnar readings for every sensor in one tick"""
+
+    def __init__(self, sensor_ids: List[str], timestamp: float,
+                 temperature: np.ndarray, vibration: np.ndarray, pressure: np.ndarray,
+                 anomaly: np.ndarray, maintenance_needed: np.ndarray, is_test: np.ndarray,
+                 numbers: Optional[np.ndarray] = None, seq: Optional[np.ndarray] = None):
+        self.sensor_ids = sensor_ids
+        self.numbers = numbers  # i for sensor_{i}, -1 for named sensors
+        # Per-sensor sequence numbers; a gap downstream means a lost reading
+        self.seq = seq if seq is not None else np.zeros(len(sensor_ids), dtype=np.int64)
+        self.timestamp = timestamp
+        self.temperature = temperature
+        self.vibration = vibration
+        self.pressure = pressure
+        self.anomaly = anomaly
+        self.maintenance_needed = maintenance_needed
+        self.is_test = is_test
+
+    def __len__(self) -> int:
+        return len(self.sensor_ids)
+
+    def row(self, i: int) -> dict:
+        """Build the reading dict for a single sensor in the batch"""
+        return {
+            "sensor_id": self.sensor_ids[i],
+            "seq": int(self.seq[i]),
+            "timestamp": self.timestamp,
+            "temperature": float(self.temperature[i]),
+            "vibration": float(self.vibration[i]),
+            "pressure": float(self.pressure[i]),
+            "operational_state": "anomaly" if self.anomaly[i] else "normal",
+            "maintenance_needed": bool(self.maintenance_needed[i]),
+            "is_test": bool(self.is_test[i])
+        }
+
+    def rows(self) -> Iterator[dict]:
+        """Yield reading dicts in the same format as generate_reading"""
+        temperature = self.temperature.tolist()
+        vibration = self.vibration.tolist()
+        pressure = self.pressure.tolist()
+        anomaly = self.anomaly.tolist()
+        maintenance_needed = self.maintenance_needed.tolist()
+        is_test = self.is_test.tolist()
+        seq = self.seq.tolist()
+        for i, sensor_id in enumerate(self.sensor_ids):
+            yield {
+                "sensor_id": sensor_id,
+                "seq": seq[i],
+                "timestamp": self.timestamp,
+                "temperature": temperature[i],
+                "vibration": vibration[i],
+                "pressure": pressure[i],
+                "operational_state": "anomaly" if anomaly[i] else "normal",
+                "maintenance_needed": maintenance_needed[i],
+                "is_test": is_test[i]
+            }
+
+class SimulatedClock:
+    """Manually advanced clock for backfill and replay runs"""
+
+    def __init__(self, start: float):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
 class IndustrialSensorGenerator:
-    def __init__(self):
-        self.sensor_configs: Dict[str, SensorConfig] = {}
-        self.anomaly_states: Dict[str, dict] = {}
-        self.start_time = time.time()
+    def __init__(self, clock: Optional[Callable[[], float]] = None,
+                 seed: Optional[int] = None):
+        # An injected clock and seed make runs reproducible; defaults use wall time
+        self.clock = clock or time.time
+        self.random = random.Random(seed)
+        self.rng = np.random.default_rng(seed)
+        self.fleet = SensorFleet()
+        self.start_time = self.clock()
         self.logger = logging.getLogger(__name__)
         
     def add_sensor(self, sensor_id: str, is_test: bool = False):
         """Initialize a new sensor with realistic baseline parameters"""
         if is_test:
             # Test sensors have fixed parameters for verification
-            self.sensor_configs[sensor_id] = SensorConfig(
+            config = SensorConfig(
                 base_temperature=70.0,
                 base_vibration=0.2,
                 base_pressure=100.0,
                 noise_level=0.01,
                 drift_rate=0.001,
                 maintenance_cycle=168,  # 1 week
-                last_maintenance=time.time()
+                last_maintenance=self.clock()
             )
         else:
-            self.sensor_configs[sensor_id] = SensorConfig(
-                base_temperature=random.uniform(60, 80),
-                base_vibration=random.uniform(0.1, 0.3),
-                base_pressure=random.uniform(90, 110),
-                noise_level=random.uniform(0.02, 0.05),
-                drift_rate=random.uniform(0.001, 0.003),
-                maintenance_cycle=random.randint(120, 240),  # 5-10 days
-                last_maintenance=time.time()
+            config = SensorConfig(
+                base_temperature=self.random.uniform(60, 80),
+                base_vibration=self.random.uniform(0.1, 0.3),
+                base_pressure=self.random.uniform(90, 110),
+                noise_level=self.random.uniform(0.02, 0.05),
+                drift_rate=self.random.uniform(0.001, 0.003),
+                maintenance_cycle=self.random.randint(120, 240),  # 5-10 days
+                last_maintenance=self.clock()
             )
-            
-        self.anomaly_states[sensor_id] = {
-            "active": False,
-            "type": None,
-            "severity": 0.0,
-            "duration": 0
-        }
+        self.fleet.add(sensor_id, config, is_test)
+
+    def _add_numbers(self, numbers: np.ndarray):
+        """Add sensor_{i} for each i with the same parameter ranges as add_sensor, drawn in bulk"""
+        count = len(numbers)
+        uniform = self.rng.uniform
+        self.fleet.add_numbers(numbers, {
+            "base_temperature": uniform(60, 80, count),
+            "base_vibration": uniform(0.1, 0.3, count),
+            "base_pressure": uniform(90, 110, count),
+            "noise_level": uniform(0.02, 0.05, count),
+            "drift_rate": uniform(0.001, 0.003, count),
+            "maintenance_cycle": self.rng.integers(120, 241, count),  # 5-10 days
+            "last_maintenance": self.clock()
+        })
         
     def generate_reading(self, sensor_id: str, is_test: bool = False) -> dict:
         """Generate a single sensor reading with realistic patterns"""
-        if sensor_id not in self.sensor_configs:
+        fleet = self.fleet
+        slot = fleet.slot(sensor_id)
+        if slot is None:
             raise ValueError(f"Unknown sensor: {sensor_id}")
-            
-        config = self.sensor_configs[sensor_id]
-        anomaly = self.anomaly_states[sensor_id]
+        seq = int(fleet.seq[slot])
+        fleet.seq[slot] += 1
         
         # Calculate time-based effects
-        elapsed_time = time.time() - self.start_time
-        hours_since_maintenance = (time.time() - config.last_maintenance) / 3600
-        maintenance_factor = min(1.0, hours_since_maintenance / config.maintenance_cycle)
+        now = self.clock()
+        elapsed_time = now - self.start_time
+        hours_since_maintenance = (now - fleet.last_maintenance[slot]) / 3600
+        maintenance_factor = min(1.0, hours_since_maintenance / float(fleet.maintenance_cycle[slot]))
+        drift = float(fleet.drift_rate[slot]) * elapsed_time * maintenance_factor
+        noise_level = float(fleet.noise_level[slot])
         
         # Base readings with noise and maintenance degradation
-        temp = config.base_temperature + np.random.normal(0, config.noise_level)
-        temp += config.drift_rate * elapsed_time * maintenance_factor
+        temp = float(fleet.base_temperature[slot]) + self.rng.normal(0, noise_level)
+        temp += drift
         
-        vibration = config.base_vibration + np.random.normal(0, config.noise_level)
-        vibration += config.drift_rate * elapsed_time * maintenance_factor * 2
+        vibration = float(fleet.base_vibration[slot]) + self.rng.normal(0, noise_level)
+        vibration += drift * 2
         
-        pressure = config.base_pressure + np.random.normal(0, config.noise_level)
-        pressure -= config.drift_rate * elapsed_time * maintenance_factor
+        pressure = float(fleet.base_pressure[slot]) + self.rng.normal(0, noise_level)
+        pressure -= drift
         
         # Apply daily patterns if not a test reading
         if not is_test:
-            hour_of_day = time.localtime().tm_hour
+            hour_of_day = time.localtime(now).tm_hour
             # Simulate increased load during working hours
             if 8 <= hour_of_day <= 18:
-                temp += random.uniform(2, 5)
-                vibration += random.uniform(0.05, 0.1)
-                pressure += random.uniform(5, 10)
+                temp += self.random.uniform(2, 5)
+                vibration += self.random.uniform(0.05, 0.1)
+                pressure += self.random.uniform(5, 10)
         
         # Apply anomaly if active
-        if anomaly["active"]:
-            anomaly_elapsed = time.time() - anomaly["start_time"]
-            if anomaly_elapsed > anomaly["duration"]:
-                anomaly["active"] = False
+        active = bool(fleet.anomaly_active[slot])
+        if active:
+            anomaly_elapsed = now - fleet.anomaly_start[slot]
+            if anomaly_elapsed > fleet.anomaly_duration[slot]:
+                active = False
+                fleet.clear_anomalies(np.array([slot]))
             else:
-                severity = anomaly["severity"]
-                if anomaly["type"] == "temperature_spike":
+                severity = float(fleet.anomaly_severity[slot])
+                code = fleet.anomaly_code[slot]
+                if code == 0:
                     temp += 20 * severity
-                elif anomaly["type"] == "vibration_fault":
+                elif code == 1:
                     vibration += 1.5 * severity
-                elif anomaly["type"] == "pressure_drop":
+                elif code == 2:
                     pressure -= 30 * severity
         
         return {
             "sensor_id": sensor_id,
-            "timestamp": time.time(),
-            "temperature": round(temp, 2),
-            "vibration": round(vibration, 3),
-            "pressure": round(pressure, 1),
-            "operational_state": "anomaly" if anomaly["active"] else "normal",
-            "maintenance_needed": maintenance_factor > 0.8,
-            "is_test": is_test
+            "seq": seq,
+            "timestamp": now,
+            # Fleet columns are numpy scalars; serializers need builtins
+            "temperature": round(float(temp), 2),
+            "vibration": round(float(vibration), 3),
+            "pressure": round(float(pressure), 1),
+            "operational_state": "anomaly" if active else "normal",
+            "maintenance_needed": bool(maintenance_factor > 0.8),
+            "is_test": bool(is_test)
         }
-    
+
+    def generate_batch(self, group: Optional[int] = None) -> SensorBatch:
+        """Generate one reading for every sensor (or one group) using vectorized operations"""
+        fleet = self.fleet
+        if group is None:
+            sel = slice(0, fleet.size)
+            slots = None
+        else:
+            slots = np.flatnonzero(fleet.group[:fleet.size] == group)
+            sel = slots
+        sensor_ids = fleet.ids(slots)
+        n = len(sensor_ids)
+        now = self.clock()
+
+        base_temperature = fleet.base_temperature[sel]
+        base_vibration = fleet.base_vibration[sel]
+        base_pressure = fleet.base_pressure[sel]
+        noise_level = fleet.noise_level[sel]
+        is_test = fleet.is_test[sel].copy()
+        seq = fleet.seq[sel].copy()
+        fleet.seq[sel] += 1
+
+        # Calculate time-based effects
+        elapsed_time = now - self.start_time
+        hours_since_maintenance = (now - fleet.last_maintenance[sel]) / 3600
+        maintenance_factor = np.minimum(1.0, hours_since_maintenance / fleet.maintenance_cycle[sel])
+        drift = fleet.drift_rate[sel] * elapsed_time * maintenance_factor
+
+        # Base readings with noise and maintenance degradation
+        noise = self.rng.normal(0.0, 1.0, size=(3, n)) * noise_level
+        temp = base_temperature + noise[0] + drift
+        vibration = base_vibration + noise[1] + drift * 2
+        pressure = base_pressure + noise[2] - drift
+
+        # Apply daily patterns to non-test sensors
+        hour_of_day = time.localtime(now).tm_hour
+        if 8 <= hour_of_day <= 18:
+            load = ~is_test
+            temp += self.rng.uniform(2, 5, n) * load
+            vibration += self.rng.uniform(0.05, 0.1, n) * load
+            pressure += self.rng.uniform(5, 10, n) * load
+
+        # Expire finished anomalies, then apply the ones still active
+        active = fleet.anomaly_active[sel].copy()
+        if active.any():
+            expired = active & (now - fleet.anomaly_start[sel] > fleet.anomaly_duration[sel])
+            if expired.any():
+                fleet.clear_anomalies(np.flatnonzero(expired) if slots is None else slots[expired])
+                active &= ~expired
+
+            severity = fleet.anomaly_severity[sel] * active
+            code = fleet.anomaly_code[sel]
+            temp += 20 * severity * (code == 0)
+            vibration += 1.5 * severity * (code == 1)
+            pressure -= 30 * severity * (code == 2)
+
+        return SensorBatch(
+            sensor_ids=sensor_ids,
+            timestamp=now,
+            temperature=np.round(temp, 2),
+            vibration=np.round(vibration, 3),
+            pressure=np.round(pressure, 1),
+            anomaly=active,
+            maintenance_needed=maintenance_factor > 0.8,
+            is_test=is_test,
+            numbers=fleet.number[sel].copy(),
+            seq=seq
+        )
+
+    def resize(self, sensor_ids: Iterable[str]):
+        """Add and remove sensors so that exactly the given IDs exist"""
+        # Walk both sides in order so seeded runs assign parameters identically
+        desired_sensors = list(sensor_ids)
+        desired_set = set(desired_sensors)
+
+        # Remove extra sensors
+        for sensor_id in [s for s in self.fleet.ids() if s not in desired_set]:
+            self.remove_sensor(sensor_id)
+
+        # Add new sensors
+        for sensor_id in desired_sensors:
+            if self.fleet.slot(sensor_id) is None:
+                self.add_sensor(sensor_id)
+
+    def resize_range(self, numbers: range):
+        """Like resize(f"sensor_{i}" for i in numbers), without building the IDs.
+
+        Membership is worked out with array operations over the fleet, and only
+        sensors that join or leave are initialized or moved, so growing a
+        million-sensor fleet by a few sensors costs a few sensors' work.
+        """
+        if numbers.step <= 0:
+            raise ValueError(f"Sensor ranges must ascend, got step {numbers.step}")
+        fleet = self.fleet
+        current = fleet.number[:fleet.size]
+        numbered = current >= 0
+        offset = current - numbers.start
+        wanted = numbered & (offset >= 0) & (current < numbers.stop) & (offset % numbers.step == 0)
+
+        fleet.remove_slots(np.flatnonzero(~wanted))
+
+        present = np.zeros(len(numbers), dtype=bool)
+        current = fleet.number[:fleet.size]
+        present[(current - numbers.start) // numbers.step] = True
+        self._add_numbers(numbers.start + np.flatnonzero(~present) * numbers.step)
+
+    def assign_groups(self, assignments: Dict[str, int],
+                      ranges: Iterable[Tuple[int, int, int]] = ()):
+        """Move sensors into scheduler groups; unlisted sensors return to group 0.
+
+        ranges holds (start, end, group) triples covering sensor_{start}..sensor_{end - 1}.
+        """
+        fleet = self.fleet
+        fleet.group[:fleet.size] = 0
+        numbers = fleet.number[:fleet.size]
+        for start, end, group in ranges:
+            fleet.group[:fleet.size][(numbers >= start) & (numbers < end)] = group
+        for sensor_id, group in assignments.items():
+            slot = fleet.slot(sensor_id)
+            if slot is not None:
+                fleet.group[slot] = group
+
     def remove_sensor(self, sensor_id: str):
         """Remove a sensor from the generator"""
-        if sensor_id in self.sensor_configs:
-            del self.sensor_configs[sensor_id]
-            del self.anomaly_states[sensor_id]
+        self.fleet.remove(sensor_id)
 
     def inject_anomaly(self, sensor_id: str, anomaly_type: str):
         """Inject an anomaly into a sensor"""
-        if sensor_id not in self.sensor_configs:
+        slot = self.fleet.slot(sensor_id)
+        if slot is None:
             raise ValueError(f"Unknown sensor: {sensor_id}")
             
-        self.anomaly_states[sensor_id] = {
-            "active": True,
-            "type": anomaly_type,
-            "severity": random.uniform(0.5, 1.0),
-            "duration": random.randint(10, 30),
-            "start_time": time.time()
-        }
+        self.fleet.set_anomaly(
+            slot,
+            anomaly_type,
+            severity=self.random.uniform(0.5, 1.0),
+            duration=self.random.randint(10, 30),
+            start_time=self.clock()
+        )
         
+    def drain_state_changes(self) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Anomaly state changes since the last call, for a StateLog to version"""
+        changes = self.fleet.state_changes
+        self.fleet.state_changes = {}
+        return changes
+
     def get_sensor_states(self) -> dict:
         """Get current states of all sensors"""
+        fleet = self.fleet
+        names = [None, *fleet.anomaly_names]  # Code -1 maps to None
+        codes = (fleet.anomaly_code[:fleet.size] + 1).tolist()
         return {
             sensor_id: {
-                "anomaly_active": self.anomaly_states[sensor_id]["active"],
-                "anomaly_type": self.anomaly_states[sensor_id]["type"]
+                "anomaly_active": active,
+                "anomaly_type": names[code]
             }
-            for sensor_id in self.sensor_configs
-        }
\ No newline at end of file
+            for sensor_id, active, code in zip(
+                fleet.ids(), fleet.anomaly_active[:fleet.size].tolist(), codes
+            )
+        }
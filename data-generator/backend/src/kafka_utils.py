@@ -1,64 +1,492 @@
 # data-sources/sensor-generator/kafka_utils.py
 from kafka import KafkaProducer
-from kafka.errors import KafkaError
+from kafka.errors import KafkaError, KafkaTimeoutError
+from kafka.metrics.stats import Total
+from metrics import Histogram
+from spill import SpillLog, SpillRecord
 import json
 import logging
+import struct
+import threading
 import time
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
+
+SCHEMA_ID_HEADER = 'schema-id'
+
+class JsonSerializer:
+    """Schemaless JSON encoding, kept as the fallback wire format"""
+    name = 'json'
+    schema_id = 0
+
+    def serialize(self, message: Dict[str, Any]) -> bytes:
+        return json.dumps(message).encode('utf-8')
+
+    def deserialize(self, data: bytes) -> Dict[str, Any]:
+        return json.loads(data.decode('utf-8'))
+
+class AvroReadingSerializer:
+    """Avro binary encoding of a sensor reading (schema id 2).
+
+    Fields are written in the order of the Flink sensor_data table so that its
+    'avro' format can decode them without a registry. All fields are non-null,
+    so no union branches are written, and the timestamp is timestamp-millis.
+    """
+    name = 'avro'
+    schema_id = 2  # 1 lacked seq and produced_at
+    SCHEMA = {
+        "type": "record",
+        "name": "record",
+        "fields": [
+            {"name": "sensor_id", "type": "string"},
+            {"name": "temperature", "type": "double"},
+            {"name": "vibration", "type": "double"},
+            {"name": "pressure", "type": "double"},
+            {"name": "operational_state", "type": "string"},
+            {"name": "maintenance_needed", "type": "boolean"},
+            {"name": "is_test", "type": "boolean"},
+            {"name": "timestamp", "type": {"type": "long", "logicalType": "timestamp-millis"}},
+            {"name": "seq", "type": "long"},
+            {"name": "produced_at", "type": {"type": "long", "logicalType": "timestamp-millis"}}
+        ]
+    }
+    _doubles = struct.Struct('<ddd')
+
+    @staticmethod
+    def _write_long(out: bytearray, value: int):
+        value = (value << 1) ^ (value >> 63)  # Zigzag
+        while value & ~0x7F:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+    @staticmethod
+    def _read_long(data: bytes, pos: int) -> Tuple[int, int]:
+        shift = 0
+        value = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                break
+            shift += 7
+        return (value >> 1) ^ -(value & 1), pos
+
+    def _write_string(self, out: bytearray, value: str):
+        encoded = value.encode('utf-8')
+        self._write_long(out, len(encoded))
+        out += encoded
+
+    def _read_string(self, data: bytes, pos: int) -> Tuple[str, int]:
+        length, pos = self._read_long(data, pos)
+        return data[pos:pos + length].decode('utf-8'), pos + length
+
+    def serialize(self, message: Dict[str, Any]) -> bytes:
+        out = bytearray()
+        self._write_string(out, message["sensor_id"])
+        out += self._doubles.pack(message["temperature"], message["vibration"], message["pressure"])
+        self._write_string(out, message["operational_state"])
+        out.append(1 if message["maintenance_needed"] else 0)
+        out.append(1 if message["is_test"] else 0)
+        self._write_long(out, int(message["timestamp"] * 1000))
+        self._write_long(out, message["seq"])
+        self._write_long(out, int(message["produced_at"] * 1000))
+        return bytes(out)
+
+    def deserialize(self, data: bytes) -> Dict[str, Any]:
+        sensor_id, pos = self._read_string(data, 0)
+        temperature, vibration, pressure = self._doubles.unpack_from(data, pos)
+        operational_state, pos = self._read_string(data, pos + self._doubles.size)
+        maintenance_needed = data[pos] == 1
+        is_test = data[pos + 1] == 1
+        timestamp_ms, pos = self._read_long(data, pos + 2)
+        seq, pos = self._read_long(data, pos)
+        produced_at_ms, _ = self._read_long(data, pos)
+        return {
+            "sensor_id": sensor_id,
+            "seq": seq,
+            "timestamp": timestamp_ms / 1000,
+            "produced_at": produced_at_ms / 1000,
+            "temperature": temperature,
+            "vibration": vibration,
+            "pressure": pressure,
+            "operational_state": operational_state,
+            "maintenance_needed": maintenance_needed,
+            "is_test": is_test
+        }
+
+SERIALIZERS = {
+    JsonSerializer.name: JsonSerializer,
+    AvroReadingSerializer.name: AvroReadingSerializer,
+}
+
+def encode_key(key: Optional[str]) -> Optional[bytes]:
+    """Key serializer; the producer calls it for keyless sends too"""
+    return key.encode('utf-8') if key is not None else None
+
+SERIALIZERS_BY_ID = {serializer.schema_id: serializer for serializer in SERIALIZERS.values()}
+
+def get_serializer(name: str):
+    """Look up a value serializer by wire format name"""
+    if name not in SERIALIZERS:
+        raise ValueError(f"Unknown value format: {name}")
+    return SERIALIZERS[name]()
 
 class KafkaWrapper:
-    def __init__(self, bootstrap_servers: str, retries: int = 3):
+    # Spill replay: records per bulk batch, seconds to wait for its acks, the
+    # poll interval while idle, and the backoff bounds while replay keeps failing
+    REPLAY_BATCH = 5000
+    REPLAY_TIMEOUT = 10.0
+    REPLAY_IDLE = 0.5
+    RECONNECT_MIN = 1.0
+    RECONNECT_MAX = 30.0
+
+    def __init__(self, bootstrap_servers: str, retries: int = 3,
+                 max_in_flight: int = 10000, linger_ms: int = 5,
+                 batch_size: int = 65536, value_format: str = 'json',
+                 compression_type: Optional[str] = 'gzip',
+                 metadata_max_age_ms: int = 60000,
+                 spill_options: Optional[Dict[str, Any]] = None,
+                 max_block_ms: Optional[int] = None):
         self.bootstrap_servers = bootstrap_servers
         self.retries = retries
+        self.serializer = get_serializer(value_format)
+        self.headers: List[Tuple[str, bytes]] = [
+            (SCHEMA_ID_HEADER, str(self.serializer.schema_id).encode('ascii'))
+        ]
+        self.compression_type = compression_type
+        self.max_in_flight = max_in_flight
+        self.linger_ms = linger_ms
+        self.batch_size = batch_size
+        self.metadata_max_age_ms = metadata_max_age_ms
+        # With a spill log, send() must not hold the event loop for the
+        # default 60s while metadata for an unreachable broker times out
+        self.max_block_ms = max_block_ms or (1000 if spill_options else 60000)
         self.producer: Optional[KafkaProducer] = None
         self.logger = logging.getLogger(__name__)
-        self.logger.info(f"Initializing KafkaWrapper with bootstrap_servers: {bootstrap_servers}")
+
+        # Delivery counters, updated from the producer's I/O thread
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._retried_before = 0  # Retries counted by producers replaced on reconnect
+        self._reconnecting = False
+        self.produce_latency = Histogram()  # Send to broker ack, seconds
+        self.logger.info(f"Initializing KafkaWrapper with bootstrap_servers: {bootstrap_servers}, value_format: {value_format}")
+
+        # Records that could not be delivered wait on disk; a thread replays
+        # them and owns reconnecting, so outages never block the event loop
+        self.spill: Optional[SpillLog] = SpillLog(**spill_options) if spill_options else None
+        self._reconnect_delay = self.RECONNECT_MIN
+        self._reconnect_at = 0.0
+        if self.spill is not None:
+            threading.Thread(target=self._replay_forever, name="kafka-spill-replay", daemon=True).start()
         
-    def connect(self) -> bool:
+    def connect(self, attempts: Optional[int] = None) -> bool:
         """Establish connection to Kafka with retries"""
-        for attempt in range(self.retries):
+        attempts = attempts or self.retries
+        if self.producer is not None:
+            self._retried_before += self._producer_retries()
+        for attempt in range(attempts):
             try:
-                self.logger.info(f"Attempting to connect to Kafka (attempt {attempt + 1}/{self.retries})")
+                self.logger.info(f"Attempting to connect to Kafka (attempt {attempt + 1}/{attempts})")
                 self.producer = KafkaProducer(
                     bootstrap_servers=self.bootstrap_servers.split(','),
-                    value_serializer=lambda v: json.dumps(v).encode('utf-8'),
+                    value_serializer=self.serializer.serialize,
+                    key_serializer=encode_key,
                     acks='all',  # Wait for all replicas
-                    retries=3,   # Retry sending messages
+                    # Retriable errors are retried here, off the callback path;
+                    # _on_error only sees what is left after these retries
+                    retries=self.retries,
                     retry_backoff_ms=1000,  # Backoff between retries
                     max_in_flight_requests_per_connection=1,  # Preserve ordering
-                    compression_type='gzip'  # Compress messages
+                    compression_type=self.compression_type,  # Compress messages
+                    linger_ms=self.linger_ms,  # Let async sends fill batches
+                    batch_size=self.batch_size,
+                    # Keyed sends hash murmur2(key) over the partition count in
+                    # the cached metadata, so added partitions are picked up
+                    # within one refresh
+                    metadata_max_age_ms=self.metadata_max_age_ms,
+                    max_block_ms=self.max_block_ms
                 )
+                self._track_retries()
                 self.logger.info("Successfully connected to Kafka")
                 return True
             except KafkaError as e:
                 self.logger.error(f"Kafka connection attempt {attempt + 1} failed: {str(e)}")
-                if attempt < self.retries - 1:
+                if attempt < attempts - 1:
                     time.sleep(2 ** attempt)  # Exponential backoff
                 else:
                     raise
         return False
     
+    def _track_retries(self):
+        """Add a running total to the producer's retry sensor, which kafka-python only reports as a rate"""
+        metrics = getattr(self.producer, '_metrics', None)
+        sensor = metrics.get_sensor('record-retries') if metrics is not None else None
+        if sensor is not None:
+            sensor.add(metrics.metric_name(
+                'record-retry-total', 'producer-metrics', 'The total number of retried record sends'
+            ), Total())
+
+    def _producer_retries(self) -> int:
+        """Record sends the current producer retried"""
+        metrics = self.producer.metrics() if self.producer is not None else None
+        return int((metrics or {}).get('producer-metrics', {}).get('record-retry-total', 0))
+
+    def _reconnect_in_background(self):
+        """Reconnect on a thread, one attempt at a time with backoff, unless one is running"""
+        with self._lock:
+            if self._reconnecting:
+                return
+            self._reconnecting = True
+        threading.Thread(target=self._reconnect_forever, name="kafka-reconnect", daemon=True).start()
+
+    def _reconnect_forever(self):
+        try:
+            while self.producer is None:
+                time.sleep(max(0.0, self._reconnect_at - time.monotonic()))
+                try:
+                    self.connect(attempts=1)
+                except KafkaError as e:
+                    self._back_off(f"Kafka reconnect failed: {e}")
+            self._reconnect_delay = self.RECONNECT_MIN
+        finally:
+            with self._lock:
+                self._reconnecting = False
+
     def send_message(self, topic: str, message: Dict[str, Any], 
-                    partition: Optional[int] = None) -> bool:
+                    partition: Optional[int] = None, key: Optional[str] = None) -> bool:
         """Send message to Kafka with retries"""
+        if self.spill is not None and (self.spill.active or not self.producer):
+            self._spill(topic, message, key)
+            return False
         if not self.producer:
             self.logger.info("No producer found, attempting to connect...")
             if not self.connect():
                 return False
                 
         try:
-            self.logger.info(f"Sending message to topic {topic}")
+            self.logger.debug(f"Sending message to topic {topic}")
             future = self.producer.send(
                 topic,
                 value=message,
-                partition=partition
+                key=key,
+                partition=partition,
+                headers=self.headers
             )
             # Wait for the message to be sent
             future.get(timeout=10)
-            self.logger.info(f"Successfully sent message to topic {topic}")
+            self.logger.debug(f"Successfully sent message to topic {topic}")
+            with self._lock:
+                self.sent += 1
             return True
         except KafkaError as e:
             self.logger.error(f"Failed to send message to topic {topic}: {str(e)}")
+            if self.spill is not None:
+                self._spill(topic, message, key)
+                return False
+            with self._lock:
+                self.failed += 1
             # Try to reconnect
             self.connect()
-            return False
\ No newline at end of file
+            return False
+
+    def send_async(self, topic: str, message: Dict[str, Any],
+                   partition: Optional[int] = None, key: Optional[str] = None) -> bool:
+        """Queue a message without waiting for the broker; results arrive via callbacks.
+
+        With a key and no explicit partition the producer's murmur2 partitioner
+        picks the partition, so the same key always lands on the same partition
+        for a given partition count, across restarts and across clients.
+
+        With a spill log, messages go to disk instead while the broker is
+        unreachable or after a send fails, and keep going there until replay
+        has caught up. A full in-flight cap means the broker is slow, not down:
+        the message is dropped and the rate controller sees the pressure.
+        """
+        if self.spill is not None and (self.spill.active or not self.producer):
+            return self._spill(topic, message, key)
+        if not self.producer:
+            # Connecting sleeps between attempts, which must not stall the event loop
+            self._reconnect_in_background()
+            with self._lock:
+                self.dropped += 1
+            return False
+
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                self.dropped += 1
+                return False
+            self.in_flight += 1
+
+        self._send_with_callbacks(topic, message, partition, key)
+        return True
+
+    def _send_with_callbacks(self, topic: str, message: Dict[str, Any],
+                             partition: Optional[int], key: Optional[str]):
+        try:
+            future = self.producer.send(topic, value=message, key=key, partition=partition,
+                                        headers=self.headers)
+        except KafkaError as e:
+            if self.spill is not None:
+                # Metadata or buffer space did not arrive within max_block_ms
+                with self._lock:
+                    self.in_flight -= 1
+                self._spill(topic, message, key)
+                return
+            self._on_error(e, topic, message, key)
+            return
+        future.add_callback(self._on_success, time.perf_counter())
+        future.add_errback(self._on_error, topic, message, key)
+
+    def _on_success(self, sent_at: float, _metadata):
+        latency = time.perf_counter() - sent_at
+        with self._lock:
+            self.in_flight -= 1
+            self.sent += 1
+            self.produce_latency.observe(latency)
+
+    def _on_error(self, exc: Exception, topic: str, message: Dict[str, Any], key: Optional[str]):
+        # Runs on the producer's I/O thread, which a send() from here could block
+        # for up to max_block_ms; retriable errors were already retried by the producer
+        if self.spill is not None:
+            with self._lock:
+                self.in_flight -= 1
+            self._spill(topic, message, key)
+            return
+
+        with self._lock:
+            self.in_flight -= 1
+            self.failed += 1
+        self.logger.error(f"Failed to deliver message to topic {topic}: {exc}")
+
+    def _spill(self, topic: str, message: Dict[str, Any], key: Optional[str]) -> bool:
+        """Append a message to the spill log; False if its overflow policy refused it.
+
+        Explicit partitions are not kept: replay sends by key, which lands on
+        the same partition for keyed readings.
+        """
+        return self.spill.append(topic, key, self.serializer.serialize(message), self.serializer.schema_id)
+
+    def _replay_forever(self):
+        while True:
+            try:
+                replayed = self.replay()
+            except Exception as e:
+                self._back_off(f"Spill replay failed: {e!r}")
+                replayed = 0
+            if not replayed:
+                time.sleep(max(self.REPLAY_IDLE, self._reconnect_at - time.monotonic()))
+
+    def _back_off(self, reason: str):
+        self.logger.warning(f"{reason}; retrying in {self._reconnect_delay:.0f}s")
+        self._reconnect_at = time.monotonic() + self._reconnect_delay
+        self._reconnect_delay = min(self._reconnect_delay * 2, self.RECONNECT_MAX)
+
+    def _decode_spilled(self, value: bytes, schema_id: int) -> Dict[str, Any]:
+        if schema_id == self.serializer.schema_id:
+            return self.serializer.deserialize(value)
+        if schema_id not in SERIALIZERS_BY_ID:
+            raise ValueError(f"Unknown schema id {schema_id}")
+        return SERIALIZERS_BY_ID[schema_id]().deserialize(value)  # Spilled by a run with another format
+
+    def replay(self, max_records: Optional[int] = None) -> int:
+        """Deliver the oldest spilled records as one bulk batch; returns how many were processed.
+
+        Runs on the replay thread. Reconnecting happens here, one attempt at a
+        time with exponential backoff between attempts. A batch only counts as
+        delivered once every record in it is acknowledged, so a broker failure
+        part way through replays the whole batch again (at-least-once).
+        Records that fail for reasons a retry cannot fix (undecodable, too
+        large, rejected by the serializer) are dead-lettered and skipped, so
+        one bad record cannot hold the log open.
+        """
+        self.spill.flush()
+        if not self.spill.active or time.monotonic() < self._reconnect_at:
+            return 0
+        records, position = self.spill.read(max_records or self.REPLAY_BATCH)
+        rejected: List[SpillRecord] = []
+        try:
+            if self.producer is None:
+                self.connect(attempts=1)
+            futures = []
+            for record in records:
+                topic, key, value, schema_id = record
+                try:
+                    message = self._decode_spilled(value, schema_id)
+                    futures.append((record, self.producer.send(
+                        topic, value=message, key=key, headers=self.headers
+                    )))
+                except Exception as e:
+                    if isinstance(e, KafkaError) and e.retriable:
+                        raise
+                    self.logger.error(f"Dead-lettering spilled record for topic {topic}: {e!r}")
+                    rejected.append(record)
+            self.producer.flush(timeout=self.REPLAY_TIMEOUT)
+            unacknowledged = 0
+            for record, future in futures:
+                if future.succeeded():
+                    continue
+                if future.is_done and not getattr(future.exception, 'retriable', False):
+                    self.logger.error(f"Dead-lettering spilled record for topic {record[0]}: {future.exception!r}")
+                    rejected.append(record)
+                else:
+                    unacknowledged += 1
+            if unacknowledged:
+                raise KafkaError(f"{unacknowledged} of {len(futures)} replayed records were not acknowledged")
+        except KafkaError as e:
+            self._back_off(f"Spill replay paused: {e}")
+            return 0
+        self._reconnect_delay = self.RECONNECT_MIN
+        if rejected:
+            self.spill.dead_letter(rejected)
+        delivered = len(records) - len(rejected)
+        self.spill.commit(position, delivered)
+        with self._lock:
+            self.sent += delivered
+        if delivered:
+            self.logger.info(f"Replayed {delivered} spilled records")
+        return len(records)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until queued messages are delivered; call once per tick.
+
+        Returns False if the timeout passed first; the messages stay queued
+        and count toward in_flight.
+        """
+        if self.producer:
+            try:
+                self.producer.flush(timeout=timeout)
+            except KafkaTimeoutError:
+                self.logger.debug(f"Kafka flush timed out with {self.in_flight} messages in flight")
+                return False
+            except KafkaError as e:
+                self.logger.error(f"Kafka flush failed: {str(e)}")
+                return False
+        return True
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return delivery counters for the async send path"""
+        spill = self.spill.get_stats() if self.spill is not None else {}
+        retried = self._retried_before + self._producer_retries()
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "sent": self.sent,
+                "failed": self.failed,
+                "retried": retried,
+                "dropped": self.dropped,
+                "spilled": spill.get("appended", 0),
+                "replayed": spill.get("replayed", 0),
+                "spill_dropped": spill.get("dropped", 0),
+                "spill_pending": spill.get("pending_records", 0),
+                "spill_bytes": spill.get("disk_bytes", 0)
+            }
+
+    def get_latency(self) -> Dict[str, Any]:
+        """Snapshot of the send-to-ack latency histogram"""
+        with self._lock:
+            return self.produce_latency.to_dict()
\ No newline at end of file
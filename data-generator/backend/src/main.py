@@ -6,17 +6,39 @@ logging.basicConfig(
 )
 
 from fastapi import FastAPI, WebSocket
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from kafka_utils import KafkaWrapper
 from generator import IndustrialSensorGenerator
-from typing import Dict, Set
+from broadcaster import Broadcaster
+from scheduler import DeadlineScheduler, apply_groups
+from sharding import ShardPool
+from spill import spill_options
+from pipeline import broadcast_batch, broadcast_states, generate_tick, settle_tick
+from rate_control import RateController, target_rate
+from metrics import Exposition, Histogram, TickMetrics
+from states import StateLog
+from subscriptions import Subscription
+from typing import Dict, List, Optional, Set, Tuple
 import asyncio
+import json
 import os
 import logging
-from time import time
+from time import monotonic, time
 from pydantic import BaseModel
 
 KAFKA_BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'kafka-service.kafka.svc.cluster.local:9092')
+KAFKA_MAX_IN_FLIGHT = int(os.getenv('KAFKA_MAX_IN_FLIGHT', '10000'))
+KAFKA_VALUE_FORMAT = os.getenv('KAFKA_VALUE_FORMAT', 'json')  # 'json' or 'avro'
+KAFKA_COMPRESSION = os.getenv('KAFKA_COMPRESSION', 'gzip')  # 'none' disables compression
+WS_MAX_QUEUE = int(os.getenv('WS_MAX_QUEUE', '1000'))
+WS_SLOW_CLIENT_POLICY = os.getenv('WS_SLOW_CLIENT_POLICY', 'drop_oldest')  # drop_oldest, coalesce or disconnect
+GENERATOR_SHARDS = int(os.getenv('GENERATOR_SHARDS', '0'))  # 0 generates in the API process
+SPILL_DIR = os.getenv('SPILL_DIR', '')  # Empty disables spilling undeliverable readings to disk
+SPILL_MAX_BYTES = int(os.getenv('SPILL_MAX_BYTES', str(1 << 30)))
+SPILL_SEGMENT_BYTES = int(os.getenv('SPILL_SEGMENT_BYTES', str(64 << 20)))
+SPILL_OVERFLOW = os.getenv('SPILL_OVERFLOW', 'drop_oldest')  # drop_oldest or drop_newest
+SPILL_MMAP = os.getenv('SPILL_MMAP', 'false').lower() == 'true'
 
 app = FastAPI()
 app.add_middleware(
@@ -29,29 +51,55 @@ app.add_middleware(
 
 # Initialize components
 sensor_generator = IndustrialSensorGenerator()
-kafka = KafkaWrapper(bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS)
+kafka_options = {
+    "bootstrap_servers": KAFKA_BOOTSTRAP_SERVERS,
+    "max_in_flight": KAFKA_MAX_IN_FLIGHT,
+    "value_format": KAFKA_VALUE_FORMAT,
+    "compression_type": None if KAFKA_COMPRESSION == 'none' else KAFKA_COMPRESSION,
+    "spill_options": spill_options(
+        SPILL_DIR, SPILL_MAX_BYTES, SPILL_SEGMENT_BYTES, SPILL_OVERFLOW, SPILL_MMAP,
+        # This process and every shard keep a log each, sharing SPILL_MAX_BYTES
+        logs=GENERATOR_SHARDS + 1
+    ) if SPILL_DIR else None
+}
+kafka = KafkaWrapper(**kafka_options)
 
 try:
-    logging.info("Attempting test message to Kafka....")
-    kafka.send_message(
-        'raw-sensor-data',
-        {
-            "type": "startup",
-            "message": "Sensor generator initialized",
-            "timestamp": time()
-        }
-    )
+    # The binary format only carries readings; startup_event sends a test reading instead
+    if KAFKA_VALUE_FORMAT == 'json':
+        logging.info("Attempting test message to Kafka....")
+        kafka.send_message(
+            'raw-sensor-data',
+            {
+                "type": "startup",
+                "message": "Sensor generator initialized",
+                "timestamp": time()
+            }
+        )
+    else:
+        kafka.connect()
     logging.info(f"Successfully connected to Kafka\n{kafka.__dict__}")
 except Exception as e:
     logging.error(f"Failed to connect to Kafka on startup: {e}")
 
-active_websockets: Set[int] = set()  # Store WebSocket IDs instead of objects
-websocket_instances: Dict[int, WebSocket] = {}  # Map IDs to WebSocket instances
-next_ws_id = 0
+broadcaster = Broadcaster(max_queue=WS_MAX_QUEUE, policy=WS_SLOW_CLIENT_POLICY)
+scheduler = DeadlineScheduler()
+rate_controller = RateController()
+tick_metrics = TickMetrics()
+state_log = StateLog()
+started_at = monotonic()
+shard_pool = ShardPool(GENERATOR_SHARDS, kafka_options) if GENERATOR_SHARDS > 0 else None
+
+class SensorGroupRequest(BaseModel):
+    name: str
+    frequency_hz: float
+    sensor_ids: List[str] = []
+    sensor_range: Optional[Tuple[int, int]] = None  # Half-open range of sensor_{i} indices
 
 class ConfigureRequest(BaseModel):
     num_sensors: int
     frequency_hz: float
+    groups: Optional[List[SensorGroupRequest]] = None  # None keeps the current groups
 
 class AnomalyRequest(BaseModel):
     sensor_ids: list[str]
@@ -59,26 +107,45 @@ class AnomalyRequest(BaseModel):
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    global next_ws_id
     # Accept the connection
     await websocket.accept()
     
-    # Assign an ID to this websocket
-    ws_id = next_ws_id
-    next_ws_id += 1
+    # Give this websocket its own queue and sender task
+    client = broadcaster.register(websocket)
     
-    # Store the websocket
-    active_websockets.add(ws_id)
-    websocket_instances[ws_id] = websocket
+    # A reconnecting client passes ?states_since=<version> to get only the changes it missed
+    states_since = websocket.query_params.get("states_since")
+    if states_since and states_since.isdigit():
+        client.state_version = int(states_since)
     
     try:
         while True:
-            # Wait for messages but don't do anything with them
-            await websocket.receive_text()
+            # {"type": "subscribe", "sensor_ids"?, "sensor_range"?, "fields"?,
+            #  "max_rate_hz"?, "format"?: "json" | "binary", "states"?, "states_since"?}
+            # or {"type": "unsubscribe"}
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+                if message.get("type") == "subscribe":
+                    subscription = Subscription.from_message(message)
+                    broadcaster.subscribe(client, subscription)
+                    broadcaster.send_to(client, {"type": "subscribed", **subscription.describe()})
+                elif message.get("type") == "unsubscribe":
+                    broadcaster.subscribe(client, None)
+                    broadcaster.send_to(client, {"type": "unsubscribed"})
+                else:
+                    raise ValueError(f"Unknown message type: {message.get('type')}")
+            except (ValueError, AttributeError) as e:
+                broadcaster.send_to(client, {"type": "error", "detail": str(e)})
     except:
         # Clean up on disconnection
-        active_websockets.discard(ws_id)
-        websocket_instances.pop(ws_id, None)
+        broadcaster.unregister(client)
+
+@app.get("/ws/stats")
+async def websocket_stats():
+    """Per-client queue depth, drops and lag for WebSocket subscribers"""
+    log = shard_pool.state_log if shard_pool else state_log
+    return {**broadcaster.get_stats(), "states": log.get_stats()}
 
 @app.post("/configure")
 async def configure_generator(config: ConfigureRequest):
@@ -86,30 +153,146 @@ async def configure_generator(config: ConfigureRequest):
     num_sensors = config.num_sensors
     frequency_hz = config.frequency_hz
     
-    # Update the current frequency
-    app.current_frequency = frequency_hz
-    
-    # Update sensors
-    current_sensors = set(sensor_generator.sensor_configs.keys())
-    desired_sensors = {f"sensor_{i}" for i in range(num_sensors)}
-    
-    # Remove extra sensors
-    for sensor_id in current_sensors - desired_sensors:
-        sensor_generator.remove_sensor(sensor_id)
+    groups = None if config.groups is None else [group.dict() for group in config.groups]
     
-    # Add new sensors
-    for sensor_id in desired_sensors - current_sensors:
-        sensor_generator.add_sensor(sensor_id)
-    
-    # Start data generation if not already running
-    if not hasattr(app, "generation_task"):
-        app.generation_task = asyncio.create_task(generate_data())
+    if shard_pool:
+        # Workers each keep their own slice of the sensor ID space
+        if not hasattr(app, "generation_task"):
+            shard_pool.start()
+            app.generation_task = asyncio.create_task(shard_pool.pump(
+                lambda batch: broadcast_batch(broadcaster, batch),
+                lambda: broadcast_states(broadcaster, shard_pool.state_log),
+                lambda: bool(broadcaster.clients)
+            ))
+        group_rates = shard_pool.configure(num_sensors, frequency_hz, groups)
+    else:
+        # Update sensors, then the default rate and any per-group rates
+        sensor_generator.resize_range(range(num_sensors))
+        group_rates = apply_groups(scheduler, sensor_generator, frequency_hz, groups)
+        
+        # Start data generation if not already running
+        if not hasattr(app, "generation_task"):
+            app.generation_task = asyncio.create_task(generate_data())
     
-    return {"status": "configured", "sensor_count": num_sensors, "frequency": frequency_hz}
+    return {
+        "status": "configured",
+        "sensor_count": num_sensors,
+        "frequency": frequency_hz,
+        "groups": group_rates
+    }
+
+@app.get("/schedule")
+async def schedule_stats():
+    """Target vs achieved sampling rate, lag and missed ticks per sensor group"""
+    if shard_pool:
+        return {
+            f"shard_{shard}": stats["schedule"]
+            for shard, stats in shard_pool.shard_stats.items()
+        }
+    return scheduler.get_stats()
+
+@app.get("/rate")
+async def rate_stats():
+    """Target vs achieved readings/sec and the backpressure state"""
+    if shard_pool:
+        return shard_pool.get_stats()["rate"]
+    return {
+        **rate_controller.get_stats(target_rate(scheduler, sensor_generator.fleet)),
+        "kafka": kafka.get_stats()
+    }
+
+def collect_status() -> Dict:
+    """Generation, producer and client counters from this process or every shard"""
+    if shard_pool:
+        stats = shard_pool.get_stats()
+        shards = shard_pool.shard_stats.values()
+        return {
+            "mode": "sharded",
+            "active_sensors": stats["totals"]["sensors"],
+            "rate": stats["rate"],
+            "kafka": {
+                key: sum(shard["kafka"][key] for shard in shards)
+                for key in ("in_flight", "sent", "failed", "retried", "dropped",
+                            "spilled", "replayed", "spill_dropped", "spill_pending", "spill_bytes")
+            },
+            "produce_latency": Histogram.merged(shard["produce_latency"] for shard in shards),
+            "ticks": {
+                stage: Histogram.merged(shard["tick_metrics"][stage] for shard in shards)
+                for stage in TickMetrics.STAGES
+            }
+        }
+    return {
+        "mode": "in_process",
+        "active_sensors": sensor_generator.fleet.size,
+        "rate": rate_controller.get_stats(target_rate(scheduler, sensor_generator.fleet)),
+        "kafka": kafka.get_stats(),
+        "produce_latency": Histogram.merged([kafka.get_latency()]),
+        "ticks": tick_metrics.stages
+    }
+
+@app.get("/status")
+async def status():
+    """Whether generation is running, with fleet size, rates and client counts"""
+    current = collect_status()
+    return {
+        "status": "running" if hasattr(app, "generation_task") else "idle",
+        "mode": current["mode"],
+        "uptime_seconds": round(monotonic() - started_at, 1),
+        "active_sensors": current["active_sensors"],
+        "websocket_clients": len(broadcaster.clients),
+        "rate": current["rate"],
+        "kafka": current["kafka"],
+        "produce_latency_ms_avg": round(
+            current["produce_latency"].sum / current["produce_latency"].count * 1000, 3
+        ) if current["produce_latency"].count else None
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus exposition of the hot-path timings and counters"""
+    current = collect_status()
+    rate = current["rate"]
+    out = Exposition()
+    out.gauge("active_sensors", "Sensors currently generating readings", current["active_sensors"])
+    out.gauge("websocket_clients", "Connected WebSocket clients", len(broadcaster.clients))
+    out.counter("readings_generated", "Readings generated", rate["readings_generated"])
+    out.counter("readings_shed", "Readings skipped while the producer was saturated", rate["readings_shed"])
+    out.gauge("target_readings_per_second", "Configured readings per second", rate["target_readings_per_sec"])
+    out.gauge("achieved_readings_per_second", "Readings per second generated over the last 10s", rate["achieved_readings_per_sec"])
+    out.gauge("producer_in_flight", "Messages queued in the producer or awaiting acks", current["kafka"]["in_flight"])
+    for key, help_text in (
+        ("sent", "Messages acknowledged by Kafka"),
+        ("failed", "Messages that failed after retries"),
+        ("retried", "Message sends retried by the producer"),
+        ("dropped", "Messages dropped at the producer's in-flight cap or while it was disconnected"),
+        ("spilled", "Messages written to the disk spill log"),
+        ("replayed", "Spilled messages delivered to Kafka"),
+        ("spill_dropped", "Spilled messages lost to the spill log's overflow policy")
+    ):
+        out.counter(f"kafka_messages_{key}", help_text, current["kafka"][key])
+    out.gauge("spill_pending_messages", "Messages in the spill log awaiting replay", current["kafka"]["spill_pending"])
+    out.gauge("spill_bytes", "Disk used by the spill log", current["kafka"]["spill_bytes"])
+    out.counter("websocket_frames_dropped", "Frames dropped for slow WebSocket clients", broadcaster.frames_dropped)
+    out.histograms("produce_latency_seconds", "Time from send to broker acknowledgement",
+                   [({}, current["produce_latency"])])
+    out.histograms("tick_stage_seconds", "Time per tick spent in each hot-path stage",
+                   [({"stage": stage}, histogram) for stage, histogram in current["ticks"].items()])
+    return out.text()
+
+@app.get("/shards")
+async def shard_stats():
+    """Aggregated and per-shard generation stats in sharded mode"""
+    if not shard_pool:
+        return {"shards": 0}
+    return shard_pool.get_stats()
 
 @app.post("/inject-anomaly")
 async def inject_anomaly(config: AnomalyRequest):
     """Inject anomalies into specified sensors"""
+    if shard_pool:
+        shard_pool.inject_anomaly(config.sensor_ids, config.anomaly_type)
+        return {"status": "anomaly_injected"}
+    
     for sensor_id in config.sensor_ids:
         sensor_generator.inject_anomaly(sensor_id, config.anomaly_type)
     
@@ -118,48 +301,23 @@ async def inject_anomaly(config: AnomalyRequest):
 async def generate_data():
     """Generate and broadcast sensor data"""
     while True:
-        current_frequency = getattr(app, "current_frequency", 1.0)  # Default to 1 Hz if not set
+        # Wait for the next absolute deadline rather than sleeping after the work
+        due_groups = await scheduler.next_due()
         
-        for sensor_id in sensor_generator.sensor_configs.keys():
-            reading = sensor_generator.generate_reading(sensor_id)
-            
-            # Send to Kafka
-            kafka.send_message(
-                'raw-sensor-data',
-                reading,
-                partition=hash(sensor_id) % 3  # Assuming 3 partitions
-            )
-            
-            # Send to WebSocket clients
-            for ws_id in list(active_websockets):  # Create a copy of the set for iteration
-                try:
-                    websocket = websocket_instances.get(ws_id)
-                    if websocket:
-                        await websocket.send_json({
-                            "type": "sensor_reading",
-                            "data": reading
-                        })
-                except Exception as e:
-                    logging.error(f"Error sending to websocket {ws_id}: {e}")
-                    active_websockets.discard(ws_id)
-                    websocket_instances.pop(ws_id, None)
+        # Send to Kafka and queue for WebSocket clients
+        generate_tick(
+            sensor_generator, kafka, rate_controller, due_groups,
+            (lambda batch: broadcast_batch(broadcaster, batch)) if broadcaster.clients else None,
+            tick_metrics
+        )
         
-        # Send sensor states
-        states = sensor_generator.get_sensor_states()
-        for ws_id in list(active_websockets):
-            try:
-                websocket = websocket_instances.get(ws_id)
-                if websocket:
-                    await websocket.send_json({
-                        "type": "sensor_states",
-                        "data": states
-                    })
-            except Exception as e:
-                logging.error(f"Error sending states to websocket {ws_id}: {e}")
-                active_websockets.discard(ws_id)
-                websocket_instances.pop(ws_id, None)
+        # Deliver the tick's batch off the event loop; a backlog slows the schedule down
+        await settle_tick(kafka, scheduler, rate_controller, tick_metrics)
         
-        await asyncio.sleep(1 / current_frequency)
+        # Version this tick's anomaly changes and send clients only what they lack
+        state_log.apply(sensor_generator.drain_state_changes())
+        if broadcaster.clients:
+            broadcast_states(broadcaster, state_log)
 
 
 _startup_complete = False
@@ -176,6 +334,7 @@ async def startup_event():
         test_sensor_id = "test_sensor_0"
         sensor_generator.add_sensor(test_sensor_id, is_test=True)
         reading = sensor_generator.generate_reading(test_sensor_id, is_test=True)
+        reading["produced_at"] = time()
         
         success = kafka.send_message(
             'raw-sensor-data',
@@ -193,4 +352,10 @@ async def startup_event():
         logging.error(f"Error during startup test messages: {e}")
         raise
 
+async def shutdown_event():
+    """Stop generator shards so they flush their producers"""
+    if shard_pool:
+        await asyncio.to_thread(shard_pool.stop)
+
 app.add_event_handler("startup", startup_event)
+app.add_event_handler("shutdown", shutdown_event)
@@ -0,0 +1,94 @@
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; spans sub-millisecond ticks up to a multi-second stall
+TIMING_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is one bisect and three additions"""
+
+    def __init__(self, buckets: Sequence[float] = TIMING_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"buckets": self.buckets, "counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+    @classmethod
+    def merged(cls, snapshots: Iterable[Dict[str, Any]]) -> "Histogram":
+        """Sum histograms with identical buckets, e.g. reported by every shard"""
+        histogram = cls()
+        for snapshot in snapshots:
+            histogram.buckets = tuple(snapshot["buckets"])
+            if len(histogram.counts) != len(snapshot["counts"]):
+                histogram.counts = [0] * len(snapshot["counts"])
+            for i, count in enumerate(snapshot["counts"]):
+                histogram.counts[i] += count
+            histogram.sum += snapshot["sum"]
+            histogram.count += snapshot["count"]
+        return histogram
+
+class TickMetrics:
+    """Per-tick timings of each hot-path stage, recorded from the event loop"""
+
+    STAGES = ("generate", "produce", "fanout", "flush")
+
+    def __init__(self):
+        self.stages = {stage: Histogram() for stage in self.STAGES}
+
+    def observe(self, stage: str, seconds: float):
+        self.stages[stage].observe(seconds)
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {stage: histogram.to_dict() for stage, histogram in self.stages.items()}
+
+def _labels(labels: Optional[Dict[str, str]], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = [*(labels or {}).items(), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+def _value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Exposition:
+    """Build Prometheus text exposition format, one metric family at a time"""
+
+    def __init__(self, prefix: str = "sensor_backend_"):
+        self.prefix = prefix
+        self.lines: List[str] = []
+
+    def _header(self, name: str, kind: str, help_text: str) -> str:
+        name = self.prefix + name
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        return name
+
+    def gauge(self, name: str, help_text: str, value: float, labels: Optional[Dict[str, str]] = None):
+        name = self._header(name, "gauge", help_text)
+        self.lines.append(f"{name}{_labels(labels)} {_value(value)}")
+
+    def counter(self, name: str, help_text: str, value: float, labels: Optional[Dict[str, str]] = None):
+        name = self._header(name + "_total", "counter", help_text)
+        self.lines.append(f"{name}{_labels(labels)} {_value(value)}")
+
+    def histograms(self, name: str, help_text: str, series: Iterable[Tuple[Dict[str, str], Histogram]]):
+        """One histogram family with a labelled series per (labels, histogram) pair"""
+        name = self._header(name, "histogram", help_text)
+        for labels, histogram in series:
+            cumulative = 0
+            for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                cumulative += count
+                self.lines.append(f"{name}_bucket{_labels(labels, (('le', str(bound)),))} {cumulative}")
+            self.lines.append(f"{name}_sum{_labels(labels)} {_value(histogram.sum)}")
+            self.lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
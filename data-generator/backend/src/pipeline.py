@@ -0,0 +1,92 @@
+import asyncio
+from time import perf_counter, time
+from typing import Any, Callable, Dict, List, Optional
+
+from broadcaster import Broadcaster
+from generator import IndustrialSensorGenerator, SensorBatch
+from kafka_utils import KafkaWrapper
+from metrics import TickMetrics
+from rate_control import RateController, group_sizes
+from scheduler import DeadlineScheduler, SensorGroup
+from states import StateLog
+
+RAW_TOPIC = 'raw-sensor-data'
+# Longest a tick waits on delivery; whatever is left counts as producer pressure
+FLUSH_TIMEOUT = 1.0
+
+def produce_batch(kafka: KafkaWrapper, batch: SensorBatch, topic: str = RAW_TOPIC) -> int:
+    """Queue every reading in a batch on the async producer; returns how many were accepted"""
+    accepted = 0
+    # Wall time the batch is handed to the producer, for end-to-end latency downstream
+    produced_at = time()
+    for reading in batch.rows():
+        reading["produced_at"] = produced_at
+        # Keyed by sensor so each sensor keeps one partition, and its ordering,
+        # across restarts and as the topic's partition count changes
+        if kafka.send_async(topic, reading, key=reading["sensor_id"]):
+            accepted += 1
+    return accepted
+
+def generate_tick(generator: IndustrialSensorGenerator, kafka: KafkaWrapper,
+                  controller: RateController, groups: List[SensorGroup],
+                  on_batch: Optional[Callable[[SensorBatch], None]] = None,
+                  metrics: Optional[TickMetrics] = None):
+    """Generate and queue the due groups, or shed them whole while the producer is saturated"""
+    generated = shed = 0
+    if controller.shedding:
+        sizes = group_sizes(generator.fleet)
+        shed = sum(int(sizes[group.index]) for group in groups if group.index < len(sizes))
+    else:
+        # Stage times are summed over the tick's groups and observed once per tick
+        generate_time = produce_time = fanout_time = 0.0
+        for group in groups:
+            started = perf_counter()
+            batch = generator.generate_batch(group.index)
+            generated_at = perf_counter()
+            produce_batch(kafka, batch)
+            produced_at = perf_counter()
+            if on_batch:
+                on_batch(batch)
+            generated += len(batch)
+            generate_time += generated_at - started
+            produce_time += produced_at - generated_at
+            fanout_time += perf_counter() - produced_at
+        if metrics:
+            metrics.observe("generate", generate_time)
+            metrics.observe("produce", produce_time)
+            if on_batch:
+                metrics.observe("fanout", fanout_time)
+    controller.record(generated, shed)
+
+async def settle_tick(kafka: KafkaWrapper, scheduler: DeadlineScheduler,
+                      controller: RateController, metrics: Optional[TickMetrics] = None):
+    """Give the tick's sends a bounded flush, then rescale the schedule from what is left"""
+    started = perf_counter()
+    await asyncio.to_thread(kafka.flush, FLUSH_TIMEOUT)
+    if metrics:
+        metrics.observe("flush", perf_counter() - started)
+    spill = kafka.spill.get_stats() if kafka.spill is not None else {}
+    scheduler.set_rate_scale(controller.update(
+        kafka.in_flight, kafka.max_in_flight,
+        spill_active=spill.get("active", False),
+        spill_pending=spill.get("pending_records", 0)
+    ))
+
+def broadcast_batch(broadcaster: Broadcaster, batch: SensorBatch):
+    """Queue a batch for WebSocket clients: one frame per reading for clients that
+    never subscribed, one filtered frame per tick for the rest"""
+    unsubscribed = [client for client in broadcaster.clients.values() if client.subscription is None]
+    if unsubscribed:
+        for reading in batch.rows():
+            broadcaster.broadcast({
+                "type": "sensor_reading",
+                "data": reading
+            }, unsubscribed)
+    broadcaster.broadcast_batch(batch)
+
+def broadcast_states(broadcaster: Broadcaster, log: StateLog):
+    """Queue anomaly state changes, or a first snapshot, for clients that want them"""
+    broadcaster.broadcast_states(log, [
+        client for client in broadcaster.clients.values()
+        if client.subscription is None or client.subscription.states
+    ])
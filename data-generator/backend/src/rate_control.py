@@ -0,0 +1,120 @@
+import logging
+from collections import deque
+from time import monotonic
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+NORMAL = "normal"
+THROTTLED = "throttled"
+SHEDDING = "shedding"
+
+class RateController:
+    """Scale the generation rate to what the producer can deliver, AIMD style.
+
+    Pressure is the producer's backlog as a fraction of its in-flight cap,
+    sampled after each tick's bounded flush: records buffered in the producer
+    or awaiting acks, plus records waiting in the spill log. While the spill
+    log is active live sends go to disk behind it, so pressure is held at
+    least at the high watermark until replay has drained it. Above the high watermark the rate scale is halved,
+    below the low watermark it climbs back additively, at most once per
+    interval each. With the scale at its floor and pressure still high, whole
+    ticks are shed instead of being generated and then dropped one by one.
+    """
+
+    def __init__(self, high_watermark: float = 0.8, low_watermark: float = 0.5,
+                 min_scale: float = 0.05, decrease: float = 0.5, increase: float = 0.05,
+                 interval: float = 1.0, window: float = 10.0):
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.min_scale = min_scale
+        self.decrease = decrease
+        self.increase = increase
+        self.interval = interval
+        self.window = window
+        self.logger = logging.getLogger(__name__)
+
+        self.scale = 1.0
+        self.pressure = 0.0
+        self.state = NORMAL
+        self.generated = 0
+        self.shed = 0
+        self.throttle_events = 0
+        self._last_adjust = 0.0
+        self._samples: Deque[Tuple[float, int]] = deque()
+
+    @property
+    def shedding(self) -> bool:
+        return self.state == SHEDDING
+
+    def update(self, in_flight: int, max_in_flight: int, spill_active: bool = False,
+               spill_pending: int = 0, now: Optional[float] = None) -> float:
+        """Adjust the rate scale from the producer's in-flight count and spill backlog"""
+        now = monotonic() if now is None else now
+        self.pressure = (in_flight + spill_pending) / max_in_flight if max_in_flight else 0.0
+        if spill_active:
+            self.pressure = max(self.pressure, self.high_watermark)
+
+        if now - self._last_adjust >= self.interval:
+            if self.pressure >= self.high_watermark and self.scale > self.min_scale:
+                self.scale = max(self.min_scale, self.scale * self.decrease)
+                self.throttle_events += 1
+                self._last_adjust = now
+                self.logger.warning(
+                    f"Producer backlog at {self.pressure:.0%} of in-flight cap, "
+                    f"generation rate scaled to {self.scale:.2f}"
+                )
+            elif self.pressure <= self.low_watermark and self.scale < 1.0:
+                self.scale = min(1.0, self.scale + self.increase)
+                self._last_adjust = now
+
+        if self.pressure >= 1.0 or (self.scale <= self.min_scale and self.pressure >= self.high_watermark):
+            self.state = SHEDDING
+        elif self.scale < 1.0:
+            self.state = THROTTLED
+        else:
+            self.state = NORMAL
+        return self.scale
+
+    def record(self, generated: int, shed: int = 0, now: Optional[float] = None):
+        """Count one tick's readings toward the achieved rate"""
+        now = monotonic() if now is None else now
+        self.generated += generated
+        self.shed += shed
+        self._samples.append((now, generated))
+        while self._samples and self._samples[0][0] < now - self.window:
+            self._samples.popleft()
+
+    def achieved_rate(self) -> float:
+        """Readings/sec generated over the last window"""
+        if len(self._samples) < 2:
+            return 0.0
+        elapsed = self._samples[-1][0] - self._samples[0][0]
+        # The first sample only marks the start of the span
+        readings = sum(count for _, count in self._samples) - self._samples[0][1]
+        return readings / elapsed if elapsed > 0 else 0.0
+
+    def get_stats(self, target_rate: float) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "target_readings_per_sec": round(target_rate, 1),
+            "effective_readings_per_sec": round(target_rate * self.scale, 1),
+            "achieved_readings_per_sec": round(self.achieved_rate(), 1),
+            "rate_scale": round(self.scale, 3),
+            "producer_pressure": round(self.pressure, 3),
+            "readings_generated": self.generated,
+            "readings_shed": self.shed,
+            "throttle_events": self.throttle_events
+        }
+
+def group_sizes(fleet) -> np.ndarray:
+    """Number of sensors in each scheduler group, indexed by group index"""
+    return np.bincount(fleet.group[:fleet.size])
+
+def target_rate(scheduler, fleet) -> float:
+    """Configured readings/sec: every group's frequency times its sensor count"""
+    sizes = group_sizes(fleet)
+    return float(sum(
+        group.frequency_hz * sizes[group.index]
+        for group in scheduler.groups.values() if group.index < len(sizes)
+    ))
@@ -0,0 +1,196 @@
+import asyncio
+import heapq
+import logging
+from time import monotonic
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_GROUP = "default"
+
+class SensorGroup:
+    """A set of sensors sampled at a shared frequency"""
+
+    def __init__(self, index: int, name: str, frequency_hz: float,
+                 sensor_ids: Optional[List[str]] = None,
+                 sensor_range: Optional[Tuple[int, int]] = None):
+        self.index = index
+        self.name = name
+        self.frequency_hz = frequency_hz
+        self.period = 1.0 / frequency_hz
+        self.sensor_ids = sensor_ids or []
+        self.sensor_range = sensor_range  # Half-open range of sensor_{i} indices
+        self.deadline = 0.0
+        self.version = 0
+
+        self.ticks = 0
+        self.missed_ticks = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.avg_lag = 0.0
+        self.first_tick_at: Optional[float] = None
+
+    def members(self) -> List[str]:
+        """Sensor IDs that belong to this group"""
+        members = list(self.sensor_ids)
+        if self.sensor_range:
+            start, end = self.sensor_range
+            members.extend(f"sensor_{i}" for i in range(start, end))
+        return members
+
+    def get_stats(self, now: float, rate_scale: float = 1.0) -> Dict[str, Any]:
+        running = now - self.first_tick_at if self.first_tick_at else 0.0
+        return {
+            "frequency_hz": self.frequency_hz,
+            "effective_hz": round(self.frequency_hz * rate_scale, 3),
+            "achieved_hz": round(self.ticks / running, 3) if running > 0 else 0.0,
+            "ticks": self.ticks,
+            "missed_ticks": self.missed_ticks,
+            "last_lag_ms": round(self.last_lag * 1000, 3),
+            "avg_lag_ms": round(self.avg_lag * 1000, 3),
+            "max_lag_ms": round(self.max_lag * 1000, 3)
+        }
+
+class DeadlineScheduler:
+    """Fire sensor groups on absolute deadlines from a heap of next-due times.
+
+    Deadlines advance by whole periods from the previous deadline rather than
+    from when the work finished, so there is no cumulative drift. When a group
+    falls more than a period behind, the skipped ticks are counted as missed
+    instead of being replayed in a burst. rate_scale stretches every group's
+    period, letting backpressure slow the whole schedule down.
+    """
+
+    def __init__(self, frequency_hz: float = 1.0):
+        self.groups: Dict[str, SensorGroup] = {}
+        self._heap: List[Tuple[float, int, int, str]] = []
+        self._next_index = 0
+        self._changed = asyncio.Event()
+        self.rate_scale = 1.0
+        self.logger = logging.getLogger(__name__)
+        self.set_group(DEFAULT_GROUP, frequency_hz)
+
+    def set_group(self, name: str, frequency_hz: float,
+                  sensor_ids: Optional[List[str]] = None,
+                  sensor_range: Optional[Tuple[int, int]] = None) -> SensorGroup:
+        """Create or update a group; a changed rate takes effect immediately"""
+        if frequency_hz <= 0:
+            raise ValueError(f"Frequency must be positive, got {frequency_hz}")
+        group = self.groups.get(name)
+        if group is None:
+            group = SensorGroup(self._next_index, name, frequency_hz, sensor_ids, sensor_range)
+            self._next_index += 1
+            self.groups[name] = group
+        else:
+            group.sensor_ids = sensor_ids or []
+            group.sensor_range = sensor_range
+            if group.frequency_hz == frequency_hz:
+                return group
+            group.frequency_hz = frequency_hz
+            group.period = 1.0 / frequency_hz
+
+        group.version += 1
+        group.deadline = monotonic()
+        heapq.heappush(self._heap, (group.deadline, group.index, group.version, name))
+        self._changed.set()
+        return group
+
+    def set_rate_scale(self, scale: float):
+        """Run every group at scale times its frequency from its next tick on"""
+        if scale <= 0:
+            raise ValueError(f"Rate scale must be positive, got {scale}")
+        self.rate_scale = scale
+
+    def remove_group(self, name: str):
+        """Stop scheduling a group; stale heap entries are skipped lazily"""
+        if name == DEFAULT_GROUP:
+            raise ValueError("The default group cannot be removed")
+        self.groups.pop(name, None)
+
+    def _peek(self) -> Optional[float]:
+        while self._heap:
+            deadline, _, version, name = self._heap[0]
+            group = self.groups.get(name)
+            if group is not None and group.version == version:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    async def next_due(self) -> List[SensorGroup]:
+        """Sleep until the earliest deadline and return every group now due"""
+        while True:
+            deadline = self._peek()
+            now = monotonic()
+            if deadline is not None and deadline <= now:
+                break
+            self._changed.clear()
+            timeout = None if deadline is None else deadline - now
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        due = []
+        while self._peek() is not None and self._heap[0][0] <= now:
+            deadline, _, _, name = heapq.heappop(self._heap)
+            group = self.groups[name]
+            self._record_tick(group, deadline, now)
+            heapq.heappush(self._heap, (group.deadline, group.index, group.version, name))
+            due.append(group)
+        return due
+
+    def _record_tick(self, group: SensorGroup, deadline: float, now: float):
+        lag = now - deadline
+        group.ticks += 1
+        group.last_lag = lag
+        group.max_lag = max(group.max_lag, lag)
+        group.avg_lag += (lag - group.avg_lag) * 0.05
+        if group.first_tick_at is None:
+            group.first_tick_at = now
+
+        # Advance to the next deadline in the future, counting skipped ticks
+        period = group.period / self.rate_scale
+        next_deadline = deadline + period
+        if next_deadline <= now:
+            missed = int((now - next_deadline) // period) + 1
+            group.missed_ticks += missed
+            next_deadline += missed * period
+        group.deadline = next_deadline
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-group target vs achieved rate, lag and missed ticks"""
+        now = monotonic()
+        return {name: group.get_stats(now, self.rate_scale) for name, group in self.groups.items()}
+
+def group_rates(current: Dict[str, float], frequency_hz: float,
+                groups: Optional[List[Dict[str, Any]]] = None) -> Dict[str, float]:
+    """Group name -> frequency once a configuration is applied.
+
+    The default group runs at frequency_hz. groups is a list of {name,
+    frequency_hz, sensor_ids, sensor_range} dicts that replaces the custom
+    groups; None keeps the current ones, an empty list removes them all.
+    """
+    custom = {name: rate for name, rate in current.items() if name != DEFAULT_GROUP}
+    if groups is not None:
+        custom = {group["name"]: group["frequency_hz"] for group in groups}
+    return {DEFAULT_GROUP: frequency_hz, **custom}
+
+def apply_groups(scheduler: DeadlineScheduler, generator, frequency_hz: float,
+                 groups: Optional[List[Dict[str, Any]]] = None) -> Dict[str, float]:
+    """Update group rates as group_rates() resolves them and move the generator's
+    sensors into their groups; returns the resulting rates"""
+    rates = group_rates(
+        {name: group.frequency_hz for name, group in scheduler.groups.items()}, frequency_hz, groups
+    )
+    for name in list(scheduler.groups):
+        if name not in rates:
+            scheduler.remove_group(name)
+    scheduler.set_group(DEFAULT_GROUP, frequency_hz)
+    for group in groups or ():
+        scheduler.set_group(group["name"], group["frequency_hz"],
+                            group.get("sensor_ids"), group.get("sensor_range"))
+
+    custom = [group for group in scheduler.groups.values() if group.name != DEFAULT_GROUP]
+    generator.assign_groups(
+        {sensor_id: group.index for group in custom for sensor_id in group.sensor_ids},
+        [(*group.sensor_range, group.index) for group in custom if group.sensor_range]
+    )
+    return rates
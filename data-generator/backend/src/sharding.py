@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import queue
+import re
+import zlib
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional
+
+from generator import IndustrialSensorGenerator, SensorBatch
+from kafka_utils import KafkaWrapper
+from metrics import TickMetrics
+from pipeline import generate_tick, settle_tick
+from rate_control import RateController, target_rate
+from scheduler import DeadlineScheduler, apply_groups, group_rates
+from states import StateLog
+
+_SENSOR_INDEX = re.compile(r"sensor_(\d+)$")
+STATS_INTERVAL = 1.0  # Seconds between worker stats reports
+
+def shard_for(sensor_id: str, num_shards: int) -> int:
+    """Stable shard for a sensor: sensor_{i} maps to i % N, anything else by CRC32"""
+    match = _SENSOR_INDEX.match(sensor_id)
+    if match:
+        return int(match.group(1)) % num_shards
+    return zlib.crc32(sensor_id.encode('utf-8')) % num_shards
+
+async def _worker_loop(shard: int, num_shards: int, kafka_options: Dict[str, Any],
+                       commands: mp.Queue, output: mp.Queue):
+    generator = IndustrialSensorGenerator()
+    scheduler = DeadlineScheduler()
+    if kafka_options.get("spill_options"):
+        # Each worker replays its own log, so they must not share segment files;
+        # the options already hold this worker's share of the disk budget
+        spill_options = kafka_options["spill_options"]
+        kafka_options = {**kafka_options, "spill_options": {
+            **spill_options,
+            "directory": os.path.join(spill_options["directory"], f"shard-{shard}")
+        }}
+    kafka = KafkaWrapper(**kafka_options)
+    controller = RateController()
+    tick_metrics = TickMetrics()
+    logger = logging.getLogger(f"{__name__}.shard{shard}")
+    forward = False
+    running = False
+    last_report = monotonic()
+
+    async def handle_commands():
+        nonlocal forward, running
+        while True:
+            command, payload = await asyncio.to_thread(commands.get)
+            if command == "configure":
+                generator.resize_range(range(shard, payload["num_sensors"], num_shards))
+                apply_groups(scheduler, generator, payload["frequency_hz"], payload["groups"])
+                running = True
+            elif command == "inject_anomaly":
+                for sensor_id in payload["sensor_ids"]:
+                    try:
+                        generator.inject_anomaly(sensor_id, payload["anomaly_type"])
+                    except ValueError as e:
+                        logger.error(str(e))
+            elif command == "forward":
+                forward = payload
+            elif command == "stop":
+                return
+
+    def forward_batch(batch: SensorBatch):
+        if len(batch):
+            output.put(("batch", shard, batch))
+
+    command_task = asyncio.create_task(handle_commands())
+    try:
+        while not command_task.done():
+            due_task = asyncio.create_task(scheduler.next_due())
+            await asyncio.wait({due_task, command_task}, return_when=asyncio.FIRST_COMPLETED)
+            if not due_task.done():
+                due_task.cancel()
+                break
+            if not running:
+                continue
+
+            generate_tick(
+                generator, kafka, controller, due_task.result(),
+                forward_batch if forward else None, tick_metrics
+            )
+            await settle_tick(kafka, scheduler, controller, tick_metrics)
+            # Always shipped, forwarding or not, so the parent's state log stays complete
+            changes = generator.drain_state_changes()
+            if changes:
+                output.put(("states", shard, changes))
+
+            now = monotonic()
+            if now - last_report >= STATS_INTERVAL:
+                output.put(("stats", shard, {
+                    "sensors": generator.fleet.size,
+                    "readings": controller.generated,
+                    "kafka": kafka.get_stats(),
+                    "produce_latency": kafka.get_latency(),
+                    "tick_metrics": tick_metrics.to_dict(),
+                    "rate": controller.get_stats(target_rate(scheduler, generator.fleet)),
+                    "schedule": scheduler.get_stats()
+                }))
+                last_report = now
+    finally:
+        kafka.flush(10)
+
+def _run_worker(shard: int, num_shards: int, kafka_options: Dict[str, Any],
+                commands: mp.Queue, output: mp.Queue):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(_worker_loop(shard, num_shards, kafka_options, commands, output))
+
+class ShardPool:
+    """Run generation in worker processes that each own a slice of the sensor IDs.
+
+    The parent keeps the API: it fans configuration out to every shard, routes
+    anomaly injections to the owning shard, and merges readings, sensor states
+    and stats coming back from the workers.
+    """
+
+    def __init__(self, num_shards: int, kafka_options: Dict[str, Any]):
+        self.num_shards = num_shards
+        self.kafka_options = kafka_options
+        self._ctx = mp.get_context("spawn")  # Never fork a running event loop
+        self.output = self._ctx.Queue()
+        self.commands: List[mp.Queue] = []
+        self.processes: List[mp.Process] = []
+        self.shard_stats: Dict[int, Dict[str, Any]] = {}
+        # Shards own disjoint sensors, so their changes share one version sequence
+        self.state_log = StateLog()
+        self.forwarding = False
+        # Group rates last sent to the shards, as each shard's apply_groups leaves them
+        self.group_rates: Dict[str, float] = {}
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        """Spawn one worker process per shard"""
+        for shard in range(self.num_shards):
+            commands = self._ctx.Queue()
+            process = self._ctx.Process(
+                target=_run_worker,
+                args=(shard, self.num_shards, self.kafka_options, commands, self.output),
+                name=f"sensor-shard-{shard}",
+                daemon=True
+            )
+            process.start()
+            self.commands.append(commands)
+            self.processes.append(process)
+        self.logger.info(f"Started {self.num_shards} generator shards")
+
+    def stop(self):
+        """Ask every worker to flush and exit"""
+        for commands in self.commands:
+            commands.put(("stop", None))
+        for process in self.processes:
+            process.join(timeout=15)
+            if process.is_alive():
+                process.terminate()
+        self.commands.clear()
+        self.processes.clear()
+
+    def configure(self, num_sensors: int, frequency_hz: float,
+                  groups: Optional[List[Dict[str, Any]]] = None) -> Dict[str, float]:
+        """Send the fleet configuration to every shard; each keeps its own slice.
+
+        Returns the group rates the shards now run (None keeps the current
+        custom groups).
+        """
+        payload = {"num_sensors": num_sensors, "frequency_hz": frequency_hz, "groups": groups}
+        for commands in self.commands:
+            commands.put(("configure", payload))
+        self.group_rates = group_rates(self.group_rates, frequency_hz, groups)
+        return dict(self.group_rates)
+
+    def inject_anomaly(self, sensor_ids: List[str], anomaly_type: str):
+        """Route anomaly injections to the shards that own the sensors"""
+        by_shard: Dict[int, List[str]] = {}
+        for sensor_id in sensor_ids:
+            by_shard.setdefault(shard_for(sensor_id, self.num_shards), []).append(sensor_id)
+        for shard, shard_sensor_ids in by_shard.items():
+            self.commands[shard].put(("inject_anomaly", {
+                "sensor_ids": shard_sensor_ids,
+                "anomaly_type": anomaly_type
+            }))
+
+    def set_forwarding(self, enabled: bool):
+        """Toggle whether workers ship readings back for WebSocket clients"""
+        if enabled == self.forwarding:
+            return
+        self.forwarding = enabled
+        for commands in self.commands:
+            commands.put(("forward", enabled))
+
+    async def pump(self, on_batch: Callable[[SensorBatch], None],
+                   on_states: Callable[[], None],
+                   wants_readings: Callable[[], bool]):
+        """Consume worker output forever, dispatching batches and versioning state changes"""
+        while True:
+            self.set_forwarding(wants_readings())
+            try:
+                kind, shard, payload = await asyncio.to_thread(self.output.get, True, 0.5)
+            except queue.Empty:
+                continue
+            if kind == "batch":
+                on_batch(payload)
+            elif kind == "states":
+                self.state_log.apply(payload)
+                on_states()
+            elif kind == "stats":
+                self.shard_stats[shard] = payload
+
+    def get_sensor_states(self) -> Dict[str, Any]:
+        """Sensors with an active anomaly on any shard"""
+        return dict(self.state_log.states)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Aggregate worker stats plus the per-shard breakdown"""
+        totals = {"sensors": 0, "readings": 0, "sent": 0, "failed": 0, "retried": 0, "dropped": 0,
+                  "spilled": 0, "replayed": 0, "spill_pending": 0}
+        rate = {"target_readings_per_sec": 0.0, "effective_readings_per_sec": 0.0,
+                "achieved_readings_per_sec": 0.0, "readings_generated": 0, "readings_shed": 0,
+                "throttle_events": 0}
+        states = {}
+        for shard, stats in self.shard_stats.items():
+            totals["sensors"] += stats["sensors"]
+            totals["readings"] += stats["readings"]
+            for key in ("sent", "failed", "retried", "dropped", "spilled", "replayed", "spill_pending"):
+                totals[key] += stats["kafka"][key]
+            for key in rate:
+                rate[key] += stats["rate"][key]
+            states[f"shard_{shard}"] = stats["rate"]["state"]
+        return {
+            "shards": self.num_shards,
+            "alive": sum(1 for process in self.processes if process.is_alive()),
+            "totals": totals,
+            "rate": {**{key: round(value, 1) for key, value in rate.items()}, "states": states},
+            "per_shard": self.shard_stats
+        }
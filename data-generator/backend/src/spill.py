@@ -0,0 +1,329 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+# What append() does once the log holds max_bytes
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+
+# Record frame: payload length and CRC32, then the payload: schema id, topic
+# length, key length (NO_KEY for none), topic, key and the serialized value
+_FRAME = struct.Struct('<II')
+_PAYLOAD = struct.Struct('<BHH')
+NO_KEY = 0xFFFF
+SEGMENT_SUFFIX = ".log"
+CURSOR_FILE = "cursor"
+DEAD_LETTER_FILE = "dead-letter.log"
+
+SpillRecord = Tuple[str, Optional[str], bytes, int]  # topic, key, value, schema id
+Position = Tuple[int, int, int]  # segment index, byte offset, records before the offset
+
+class Segment:
+    """One append-only segment file and the records it holds"""
+
+    def __init__(self, index: int, path: str, size: int = 0, records: int = 0):
+        self.index = index
+        self.path = path
+        self.size = size
+        self.records = records
+
+def encode_record(topic: str, key: Optional[str], value: bytes, schema_id: int) -> bytes:
+    topic_bytes = topic.encode('utf-8')
+    key_bytes = key.encode('utf-8') if key is not None else b""
+    payload = b"".join((
+        _PAYLOAD.pack(schema_id, len(topic_bytes), NO_KEY if key is None else len(key_bytes)),
+        topic_bytes, key_bytes, value
+    ))
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+def decode_record(data, pos: int) -> Optional[Tuple[SpillRecord, int]]:
+    """The record framed at pos and the offset after it, or None for a torn or corrupt frame"""
+    if pos + _FRAME.size > len(data):
+        return None
+    length, crc = _FRAME.unpack_from(data, pos)
+    start = pos + _FRAME.size
+    payload = bytes(data[start:start + length])
+    if len(payload) != length or length < _PAYLOAD.size or zlib.crc32(payload) != crc:
+        return None
+    schema_id, topic_length, key_length = _PAYLOAD.unpack_from(payload)
+    offset = _PAYLOAD.size
+    topic = payload[offset:offset + topic_length].decode('utf-8')
+    offset += topic_length
+    key = None
+    if key_length != NO_KEY:
+        key = payload[offset:offset + key_length].decode('utf-8')
+        offset += key_length
+    return (topic, key, payload[offset:], schema_id), start + length
+
+def spill_options(directory: str, max_bytes: int, segment_bytes: int, overflow: str,
+                  use_mmap: bool, logs: int = 1) -> Dict[str, Any]:
+    """SpillLog arguments for one of logs logs that together use at most max_bytes"""
+    share = max_bytes // logs
+    return {
+        "directory": directory,
+        "max_bytes": share,
+        "segment_bytes": min(segment_bytes, share // 2),
+        "overflow": overflow,
+        "use_mmap": use_mmap
+    }
+
+class SpillLog:
+    """Segmented append-only log on disk for records the producer cannot deliver.
+
+    Records are appended to the newest segment and read back in write order
+    from a cursor that is persisted after each replayed batch; segments behind
+    the cursor are deleted. The log stays active from the first append until
+    replay has drained it, and callers keep appending while it is active so
+    replayed records are never overtaken by live sends. Disk usage is capped at
+    max_bytes: drop_oldest deletes the oldest segment to make room, drop_newest
+    refuses the new record. Records replay can never deliver are set aside
+    in a dead-letter file of at most one segment, counted as dropped.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1 << 30,
+                 segment_bytes: int = 64 << 20, overflow: str = "drop_oldest",
+                 use_mmap: bool = False):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown spill overflow policy: {overflow}")
+        if segment_bytes > max_bytes // 2:
+            raise ValueError("max_bytes must hold at least two segments")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.overflow = overflow
+        self.use_mmap = use_mmap
+        self.logger = logging.getLogger(__name__)
+
+        # Shared by the appending event loop and the replaying thread
+        self.lock = threading.Lock()
+        self.segments: List[Segment] = []
+        self.cursor: Position = (0, 0, 0)
+        self.active = False
+        self.appended = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        self._dead_letter_bytes = 0
+        self._writer = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _segment_path(self, index: int) -> str:
+        return os.path.join(self.directory, f"{index:020d}{SEGMENT_SUFFIX}")
+
+    def _load(self):
+        """Recover segments and the cursor left by a previous run, truncating torn tails"""
+        indices = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+        dead_letter = os.path.join(self.directory, DEAD_LETTER_FILE)
+        if os.path.exists(dead_letter):
+            self._dead_letter_bytes = os.path.getsize(dead_letter)
+        cursor_index, cursor_offset = self._read_cursor()
+        cursor_records = 0
+        for index in indices:
+            path = self._segment_path(index)
+            if index < cursor_index:
+                os.remove(path)
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            pos = records = 0
+            while True:
+                if index == cursor_index and pos == cursor_offset:
+                    cursor_records = records
+                decoded = decode_record(data, pos)
+                if decoded is None:
+                    break
+                pos = decoded[1]
+                records += 1
+            if pos < len(data):
+                self.logger.warning(f"Truncating spill segment {path} at byte {pos} of {len(data)}")
+                with open(path, 'r+b') as f:
+                    f.truncate(pos)
+            self.segments.append(Segment(index, path, pos, records))
+
+        if self.segments and self.segments[0].index == cursor_index and cursor_offset <= self.segments[0].size:
+            self.cursor = (cursor_index, cursor_offset, cursor_records)
+        elif self.segments:
+            self.cursor = (self.segments[0].index, 0, 0)
+        self.active = self._pending_records() > 0
+        if self.active:
+            self.logger.info(f"Recovered {self._pending_records()} spilled records from {self.directory}")
+
+    def _read_cursor(self) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as f:
+                index, offset = f.read().split()
+                return int(index), int(offset)
+        except (OSError, ValueError):
+            return 0, 0
+
+    def _write_cursor(self):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        with open(path + ".tmp", 'w') as f:
+            f.write(f"{self.cursor[0]} {self.cursor[1]}\n")
+        os.replace(path + ".tmp", path)
+
+    def _pending_records(self) -> int:
+        return sum(segment.records for segment in self.segments) - self.cursor[2]
+
+    def _pending_bytes(self) -> int:
+        return sum(segment.size for segment in self.segments) - self.cursor[1]
+
+    def _disk_bytes(self) -> int:
+        return sum(segment.size for segment in self.segments) + self._dead_letter_bytes
+
+    def _rotate(self):
+        if self._writer is not None:
+            self._writer.close()
+        index = self.segments[-1].index + 1 if self.segments else self.cursor[0]
+        segment = Segment(index, self._segment_path(index))
+        self._writer = open(segment.path, 'ab')
+        self.segments.append(segment)
+
+    def _drop_oldest_segment(self):
+        segment = self.segments.pop(0)
+        lost = segment.records - (self.cursor[2] if self.cursor[0] == segment.index else 0)
+        self.dropped += lost
+        os.remove(segment.path)
+        self.cursor = (self.segments[0].index, 0, 0)
+        self._write_cursor()
+        self.logger.warning(f"Spill log full, dropped {lost} records from segment {segment.index}")
+
+    def append(self, topic: str, key: Optional[str], value: bytes, schema_id: int) -> bool:
+        """Write one serialized record and activate the log; False if the overflow policy refused it"""
+        frame = encode_record(topic, key, value, schema_id)
+        with self.lock:
+            if self._disk_bytes() + len(frame) > self.max_bytes:
+                if self.overflow == "drop_oldest" and len(self.segments) > 1:
+                    self._drop_oldest_segment()
+                if self._disk_bytes() + len(frame) > self.max_bytes:
+                    self.dropped += 1
+                    return False
+            if (self._writer is None or not self.segments
+                    or self.segments[-1].size + len(frame) > self.segment_bytes):
+                self._rotate()
+            self._writer.write(frame)
+            segment = self.segments[-1]
+            segment.size += len(frame)
+            segment.records += 1
+            self.appended += 1
+            self.active = True
+            return True
+
+    def flush(self):
+        """Hand buffered appends to the OS"""
+        with self.lock:
+            if self._writer is not None:
+                self._writer.flush()
+
+    def read(self, max_records: int) -> Tuple[List[SpillRecord], Position]:
+        """Up to max_records from the cursor on, and the position to commit once they are delivered"""
+        records: List[SpillRecord] = []
+        with self.lock:
+            if self._writer is not None:
+                self._writer.flush()
+            index, offset, before = self.cursor
+            for segment in self.segments:
+                if segment.index < index:
+                    continue
+                if segment.index > index:
+                    index, offset, before = segment.index, 0, 0
+                if offset >= segment.size:
+                    continue
+                with open(segment.path, 'rb') as f:
+                    if self.use_mmap:
+                        data = mmap.mmap(f.fileno(), segment.size, access=mmap.ACCESS_READ)
+                        pos = offset
+                    else:
+                        f.seek(offset)
+                        data = f.read(segment.size - offset)
+                        pos = 0
+                    try:
+                        while len(records) < max_records:
+                            decoded = decode_record(data, pos)
+                            if decoded is None:
+                                break
+                            record, pos = decoded
+                            records.append(record)
+                            before += 1
+                    finally:
+                        if self.use_mmap:
+                            data.close()
+                offset = pos if self.use_mmap else offset + pos
+                if len(records) >= max_records:
+                    break
+                if offset < segment.size:
+                    # Unreadable tail; skip the rest of the segment rather than stall replay
+                    self.logger.error(f"Corrupt spill record in {segment.path} at byte {offset}, skipping segment")
+                    self.dropped += segment.records - before
+                    before = segment.records
+                    offset = segment.size
+        return records, (index, offset, before)
+
+    def dead_letter(self, records: List[SpillRecord]):
+        """Set aside records that can never be delivered, keeping them on disk while they fit"""
+        data = b"".join(encode_record(*record) for record in records)
+        with self.lock:
+            self.dropped += len(records)
+            self.dead_lettered += len(records)
+            if (self._dead_letter_bytes + len(data) > self.segment_bytes
+                    or self._disk_bytes() + len(data) > self.max_bytes):
+                return
+            with open(os.path.join(self.directory, DEAD_LETTER_FILE), 'ab') as f:
+                f.write(data)
+            self._dead_letter_bytes += len(data)
+
+    def commit(self, position: Position, count: int):
+        """Advance the cursor past records that were delivered or dead-lettered, and
+        delete consumed segments; count is how many of them were delivered"""
+        with self.lock:
+            self.replayed += count
+            if position[:2] > self.cursor[:2]:
+                self.cursor = position
+            # Overflow may have deleted the segment the batch came from
+            while self.segments and self.segments[0].index < self.cursor[0]:
+                os.remove(self.segments.pop(0).path)
+            while (len(self.segments) > 1 and self.segments[0].index == self.cursor[0]
+                   and self.cursor[1] >= self.segments[0].size):
+                os.remove(self.segments.pop(0).path)
+                self.cursor = (self.segments[0].index, 0, 0)
+            if self._pending_records() <= 0:
+                # Drained: start the next outage from an empty segment
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+                next_index = self.segments[-1].index + 1 if self.segments else self.cursor[0]
+                for segment in self.segments:
+                    os.remove(segment.path)
+                self.segments = []
+                self.cursor = (next_index, 0, 0)
+                self.active = False
+            self._write_cursor()
+
+    def close(self):
+        with self.lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "active": self.active,
+                "pending_records": self._pending_records(),
+                "pending_bytes": self._pending_bytes(),
+                "disk_bytes": self._disk_bytes(),
+                "segments": len(self.segments),
+                "appended": self.appended,
+                "replayed": self.replayed,
+                "dropped": self.dropped,
+                "dead_lettered": self.dead_lettered,
+                "overflow": self.overflow
+            }
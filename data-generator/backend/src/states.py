@@ -0,0 +1,86 @@
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+State = Optional[Dict[str, Any]]
+
+class StateLog:
+    """Monotonically versioned log of sensor anomaly state changes.
+
+    The current states hold only sensors with an active anomaly; a sensor that
+    is absent has none. Every non-empty batch of changes gets the next version
+    and is kept for a while, so a client that knows version v can catch up with
+    just the changes after v, and falls back to a snapshot once v is too old.
+    """
+
+    def __init__(self, max_versions: int = 1000, max_changes: int = 100_000):
+        self.max_versions = max_versions
+        self.max_changes = max_changes
+        self.version = 0
+        self.states: Dict[str, Dict[str, Any]] = {}
+        self._log: Deque[Tuple[int, Dict[str, State]]] = deque()
+        self._logged_changes = 0
+
+    @property
+    def oldest(self) -> int:
+        """Earliest version a client can resume from without a snapshot"""
+        return self._log[0][0] - 1 if self._log else self.version
+
+    def apply(self, changes: Dict[str, State]) -> int:
+        """Record one batch of changes (None clears a sensor's state) as the next version"""
+        if not changes:
+            return self.version
+        self.version += 1
+        for sensor_id, state in changes.items():
+            if state is None:
+                self.states.pop(sensor_id, None)
+            else:
+                self.states[sensor_id] = state
+        self._log.append((self.version, changes))
+        self._logged_changes += len(changes)
+        while len(self._log) > self.max_versions or (
+            self._logged_changes > self.max_changes and len(self._log) > 1
+        ):
+            self._logged_changes -= len(self._log.popleft()[1])
+        return self.version
+
+    def changes_since(self, version: int) -> Optional[Dict[str, State]]:
+        """Each sensor's latest change after version, or None if the log cannot tell"""
+        if version < self.oldest or version > self.version:
+            return None
+        newer = []
+        for logged_version, changes in reversed(self._log):
+            if logged_version <= version:
+                break
+            newer.append(changes)
+        merged: Dict[str, State] = {}
+        for changes in reversed(newer):
+            merged.update(changes)
+        return merged
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "type": "sensor_states",
+            "version": self.version,
+            "data": dict(self.states)
+        }
+
+    def message_since(self, version: Optional[int]) -> Dict[str, Any]:
+        """Changes that bring a client from version to the current one, or a snapshot"""
+        changes = None if version is None else self.changes_since(version)
+        if changes is None:
+            return self.snapshot()
+        return {
+            "type": "sensor_state_changes",
+            "from_version": version,
+            "version": self.version,
+            "changes": changes
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "oldest_resumable_version": self.oldest,
+            "active_anomalies": len(self.states),
+            "logged_versions": len(self._log),
+            "logged_changes": self._logged_changes
+        }
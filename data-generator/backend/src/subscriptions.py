@@ -0,0 +1,158 @@
+import json
+import struct
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from generator import SensorBatch, sensor_number
+
+# Reading fields a client can subscribe to; bit i of the binary field mask is READING_FIELDS[i]
+READING_FIELDS = ("temperature", "vibration", "pressure",
+                  "operational_state", "maintenance_needed", "is_test")
+FLOAT_FIELDS = ("temperature", "vibration", "pressure")
+FORMATS = ("json", "binary")
+
+# Binary frame: a 20-byte header (version, field mask, reserved, timestamp,
+# sensor count, ID byte length), the sensor IDs as newline-joined UTF-8 padded
+# to a multiple of 4 bytes, then one column per subscribed field in
+# READING_FIELDS order: float32 for measurements, uint8 for flags
+# (operational_state is 1 for anomaly). Everything is little-endian, so the
+# columns map onto typed arrays as-is.
+BINARY_VERSION = 1
+_HEADER = struct.Struct('<BBHdII')  # version, field mask, reserved, timestamp, count, ID bytes
+
+class Subscription:
+    """What one WebSocket client wants from each tick's readings"""
+
+    def __init__(self, sensor_ids: Optional[List[str]] = None,
+                 sensor_range: Optional[Tuple[int, int]] = None,
+                 fields: Tuple[str, ...] = READING_FIELDS,
+                 max_rate_hz: Optional[float] = None,
+                 value_format: str = "json", states: bool = False,
+                 states_since: Optional[int] = None):
+        self.sensor_ids = sensor_ids
+        self.sensor_range = sensor_range
+        self.fields = fields
+        self.max_rate_hz = max_rate_hz
+        self.min_interval = 1.0 / max_rate_hz if max_rate_hz else 0.0
+        self.value_format = value_format
+        self.states = states
+        self.states_since = states_since
+
+        # Clients with equal keys share one encoded frame per tick
+        self.key = (tuple(sensor_ids) if sensor_ids is not None else None,
+                    sensor_range, fields, value_format)
+
+        numbers = [sensor_number(sensor_id) for sensor_id in sensor_ids or ()]
+        self._numbers = np.array([n for n in numbers if n is not None], dtype=np.int64)
+        self._named = {sensor_id for sensor_id, n in zip(sensor_ids or (), numbers) if n is None}
+
+    @classmethod
+    def from_message(cls, message: Dict[str, Any]) -> "Subscription":
+        """Validate a subscribe message; raises ValueError with a client-facing reason"""
+        sensor_ids = message.get("sensor_ids")
+        if sensor_ids is not None and (
+            not isinstance(sensor_ids, list) or not all(isinstance(s, str) for s in sensor_ids)
+        ):
+            raise ValueError("sensor_ids must be a list of strings")
+        sensor_range = message.get("sensor_range")
+        if sensor_range is not None:
+            if (not isinstance(sensor_range, list) or len(sensor_range) != 2
+                    or not all(isinstance(i, int) for i in sensor_range)):
+                raise ValueError("sensor_range must be [start, end]")
+            sensor_range = tuple(sensor_range)
+        fields = message.get("fields") or list(READING_FIELDS)
+        unknown = set(fields) - set(READING_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        max_rate_hz = message.get("max_rate_hz")
+        if max_rate_hz is not None and (not isinstance(max_rate_hz, (int, float)) or max_rate_hz <= 0):
+            raise ValueError("max_rate_hz must be a positive number")
+        value_format = message.get("format", "json")
+        if value_format not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        states_since = message.get("states_since")
+        if states_since is not None and (not isinstance(states_since, int) or states_since < 0):
+            raise ValueError("states_since must be a non-negative version")
+        return cls(
+            sensor_ids=sensor_ids,
+            sensor_range=sensor_range,
+            fields=tuple(field for field in READING_FIELDS if field in fields),
+            max_rate_hz=max_rate_hz,
+            value_format=value_format,
+            states=bool(message.get("states", False)),
+            states_since=states_since
+        )
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "sensor_ids": self.sensor_ids,
+            "sensor_range": list(self.sensor_range) if self.sensor_range else None,
+            "fields": list(self.fields),
+            "max_rate_hz": self.max_rate_hz,
+            "format": self.value_format,
+            "states": self.states
+        }
+
+    def select(self, batch: SensorBatch) -> Optional[np.ndarray]:
+        """Indices of the subscribed sensors in a batch, or None for all of them"""
+        if self.sensor_ids is None and self.sensor_range is None:
+            return None
+        numbers = batch.numbers
+        if numbers is None:
+            parsed = (sensor_number(sensor_id) for sensor_id in batch.sensor_ids)
+            numbers = np.array([-1 if n is None else n for n in parsed], dtype=np.int64)
+        mask = np.zeros(len(batch), dtype=bool)
+        if self.sensor_range is not None:
+            start, end = self.sensor_range
+            mask |= (numbers >= start) & (numbers < end)
+        if len(self._numbers):
+            mask |= np.isin(numbers, self._numbers)
+        if self._named:
+            for i in np.flatnonzero(numbers < 0).tolist():
+                if batch.sensor_ids[i] in self._named:
+                    mask[i] = True
+        return np.flatnonzero(mask)
+
+    def encode(self, batch: SensorBatch, indices: Optional[np.ndarray]) -> Union[str, bytes, None]:
+        """One frame with the subscribed sensors and fields, or None if none are in the batch"""
+        if indices is None:
+            sensor_ids = batch.sensor_ids
+            columns = {field: _column(batch, field) for field in self.fields}
+        else:
+            if not len(indices):
+                return None
+            all_ids = batch.sensor_ids
+            sensor_ids = [all_ids[i] for i in indices.tolist()]
+            columns = {field: _column(batch, field)[indices] for field in self.fields}
+        if not sensor_ids:
+            return None
+        if self.value_format == "binary":
+            return encode_binary(batch.timestamp, sensor_ids, columns)
+        return encode_json(batch.timestamp, sensor_ids, columns)
+
+def _column(batch: SensorBatch, field: str) -> np.ndarray:
+    return batch.anomaly if field == "operational_state" else getattr(batch, field)
+
+def encode_json(timestamp: float, sensor_ids: List[str], columns: Dict[str, np.ndarray]) -> str:
+    frame: Dict[str, Any] = {"type": "sensor_batch", "timestamp": timestamp, "sensor_ids": sensor_ids}
+    for field, column in columns.items():
+        if field == "operational_state":
+            frame[field] = ["anomaly" if anomaly else "normal" for anomaly in column.tolist()]
+        else:
+            frame[field] = column.tolist()
+    return json.dumps(frame, separators=(',', ':'))
+
+def encode_binary(timestamp: float, sensor_ids: List[str], columns: Dict[str, np.ndarray]) -> bytes:
+    ids = "\n".join(sensor_ids).encode('utf-8')
+    ids += b"\0" * (-len(ids) % 4)
+    mask = 0
+    parts = []
+    for bit, field in enumerate(READING_FIELDS):
+        if field not in columns:
+            continue
+        mask |= 1 << bit
+        dtype = '<f4' if field in FLOAT_FIELDS else 'u1'
+        parts.append(columns[field].astype(dtype).tobytes())
+    header = _HEADER.pack(BINARY_VERSION, mask, 0, timestamp, len(sensor_ids), len(ids))
+    return b"".join((header, ids, *parts))
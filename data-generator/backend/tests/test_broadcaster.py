@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+import pytest
+
+from broadcaster import COALESCE, DISCONNECT, DROP_OLDEST, Broadcaster
+from states import StateLog
+
+class FakeWebSocket:
+    """Records sent frames; while blocked, the first send waits until released"""
+
+    def __init__(self, blocked: bool = False):
+        self.frames = []
+        self.released = asyncio.Event()
+        if not blocked:
+            self.released.set()
+        self.closed_with = None
+
+    async def send_text(self, frame: str):
+        await self.released.wait()
+        self.frames.append(json.loads(frame)["n"])
+
+    async def send_bytes(self, frame: bytes):
+        await self.released.wait()
+        self.frames.append(frame)
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+async def run_slow_client(policy: str, frames: int = 10, max_queue: int = 3):
+    """One fast and one stalled client; the stalled one is released after frames broadcasts"""
+    broadcaster = Broadcaster(max_queue=max_queue, policy=policy)
+    fast, slow = FakeWebSocket(), FakeWebSocket(blocked=True)
+    broadcaster.register(fast)
+    slow_client = broadcaster.register(slow)
+    await settle()
+    for n in range(frames):
+        broadcaster.broadcast({"n": n})
+        await settle()
+        assert len(slow_client.queue) <= max_queue
+    queued = [json.loads(frame)["n"] for _, frame, _ in slow_client.queue]
+    slow.released.set()
+    await settle()
+    return broadcaster, fast, slow, slow_client, queued
+
+@pytest.mark.parametrize("policy", [DROP_OLDEST, COALESCE, DISCONNECT])
+def test_fast_client_is_unaffected_by_a_slow_one(policy):
+    _, fast, *_ = asyncio.run(run_slow_client(policy))
+    assert fast.frames == list(range(10))
+
+def test_drop_oldest_keeps_the_newest_frames():
+    broadcaster, _, slow, client, queued = asyncio.run(run_slow_client(DROP_OLDEST))
+    # Frame 0 was already being sent when the client stalled
+    assert queued == [7, 8, 9]
+    assert slow.frames == [0, 7, 8, 9]
+    assert client.dropped == broadcaster.frames_dropped == 6
+
+def test_coalesce_collapses_the_queue_into_the_latest_frame():
+    # Frames 1-3 fill the queue; frame 4 replaces them all
+    broadcaster, _, slow, client, queued = asyncio.run(run_slow_client(COALESCE, frames=5))
+    assert queued == [4]
+    assert slow.frames == [0, 4]
+    assert client.dropped == broadcaster.frames_dropped == 3
+
+    # Refilled after the collapse, then collapsed again by frame 7
+    _, _, slow, client, queued = asyncio.run(run_slow_client(COALESCE))
+    assert queued == [7, 8, 9]
+    assert slow.frames == [0, 7, 8, 9]
+    assert client.dropped == 6
+
+def test_disconnect_evicts_an_overflowing_client():
+    broadcaster, _, slow, client, _ = asyncio.run(run_slow_client(DISCONNECT))
+    assert client.evicted and client.client_id not in broadcaster.clients
+    assert broadcaster.disconnected_slow == 1
+    assert slow.closed_with == 1008
+    # Nothing queued after the eviction is sent
+    assert slow.frames == [0]
+
+def test_dropped_states_frame_forces_a_snapshot():
+    async def scenario():
+        broadcaster = Broadcaster(max_queue=2, policy=DROP_OLDEST)
+        client = broadcaster.register(FakeWebSocket(blocked=True))
+        await settle()
+        log = StateLog()
+        log.apply({"sensor_1": {"anomaly_active": True, "anomaly_type": "temperature_spike"}})
+        broadcaster.broadcast_states(log, [client])
+        assert client.state_version == log.version
+        for n in range(3):
+            broadcaster.broadcast({"n": n})
+        return client
+
+    client = asyncio.run(scenario())
+    assert client.state_version is None
@@ -0,0 +1,85 @@
+import numpy as np
+
+from generator import IndustrialSensorGenerator, SensorConfig, SensorFleet
+from kafka_utils import AvroReadingSerializer, JsonSerializer
+
+def make_generator() -> IndustrialSensorGenerator:
+    return IndustrialSensorGenerator(clock=lambda: 1_700_000_000.0, seed=7)
+
+def assert_consistent(fleet: SensorFleet):
+    """Every live slot is reachable from its ID and no stale mapping remains"""
+    ids = fleet.ids()
+    assert len(ids) == fleet.size == len(set(ids))
+    for slot, sensor_id in enumerate(ids):
+        assert fleet.slot(sensor_id) == slot
+    mapped = np.flatnonzero(fleet.number_slot >= 0)
+    assert sorted(mapped.tolist()) == sorted(n for n in fleet.number[:fleet.size].tolist() if n >= 0)
+
+def test_generate_reading_round_trips_through_json():
+    generator = make_generator()
+    generator.add_sensor("test_sensor_0", is_test=True)
+    generator.add_sensor("sensor_3")
+    generator.inject_anomaly("sensor_3", "temperature_spike")
+    for sensor_id, is_test in (("test_sensor_0", True), ("sensor_3", False)):
+        reading = generator.generate_reading(sensor_id, is_test=is_test)
+        reading["produced_at"] = 1_700_000_000.5
+        serializer = JsonSerializer()
+        assert serializer.deserialize(serializer.serialize(reading)) == reading
+        assert all(type(value) in (str, int, float, bool) for value in reading.values())
+
+def test_generate_reading_round_trips_through_avro():
+    generator = make_generator()
+    generator.add_sensor("sensor_1")
+    reading = generator.generate_reading("sensor_1")
+    reading["produced_at"] = 1_700_000_000.5
+    serializer = AvroReadingSerializer()
+    assert serializer.deserialize(serializer.serialize(reading)) == reading
+
+def test_batch_rows_round_trip_through_json():
+    generator = make_generator()
+    generator.resize_range(range(5))
+    serializer = JsonSerializer()
+    for reading in generator.generate_batch().rows():
+        assert serializer.deserialize(serializer.serialize(reading)) == reading
+
+def test_resize_range_grows_and_shrinks_by_delta():
+    generator = make_generator()
+    fleet = generator.fleet
+    generator.resize_range(range(100))
+    assert fleet.ids() == [f"sensor_{i}" for i in range(100)]
+    base = float(fleet.base_temperature[fleet.slot("sensor_42")])
+
+    generator.resize_range(range(0, 150, 3))
+    assert fleet.ids()[:34] == [f"sensor_{i}" for i in range(0, 100, 3)]
+    assert set(fleet.ids()) == {f"sensor_{i}" for i in range(0, 150, 3)}
+    assert fleet.slot("sensor_1") is None
+    # Surviving sensors keep their parameters
+    assert float(fleet.base_temperature[fleet.slot("sensor_42")]) == base
+    assert_consistent(fleet)
+
+    generator.resize_range(range(0))
+    assert fleet.size == 0
+    assert_consistent(fleet)
+
+def test_remove_keeps_named_and_numbered_slots_consistent():
+    fleet = SensorFleet(capacity=2)
+    for sensor_id in ("sensor_0", "test_a", "sensor_5", "test_b", "sensor_9"):
+        fleet.add(sensor_id, SensorConfig(70.0, 0.2, 100.0, 0.02, 0.001, 168, 0.0), is_test=sensor_id.startswith("test"))
+    fleet.remove("sensor_0")
+    fleet.remove("test_b")
+    assert set(fleet.ids()) == {"test_a", "sensor_5", "sensor_9"}
+    assert_consistent(fleet)
+
+    fleet.remove_slots(np.array([fleet.slot("sensor_5")]))
+    assert set(fleet.ids()) == {"test_a", "sensor_9"}
+    assert_consistent(fleet)
+
+def test_removing_anomalous_sensor_records_cleared_state():
+    generator = make_generator()
+    generator.resize_range(range(4))
+    generator.inject_anomaly("sensor_2", "pressure_drop")
+    assert generator.drain_state_changes() == {
+        "sensor_2": {"anomaly_active": True, "anomaly_type": "pressure_drop"}
+    }
+    generator.resize_range(range(2))
+    assert generator.drain_state_changes() == {"sensor_2": None}
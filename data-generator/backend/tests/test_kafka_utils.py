@@ -0,0 +1,202 @@
+import asyncio
+import time
+
+import pytest
+from kafka.errors import KafkaConnectionError
+from kafka.future import Future
+from kafka.metrics import Metrics
+from kafka.metrics.stats import Rate
+
+import kafka_utils
+from kafka_utils import KafkaWrapper
+from pipeline import settle_tick
+from rate_control import NORMAL, RateController
+from scheduler import DeadlineScheduler
+
+class FakeFuture(Future):
+    def get(self, timeout=None):
+        if self.failed():
+            raise self.exception
+        return self.value
+
+class FakeProducer:
+    """In-memory KafkaProducer that runs the configured serializers like kafka-python 2.0.2.
+
+    send() passes the key to key_serializer even when it is None, and raises
+    whatever a serializer raises.
+    """
+    available = True
+    # False leaves futures pending, as a slow broker that never acks
+    acks = True
+
+    def __init__(self, value_serializer, key_serializer, **config):
+        if not FakeProducer.available:
+            raise KafkaConnectionError("broker unreachable")
+        self.value_serializer = value_serializer
+        self.key_serializer = key_serializer
+        self.records = []
+        # Registered the way kafka-python's sender does, rate only
+        self._metrics = Metrics()
+        self._metrics.sensor('record-retries').add(
+            self._metrics.metric_name('record-retry-rate', 'producer-metrics'), Rate()
+        )
+
+    def send(self, topic, value=None, key=None, partition=None, headers=None):
+        key_bytes = self.key_serializer(key)
+        value_bytes = self.value_serializer(value)
+        future = FakeFuture()
+        if not FakeProducer.acks:
+            return future
+        if FakeProducer.available:
+            self.records.append((topic, key_bytes, value_bytes))
+            future.success(None)
+        else:
+            future.failure(KafkaConnectionError("broker unreachable"))
+        return future
+
+    def metrics(self):
+        metrics = {}
+        for name, metric in self._metrics.metrics.items():
+            metrics.setdefault(name.group, {})[name.name] = metric.value()
+        return metrics
+
+    def flush(self, timeout=None):
+        pass
+
+@pytest.fixture(autouse=True)
+def fake_producer(monkeypatch):
+    FakeProducer.available = True
+    FakeProducer.acks = True
+    monkeypatch.setattr(kafka_utils, "KafkaProducer", FakeProducer)
+    # Tests drive replay() themselves
+    monkeypatch.setattr(KafkaWrapper, "_replay_forever", lambda self: None)
+
+def reading(seq: int) -> dict:
+    return {
+        "sensor_id": f"sensor_{seq % 3}", "seq": seq, "timestamp": 1_700_000_000.0,
+        "produced_at": 1_700_000_000.0, "temperature": 70.0, "vibration": 0.2,
+        "pressure": 100.0, "operational_state": "normal", "maintenance_needed": False,
+        "is_test": False
+    }
+
+def wrapper(tmp_path, value_format: str = "json") -> KafkaWrapper:
+    return KafkaWrapper("broker:9092", value_format=value_format, spill_options={
+        "directory": str(tmp_path), "max_bytes": 1 << 20, "segment_bytes": 4096
+    })
+
+def test_keyless_send_through_configured_serializers():
+    kafka = KafkaWrapper("broker:9092")
+    assert kafka.send_message("raw-sensor-data", {"type": "startup"}, partition=0)
+    assert kafka.send_async("raw-sensor-data", reading(1), key="sensor_1")
+    assert [key for _, key, _ in kafka.producer.records] == [None, b"sensor_1"]
+    assert kafka.get_stats()["sent"] == 2
+
+def test_outage_spills_then_replays_in_order(tmp_path):
+    FakeProducer.available = False
+    kafka = wrapper(tmp_path, "avro")
+    for seq in range(20):
+        assert kafka.send_async("raw-sensor-data", reading(seq), key=f"sensor_{seq % 3}")
+    assert kafka.producer is None and kafka.spill.active
+
+    assert kafka.replay() == 0  # Still down: nothing committed, backing off
+    assert kafka.get_stats()["spill_pending"] == 20
+
+    FakeProducer.available = True
+    kafka._reconnect_at = 0.0
+    assert kafka.replay() == 20
+    assert not kafka.spill.active
+    serializer = kafka_utils.AvroReadingSerializer()
+    replayed = [serializer.deserialize(value)["seq"] for _, _, value in kafka.producer.records]
+    assert replayed == list(range(20))
+    assert kafka.get_stats()["replayed"] == 20
+
+def test_replay_dead_letters_records_that_cannot_be_sent(tmp_path):
+    FakeProducer.available = False
+    # Spilled as JSON (a keyless startup message and a reading) by an earlier run
+    with_json = wrapper(tmp_path, "json")
+    with_json.send_message("raw-sensor-data", {"type": "startup"})
+    with_json.send_async("raw-sensor-data", reading(1), key="sensor_1")
+    with_json.spill.append("raw-sensor-data", "sensor_2", b"\xff not a reading", 0)
+    with_json.spill.close()
+
+    # Replayed by a run that produces Avro: the startup message has no Avro
+    # encoding and the garbage record does not decode
+    FakeProducer.available = True
+    kafka = wrapper(tmp_path, "avro")
+    assert kafka.spill.active
+    assert kafka.replay() == 3
+    assert not kafka.spill.active
+    assert len(kafka.producer.records) == 1
+    stats = kafka.get_stats()
+    assert stats["replayed"] == 1
+    assert stats["spill_dropped"] == 2
+    assert stats["spill_pending"] == 0
+    assert kafka.spill.get_stats()["dead_lettered"] == 2
+
+    # Live sends go straight to the producer again
+    assert kafka.send_async("raw-sensor-data", reading(2), key="sensor_2")
+    assert len(kafka.producer.records) == 2
+
+def test_saturated_producer_drops_at_cap_and_throttles(tmp_path):
+    FakeProducer.acks = False
+    kafka = KafkaWrapper("broker:9092", max_in_flight=10, spill_options={
+        "directory": str(tmp_path), "max_bytes": 1 << 20, "segment_bytes": 4096
+    })
+    assert kafka.connect()
+    accepted = [kafka.send_async("raw-sensor-data", reading(seq), key=f"sensor_{seq % 3}")
+                for seq in range(15)]
+    assert accepted.count(True) == 10
+    # A slow broker is not an outage: nothing goes to disk
+    stats = kafka.get_stats()
+    assert stats["dropped"] == 5 and stats["spilled"] == 0
+    assert not kafka.spill.active
+
+    controller = RateController()
+    scheduler = DeadlineScheduler(frequency_hz=10.0)
+    asyncio.run(settle_tick(kafka, scheduler, controller))
+    assert controller.state != NORMAL
+    assert scheduler.rate_scale < 1.0
+
+def test_spill_backlog_throttles_until_drained(tmp_path):
+    FakeProducer.available = False
+    kafka = wrapper(tmp_path)
+    for seq in range(5):
+        kafka.send_async("raw-sensor-data", reading(seq), key=f"sensor_{seq % 3}")
+    assert kafka.in_flight == 0 and kafka.spill.active
+
+    controller = RateController(interval=0.0)
+    scheduler = DeadlineScheduler()
+    asyncio.run(settle_tick(kafka, scheduler, controller))
+    assert controller.pressure >= controller.high_watermark
+    assert scheduler.rate_scale < 1.0
+
+    FakeProducer.available = True
+    kafka._reconnect_at = 0.0
+    kafka.replay()
+    asyncio.run(settle_tick(kafka, scheduler, controller))
+    assert controller.pressure == 0.0
+
+def test_retried_counts_producer_retries_across_reconnects():
+    kafka = KafkaWrapper("broker:9092")
+    kafka.connect()
+    kafka.producer._metrics.get_sensor('record-retries').record(3)
+    assert kafka.get_stats()["retried"] == 3
+    kafka.connect()
+    kafka.producer._metrics.get_sensor('record-retries').record(2)
+    assert kafka.get_stats()["retried"] == 5
+
+def test_send_without_producer_drops_and_reconnects_in_background():
+    FakeProducer.available = False
+    kafka = KafkaWrapper("broker:9092")
+    started = time.monotonic()
+    assert not kafka.send_async("raw-sensor-data", reading(1), key="sensor_1")
+    assert not kafka.send_async("raw-sensor-data", reading(2), key="sensor_2")
+    assert time.monotonic() - started < 0.5
+    assert kafka.get_stats()["dropped"] == 2
+
+    FakeProducer.available = True
+    kafka._reconnect_at = 0.0
+    deadline = time.monotonic() + 5
+    while kafka.producer is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert kafka.send_async("raw-sensor-data", reading(3), key="sensor_3")
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+import scheduler as scheduler_module
+from scheduler import DEFAULT_GROUP, DeadlineScheduler, apply_groups, group_rates
+from sharding import ShardPool
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler_module, "monotonic", clock)
+    return clock
+
+def due_at(scheduler: DeadlineScheduler, clock: Clock, now: float):
+    """Names of the groups due at now; the clock is past a deadline, so nothing sleeps"""
+    clock.now = now
+    return [group.name for group in asyncio.run(scheduler.next_due())]
+
+def nothing_due(scheduler: DeadlineScheduler) -> bool:
+    async def wait():
+        try:
+            await asyncio.wait_for(scheduler.next_due(), 0.01)
+        except asyncio.TimeoutError:
+            return True
+        return False
+    return asyncio.run(wait())
+
+def test_groups_fire_in_deadline_order(clock):
+    scheduler = DeadlineScheduler(frequency_hz=10.0)
+    scheduler.set_group("slow", 4.0)
+    assert due_at(scheduler, clock, 0.0) == [DEFAULT_GROUP, "slow"]
+    assert due_at(scheduler, clock, 0.1) == [DEFAULT_GROUP]
+    assert due_at(scheduler, clock, 0.26) == [DEFAULT_GROUP, "slow"]
+    assert scheduler.groups[DEFAULT_GROUP].deadline == pytest.approx(0.3)
+    assert scheduler.groups["slow"].deadline == pytest.approx(0.5)
+    assert scheduler.groups["slow"].last_lag == pytest.approx(0.01)
+
+def test_stall_counts_missed_ticks_instead_of_bursting(clock):
+    scheduler = DeadlineScheduler(frequency_hz=10.0)
+    due_at(scheduler, clock, 0.0)
+    assert due_at(scheduler, clock, 1.05) == [DEFAULT_GROUP]
+    group = scheduler.groups[DEFAULT_GROUP]
+    assert group.ticks == 2
+    assert group.missed_ticks == 9
+    # Back on the original grid, not 1.05 + period
+    assert group.deadline == pytest.approx(1.1)
+    clock.now = 1.06
+    assert nothing_due(scheduler)
+
+def test_rerating_takes_effect_immediately_and_skips_stale_deadlines(clock):
+    scheduler = DeadlineScheduler(frequency_hz=10.0)
+    due_at(scheduler, clock, 0.0)
+    clock.now = 0.05
+    scheduler.set_group(DEFAULT_GROUP, 1.0)
+    assert due_at(scheduler, clock, 0.05) == [DEFAULT_GROUP]
+    clock.now = 0.5
+    # The 10 Hz deadline at 0.1 is still on the heap but no longer counts
+    assert nothing_due(scheduler)
+    assert due_at(scheduler, clock, 1.05) == [DEFAULT_GROUP]
+
+def test_rate_scale_stretches_periods(clock):
+    scheduler = DeadlineScheduler(frequency_hz=10.0)
+    scheduler.set_rate_scale(0.5)
+    due_at(scheduler, clock, 0.0)
+    assert scheduler.groups[DEFAULT_GROUP].deadline == pytest.approx(0.2)
+    with pytest.raises(ValueError):
+        scheduler.set_rate_scale(0.0)
+
+class FakeGenerator:
+    def assign_groups(self, by_id, by_range):
+        self.by_id = by_id
+        self.by_range = by_range
+
+def test_apply_groups_replaces_custom_groups_and_matches_shard_pool(clock):
+    scheduler = DeadlineScheduler(frequency_hz=1.0)
+    generator = FakeGenerator()
+    pool = ShardPool(2, {})
+    fast = {"name": "fast", "frequency_hz": 5.0, "sensor_ids": ["sensor_1"]}
+    ranged = {"name": "ranged", "frequency_hz": 2.0, "sensor_range": (10, 20)}
+
+    steps = [
+        (1.0, [fast, ranged], {DEFAULT_GROUP: 1.0, "fast": 5.0, "ranged": 2.0}),
+        # None keeps the custom groups and only re-rates the default one
+        (3.0, None, {DEFAULT_GROUP: 3.0, "fast": 5.0, "ranged": 2.0}),
+        # Groups left out of a new list are removed
+        (3.0, [{**fast, "frequency_hz": 8.0}], {DEFAULT_GROUP: 3.0, "fast": 8.0}),
+        (2.0, [], {DEFAULT_GROUP: 2.0}),
+    ]
+    for frequency_hz, groups, expected in steps:
+        assert apply_groups(scheduler, generator, frequency_hz, groups) == expected
+        assert {name: group.frequency_hz for name, group in scheduler.groups.items()} == expected
+        assert pool.configure(100, frequency_hz, groups) == expected
+
+        custom = [group for group in scheduler.groups.values() if group.name != DEFAULT_GROUP]
+        assert generator.by_id == {s: g.index for g in custom for s in g.sensor_ids}
+        assert generator.by_range == [(*g.sensor_range, g.index) for g in custom if g.sensor_range]
+
+def test_group_rates_cannot_drop_the_default_group():
+    assert group_rates({DEFAULT_GROUP: 1.0, "a": 2.0}, 4.0, []) == {DEFAULT_GROUP: 4.0}
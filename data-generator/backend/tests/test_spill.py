@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from spill import DEAD_LETTER_FILE, SpillLog, spill_options
+
+def fill(log: SpillLog, count: int, start: int = 0, topic: str = "raw-sensor-data"):
+    for i in range(start, start + count):
+        assert log.append(topic, f"sensor_{i % 7}", f'{{"seq": {i}}}'.encode(), 0)
+
+def seqs(records):
+    return [int(value[8:-1]) for _, _, value, _ in records]
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_reads_in_order_across_segments_and_drains(tmp_path, use_mmap):
+    log = SpillLog(str(tmp_path), max_bytes=1 << 20, segment_bytes=1024, use_mmap=use_mmap)
+    assert not log.active
+    fill(log, 200)
+    assert log.active and len(log.segments) > 1
+
+    delivered = []
+    while log.active:
+        records, position = log.read(37)
+        delivered += seqs(records)
+        log.commit(position, len(records))
+    assert delivered == list(range(200))
+    assert log.get_stats()["pending_records"] == 0
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".log")] == []
+
+def test_keyless_records_round_trip(tmp_path):
+    log = SpillLog(str(tmp_path), max_bytes=1 << 20, segment_bytes=1024)
+    log.append("raw-sensor-data", None, b"{}", 0)
+    records, _ = log.read(10)
+    assert records == [("raw-sensor-data", None, b"{}", 0)]
+
+def test_recovers_cursor_and_truncates_torn_tail(tmp_path):
+    log = SpillLog(str(tmp_path), max_bytes=1 << 20, segment_bytes=1024)
+    fill(log, 50)
+    records, position = log.read(20)
+    log.commit(position, len(records))
+    log.close()
+    with open(log.segments[-1].path, "ab") as f:
+        f.write(b"\x40\x00\x00\x00torn")
+
+    recovered = SpillLog(str(tmp_path), max_bytes=1 << 20, segment_bytes=1024)
+    assert recovered.active
+    assert recovered.get_stats()["pending_records"] == 30
+    records, _ = recovered.read(100)
+    assert seqs(records) == list(range(20, 50))
+    # New appends go after the recovered records, not into the torn tail
+    fill(recovered, 1, start=50)
+    records, _ = recovered.read(100)
+    assert seqs(records) == list(range(20, 51))
+
+def test_drop_oldest_bounds_disk_and_counts_lost_records(tmp_path):
+    log = SpillLog(str(tmp_path), max_bytes=4096, segment_bytes=1024, overflow="drop_oldest")
+    fill(log, 500)
+    stats = log.get_stats()
+    assert stats["disk_bytes"] <= 4096
+    assert stats["dropped"] + stats["pending_records"] == 500
+    records, _ = log.read(1000)
+    # The newest records survive, still in order
+    assert seqs(records) == list(range(500 - len(records), 500))
+
+def test_drop_newest_refuses_records_once_full(tmp_path):
+    log = SpillLog(str(tmp_path), max_bytes=4096, segment_bytes=1024, overflow="drop_newest")
+    accepted = sum(log.append("t", "k", b"x" * 40, 0) for _ in range(500))
+    stats = log.get_stats()
+    assert stats["disk_bytes"] <= 4096
+    assert stats["dropped"] == 500 - accepted
+    records, _ = log.read(1000)
+    assert len(records) == accepted
+
+def test_dead_letter_is_counted_and_capped(tmp_path):
+    log = SpillLog(str(tmp_path), max_bytes=4096, segment_bytes=1024)
+    log.dead_letter([("t", None, b"x" * 100, 0)] * 3)
+    log.dead_letter([("t", None, b"x" * 1000, 0)])  # Over the one-segment cap: counted, not kept
+    stats = log.get_stats()
+    assert stats["dropped"] == stats["dead_lettered"] == 4
+    assert os.path.getsize(tmp_path / DEAD_LETTER_FILE) < 1024
+    assert stats["disk_bytes"] == os.path.getsize(tmp_path / DEAD_LETTER_FILE)
+
+def test_spill_options_split_the_budget():
+    options = spill_options("/spill", 1 << 30, 64 << 20, "drop_oldest", False, logs=5)
+    assert options["max_bytes"] * 5 <= 1 << 30
+    assert options["segment_bytes"] <= options["max_bytes"] // 2
@@ -0,0 +1,113 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from generator import SensorBatch
+from states import StateLog
+from subscriptions import BINARY_VERSION, READING_FIELDS, Subscription
+
+def make_batch(with_numbers: bool = True) -> SensorBatch:
+    sensor_ids = ["sensor_0", "sensor_3", "sensor_7", "test_a", "sensor_12"]
+    count = len(sensor_ids)
+    return SensorBatch(
+        sensor_ids, 1_700_000_000.25,
+        temperature=np.arange(count, dtype=np.float64) + 70.5,
+        vibration=np.full(count, 0.25),
+        pressure=np.arange(count, dtype=np.float64) + 100.0,
+        anomaly=np.array([False, True, False, False, True]),
+        maintenance_needed=np.array([False, False, True, False, False]),
+        is_test=np.array([False, False, False, True, False]),
+        numbers=np.array([0, 3, 7, -1, 12]) if with_numbers else None
+    )
+
+@pytest.mark.parametrize("with_numbers", [True, False])
+def test_select_matches_ids_ranges_and_named_sensors(with_numbers):
+    batch = make_batch(with_numbers)
+    assert Subscription().select(batch) is None
+    assert Subscription(sensor_range=(3, 10)).select(batch).tolist() == [1, 2]
+    assert Subscription(sensor_ids=["sensor_12", "test_a", "sensor_99"]).select(batch).tolist() == [3, 4]
+    both = Subscription(sensor_ids=["sensor_0"], sensor_range=(7, 8))
+    assert both.select(batch).tolist() == [0, 2]
+    nothing = Subscription(sensor_ids=["sensor_5"])
+    assert nothing.select(batch).tolist() == []
+    assert nothing.encode(batch, nothing.select(batch)) is None
+
+def test_json_frame_holds_only_subscribed_fields():
+    batch = make_batch()
+    subscription = Subscription(sensor_range=(3, 8), fields=("temperature", "operational_state"))
+    frame = json.loads(subscription.encode(batch, subscription.select(batch)))
+    assert frame == {
+        "type": "sensor_batch", "timestamp": 1_700_000_000.25,
+        "sensor_ids": ["sensor_3", "sensor_7"],
+        "temperature": [71.5, 72.5],
+        "operational_state": ["anomaly", "normal"]
+    }
+
+def test_binary_frame_layout():
+    batch = make_batch()
+    fields = ("temperature", "pressure", "maintenance_needed")
+    subscription = Subscription(sensor_ids=["sensor_0", "sensor_7"], fields=fields, value_format="binary")
+    frame = subscription.encode(batch, subscription.select(batch))
+
+    version, mask, reserved, timestamp, count, id_bytes = struct.unpack_from('<BBHdII', frame)
+    assert (version, reserved, timestamp, count) == (BINARY_VERSION, 0, 1_700_000_000.25, 2)
+    assert mask == sum(1 << READING_FIELDS.index(field) for field in fields)
+    ids = frame[20:20 + id_bytes]
+    assert id_bytes % 4 == 0
+    assert ids.rstrip(b"\0").decode().split("\n") == ["sensor_0", "sensor_7"]
+
+    pos = 20 + id_bytes
+    temperature = np.frombuffer(frame, '<f4', 2, pos)
+    pressure = np.frombuffer(frame, '<f4', 2, pos + 8)
+    maintenance = np.frombuffer(frame, 'u1', 2, pos + 16)
+    assert temperature.tolist() == [70.5, 72.5]
+    assert pressure.tolist() == [100.0, 102.0]
+    assert maintenance.tolist() == [0, 1]
+    assert len(frame) == pos + 18
+
+def test_from_message_rejects_bad_subscriptions():
+    for message in ({"sensor_ids": "sensor_1"}, {"sensor_range": [1]}, {"fields": ["humidity"]},
+                    {"max_rate_hz": 0}, {"format": "xml"}, {"states_since": -1}):
+        with pytest.raises(ValueError):
+            Subscription.from_message(message)
+    subscription = Subscription.from_message({"fields": ["pressure", "temperature"], "max_rate_hz": 4})
+    # Fields are kept in wire order whatever order they were asked in
+    assert subscription.fields == ("temperature", "pressure")
+    assert subscription.min_interval == 0.25
+
+def test_state_log_deltas_carry_each_sensors_latest_change():
+    log = StateLog()
+    spike = {"anomaly_active": True, "anomaly_type": "temperature_spike"}
+    drop = {"anomaly_active": True, "anomaly_type": "pressure_drop"}
+    assert log.apply({}) == 0
+    assert log.apply({"sensor_1": spike}) == 1
+    assert log.apply({"sensor_2": drop}) == 2
+    assert log.apply({"sensor_1": None}) == 3
+
+    assert log.message_since(1) == {
+        "type": "sensor_state_changes", "from_version": 1, "version": 3,
+        "changes": {"sensor_2": drop, "sensor_1": None}
+    }
+    assert log.message_since(3)["changes"] == {}
+    assert log.message_since(None) == {"type": "sensor_states", "version": 3, "data": {"sensor_2": drop}}
+    # A version from the future (another generator run) cannot be resumed
+    assert log.message_since(7)["type"] == "sensor_states"
+
+def test_state_log_since_older_than_retained_window_forces_snapshot():
+    log = StateLog(max_versions=3)
+    for i in range(6):
+        log.apply({f"sensor_{i}": {"anomaly_active": True, "anomaly_type": "vibration"}})
+    assert log.oldest == 3
+    assert log.message_since(3)["type"] == "sensor_state_changes"
+    snapshot = log.message_since(2)
+    assert snapshot["type"] == "sensor_states" and snapshot["version"] == 6
+    assert len(snapshot["data"]) == 6
+
+    # The change cap trims old versions too, but always keeps the newest one
+    capped = StateLog(max_changes=4)
+    capped.apply({f"sensor_{i}": None for i in range(3)})
+    capped.apply({f"sensor_{i}": None for i in range(3, 6)})
+    assert capped.oldest == 1
+    assert capped.message_since(0)["type"] == "sensor_states"
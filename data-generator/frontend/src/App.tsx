@@ -16,6 +16,18 @@ interface WebSocketMessage {
   data: SensorReading;
 }
 
+// One frame per tick with a column per field, sent once the client subscribes
+interface SensorBatchMessage {
+  type: 'sensor_batch';
+  timestamp: number;
+  sensor_ids: string[];
+  temperature: number[];
+  vibration: number[];
+  pressure: number[];
+  operational_state: string[];
+  maintenance_needed: boolean[];
+}
+
 const App: React.FC = () => {
   const [numSensors, setNumSensors] = useState(3);
   const [frequency, setFrequency] = useState(1);
@@ -29,6 +41,11 @@ const App: React.FC = () => {
     websocket.onopen = () => {
       console.log('Connected to WebSocket');
       setConnected(true);
+      websocket.send(JSON.stringify({
+        type: 'subscribe',
+        fields: ['temperature', 'vibration', 'pressure', 'operational_state', 'maintenance_needed'],
+        max_rate_hz: 4,
+      }));
     };
 
     websocket.onclose = () => {
@@ -37,8 +54,24 @@ const App: React.FC = () => {
     };
 
     websocket.onmessage = (event) => {
-      const message: WebSocketMessage = JSON.parse(event.data);
-      if (message.type === 'sensor_reading') {
+      const message: WebSocketMessage | SensorBatchMessage = JSON.parse(event.data);
+      if (message.type === 'sensor_batch') {
+        setReadings(prev => {
+          const next = { ...prev };
+          message.sensor_ids.forEach((sensorId, i) => {
+            next[sensorId] = {
+              sensor_id: sensorId,
+              temperature: message.temperature[i],
+              vibration: message.vibration[i],
+              pressure: message.pressure[i],
+              operational_state: message.operational_state[i],
+              maintenance_needed: message.maintenance_needed[i],
+              timestamp: message.timestamp,
+            };
+          });
+          return next;
+        });
+      } else if (message.type === 'sensor_reading') {
         setReadings(prev => ({
           ...prev,
           [message.data.sensor_id]: message.data
@@ -14,6 +14,9 @@ cd C:\Users\jacob\Documents\streaming\sensor-analytics\timescaledb
 cd C:\Users\jacob\Documents\streaming\sensor-analytics\data-generator\backend
 ./deploy.ps1
 
+cd C:\Users\jacob\Documents\streaming\sensor-analytics\ingestion
+./deploy.ps1
+
 cd C:\Users\jacob\Documents\streaming\sensor-analytics\data-generator\frontend
 ./deploy.ps1
 
@@ -3,25 +3,65 @@ from pyflink.table import StreamTableEnvironment, EnvironmentSettings
 from pyflink.common.time import Time
 from pyflink.common.watermark_strategy import WatermarkStrategy
 from pyflink.common.serialization import SimpleStringSchema
+from pyflink.common import Row, Types
+from pyflink.datastream.functions import KeyedProcessFunction
+from pyflink.datastream.state import ListStateDescriptor, ValueStateDescriptor
+import numpy as np
 import json
 import logging
+import os
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def create_kafka_source(t_env):
+# Wire format of raw-sensor-data; must match KAFKA_VALUE_FORMAT in the sensor backend
+RAW_SENSOR_FORMAT = os.getenv('RAW_SENSOR_FORMAT', 'json')
+
+# Sliding statistics window; HOP windows are cut into slide-sized slices whose
+# partial aggregates are shared by every window that overlaps them
+SLIDING_WINDOW_SIZE = "INTERVAL '5' MINUTE"
+SLIDING_WINDOW_SLIDE = "INTERVAL '30' SECOND"
+SLIDING_METRICS = ("temperature", "vibration", "pressure")
+
+# One-sided standard normal quantiles. Exact percentiles are not mergeable
+# across slices or local/global phases, so the p95/p99 columns assume the
+# window's readings are normal: mean + z * stddev, capped at the max. They are
+# named *_normal_estimate because skewed or multi-modal windows (spikes, drift,
+# state changes) can be far from that assumption
+PERCENTILE_Z = {"p95_normal_estimate": 1.6449, "p99_normal_estimate": 2.3263}
+
+# Anomaly detector: each sensor's readings are buffered in keyed state and
+# scored in one numpy pass once the buffer fills or its timer fires, against
+# an EWMA baseline kept in keyed state
+DETECTOR_METRICS = ("temperature", "vibration", "pressure")
+DETECTOR_BATCH_SIZE = 100
+DETECTOR_MAX_DELAY_MS = 1000  # processing time a buffered reading waits at most
+DETECTOR_ALPHA = 0.02        # EWMA weight of each new reading
+DETECTOR_WARMUP = 60         # readings before a sensor is scored
+DETECTOR_Z_THRESHOLD = 4.0
+DETECTOR_CLIP = 3.0          # readings are winsorized to mean ± 3σ before updating the baseline
+
+def create_kafka_source(t_env, value_format: str = RAW_SENSOR_FORMAT):
     """Create Kafka source table with sensor data"""
-    return t_env.execute_sql("""
+    if value_format not in ('json', 'avro'):
+        raise ValueError(f"Unsupported raw-sensor-data format: {value_format}")
+
+    # The avro format derives its reader schema from these columns, so they are
+    # declared NOT NULL to match the producer's union-free schema (id 2)
+    not_null = " NOT NULL" if value_format == 'avro' else ""
+    return t_env.execute_sql(f"""
         CREATE TABLE sensor_data (
-            sensor_id STRING,
-            temperature DOUBLE,
-            vibration DOUBLE,
-            pressure DOUBLE,
-            operational_state STRING,
-            maintenance_needed BOOLEAN,
-            is_test BOOLEAN,
-            `timestamp` TIMESTAMP(3),
+            sensor_id STRING{not_null},
+            temperature DOUBLE{not_null},
+            vibration DOUBLE{not_null},
+            pressure DOUBLE{not_null},
+            operational_state STRING{not_null},
+            maintenance_needed BOOLEAN{not_null},
+            is_test BOOLEAN{not_null},
+            `timestamp` TIMESTAMP(3){not_null},
+            seq BIGINT{not_null},
+            produced_at TIMESTAMP(3){not_null},
             WATERMARK FOR `timestamp` AS `timestamp` - INTERVAL '5' SECONDS
         ) WITH (
             'connector' = 'kafka',
@@ -30,7 +70,7 @@ def create_kafka_source(t_env):
             'properties.group.id' = 'flink-sensor-processor',
             'properties.auto.offset.reset' = 'latest',
             'scan.startup.mode' = 'group-offsets',
-            'format' = 'json'
+            'format' = '{value_format}'
         )
     """)
 
@@ -45,7 +85,8 @@ def create_kafka_sinks(t_env):
             avg_temp DOUBLE,
             avg_vibration DOUBLE,
             avg_pressure DOUBLE,
-            alerts_count BIGINT
+            alerts_count BIGINT,
+            last_produced_at TIMESTAMP(3)
         ) WITH (
             'connector' = 'kafka',
             'topic' = 'sensor-stats',
@@ -60,7 +101,8 @@ def create_kafka_sinks(t_env):
             sensor_id STRING,
             anomaly_type STRING,
             severity DOUBLE,
-            detection_time TIMESTAMP(3)
+            detection_time TIMESTAMP(3),
+            produced_at TIMESTAMP(3)
         ) WITH (
             'connector' = 'kafka',
             'topic' = 'sensor-anomalies',
@@ -82,13 +124,176 @@ def create_kafka_sinks(t_env):
             PRIMARY KEY (window_start, window_end, sensor_id) NOT ENFORCED
         ) WITH (
             'connector' = 'jdbc',
-            'url' = 'jdbc:postgresql://timescaledb.timeseriesdb:5432/sensordata',
+            'url' = 'jdbc:postgresql://timescaledb.timeseriesdb:5432/sensordata?reWriteBatchedInserts=true',
             'table-name' = 'sensor_aggregates',
             'username' = 'tsdbadmin',
-            'password' = 'P@ssw0rd'
+            'password' = 'P@ssw0rd',
+            'sink.buffer-flush.max-rows' = '5000',
+            'sink.buffer-flush.interval' = '2s',
+            'sink.max-retries' = '3'
         )
     """)
 
+def create_sliding_stats_sink(t_env):
+    """Create Kafka sink for per-sensor sliding window statistics"""
+    columns = ",\n            ".join(
+        f"{metric}_{stat} DOUBLE"
+        for metric in SLIDING_METRICS
+        for stat in ("min", "max", "avg", "stddev", *PERCENTILE_Z)
+    )
+    t_env.execute_sql(f"""
+        CREATE TABLE sliding_stats_sink (
+            window_start TIMESTAMP(3),
+            window_end TIMESTAMP(3),
+            sensor_id STRING,
+            readings BIGINT,
+            {columns}
+        ) WITH (
+            'connector' = 'kafka',
+            'topic' = 'sensor-stats-sliding',
+            'properties.bootstrap.servers' = 'iot-kafka-brokers.kafka.svc.cluster.local:9092',
+            'format' = 'json'
+        )
+    """)
+
+def sliding_stats_query() -> str:
+    """Sliding window statistics built only from mergeable aggregates"""
+    stats = []
+    for metric in SLIDING_METRICS:
+        stats += [
+            f"MIN({metric}) as {metric}_min",
+            f"MAX({metric}) as {metric}_max",
+            f"AVG({metric}) as {metric}_avg",
+            f"STDDEV_POP({metric}) as {metric}_stddev",
+        ]
+        stats += [
+            f"LEAST(AVG({metric}) + {z} * STDDEV_POP({metric}), MAX({metric})) as {metric}_{name}"
+            for name, z in PERCENTILE_Z.items()
+        ]
+    select = ",\n            ".join(stats)
+    return f"""
+        SELECT
+            window_start,
+            window_end,
+            sensor_id,
+            COUNT(*) as readings,
+            {select}
+        FROM TABLE(
+            HOP(TABLE sensor_data, DESCRIPTOR(`timestamp`), {SLIDING_WINDOW_SLIDE}, {SLIDING_WINDOW_SIZE}))
+        GROUP BY window_start, window_end, sensor_id
+    """
+
+def ewma_prefix(values: np.ndarray, mean: np.ndarray, var: np.ndarray,
+                alpha: float = DETECTOR_ALPHA):
+    """Baseline before each row of values and after the last one.
+
+    Same result as folding the rows in one at a time with
+    delta = x - mean; mean += alpha * delta; var = (1 - alpha) * (var + alpha * delta ** 2),
+    unrolled into cumulative sums so the whole batch is a few array operations.
+    The batch size bounds (1 - alpha) ** -n, which keeps the sums well scaled.
+    """
+    keep = 1 - alpha
+    decay = keep ** np.arange(1, len(values) + 1)[:, None]
+    means = decay * (mean + alpha * np.cumsum(values / decay, axis=0))
+    means_before = np.vstack([mean, means[:-1]])
+    delta = values - means_before
+    variances = decay * (var + alpha * np.cumsum(delta ** 2 * keep / decay, axis=0))
+    vars_before = np.vstack([var, variances[:-1]])
+    return means_before, vars_before, means[-1], variances[-1]
+
+def baseline_std(mean: np.ndarray, var: np.ndarray) -> np.ndarray:
+    # Floor the variance relative to the level so a flat series cannot divide by zero
+    return np.sqrt(np.maximum(var, (1e-3 * np.abs(mean)) ** 2 + 1e-12))
+
+class AnomalyDetector(KeyedProcessFunction):
+    """Robust EWMA z-score detector over each sensor's readings.
+
+    Readings are buffered per sensor until DETECTOR_BATCH_SIZE arrive or a
+    processing-time timer DETECTOR_MAX_DELAY_MS after the first one fires,
+    then scored in one numpy pass: each reading against the baseline (reading
+    count, per-metric mean and variance) as of the reading before it, exactly
+    as a per-record detector would. Readings are winsorized against the
+    baseline at the start of the batch before they are folded in, which keeps a
+    sustained fault from quickly becoming the new normal.
+    """
+
+    def open(self, runtime_context):
+        self.baseline = runtime_context.get_state(ValueStateDescriptor(
+            "baseline", Types.PRIMITIVE_ARRAY(Types.DOUBLE())
+        ))
+        self.pending = runtime_context.get_list_state(ListStateDescriptor(
+            "pending", Types.PICKLED_BYTE_ARRAY()
+        ))
+        self.pending_count = runtime_context.get_state(ValueStateDescriptor("pending_count", Types.INT()))
+        self.flush_at = runtime_context.get_state(ValueStateDescriptor("flush_at", Types.LONG()))
+
+    def process_element(self, value, ctx):
+        self.pending.add(value)
+        count = (self.pending_count.value() or 0) + 1
+        if count >= DETECTOR_BATCH_SIZE:
+            flush_at = self.flush_at.value()
+            if flush_at is not None:
+                ctx.timer_service().delete_processing_time_timer(flush_at)
+            yield from self._score(ctx.get_current_key())
+            return
+        self.pending_count.update(count)
+        if count == 1:
+            flush_at = ctx.timer_service().current_processing_time() + DETECTOR_MAX_DELAY_MS
+            ctx.timer_service().register_processing_time_timer(flush_at)
+            self.flush_at.update(flush_at)
+
+    def on_timer(self, timestamp, ctx):
+        yield from self._score(ctx.get_current_key())
+
+    def _score(self, key):
+        rows = sorted(self.pending.get(), key=lambda row: row[4])
+        self.pending.clear()
+        self.pending_count.clear()
+        self.flush_at.clear()
+        if not rows:
+            return
+        values = np.array([row[1:4] for row in rows], dtype=np.float64)
+        n = len(rows)
+
+        baseline = self.baseline.value()
+        if baseline is None:
+            count, mean, var = 0, values.mean(axis=0), values.var(axis=0)
+        else:
+            count, mean, var = int(baseline[0]), np.array(baseline[1:4]), np.array(baseline[4:7])
+
+        std = baseline_std(mean, var)
+        clipped = np.clip(values, mean - DETECTOR_CLIP * std, mean + DETECTOR_CLIP * std)
+        means_before, vars_before, mean, var = ewma_prefix(clipped, mean, var)
+
+        z = (values - means_before) / baseline_std(means_before, vars_before)
+        worst = np.abs(z).argmax(axis=1)
+        peak = z[np.arange(n), worst]
+        scored = count + np.arange(n) >= DETECTOR_WARMUP
+        for i in np.flatnonzero(scored & (np.abs(peak) > DETECTOR_Z_THRESHOLD)):
+            metric = DETECTOR_METRICS[worst[i]]
+            yield Row(
+                sensor_id=key,
+                anomaly_type=f"{metric}_{'high' if peak[i] > 0 else 'low'}",
+                severity=float(min((abs(peak[i]) - DETECTOR_Z_THRESHOLD) / DETECTOR_Z_THRESHOLD, 1.0)),
+                detection_time=rows[i][4],
+                produced_at=rows[i][5]
+            )
+        self.baseline.update([float(count + n), *mean.tolist(), *var.tolist()])
+
+def detect_anomalies(t_env):
+    """Score raw readings with the stateful detector, as a table for anomaly_sink"""
+    readings = t_env.to_data_stream(t_env.sql_query(f"""
+        SELECT sensor_id, {", ".join(DETECTOR_METRICS)}, `timestamp`, produced_at
+        FROM sensor_data
+    """))
+    anomalies = readings \
+        .key_by(lambda row: row[0], key_type=Types.STRING()) \
+        .process(AnomalyDetector(), output_type=Types.ROW_NAMED(
+            ["sensor_id", "anomaly_type", "severity", "detection_time", "produced_at"],
+            [Types.STRING(), Types.STRING(), Types.DOUBLE(), Types.SQL_TIMESTAMP(), Types.SQL_TIMESTAMP()]
+        ))
+    return t_env.from_data_stream(anomalies)
+
 def main():
     # Set up the streaming environment
     env = StreamExecutionEnvironment.get_execution_environment()
@@ -101,13 +306,21 @@ def main():
     
     t_env = StreamTableEnvironment.create(env, settings)
     
+    # Buffer input into mini-batches and pre-aggregate per task before the
+    # shuffle, so a few hot sensors do not pin all their rows on one subtask
+    table_config = t_env.get_config()
+    table_config.set("table.exec.mini-batch.enabled", "true")
+    table_config.set("table.exec.mini-batch.allow-latency", "1 s")
+    table_config.set("table.exec.mini-batch.size", "5000")
+    table_config.set("table.optimizer.agg-phase-strategy", "TWO_PHASE")
+    
     # Create tables
     create_kafka_source(t_env)
     create_kafka_sinks(t_env)
+    create_sliding_stats_sink(t_env)
     
-    # Process data - 1-minute window aggregation
-    t_env.execute_sql("""
-        INSERT INTO stats_sink
+    # 1-minute window aggregation, computed once and shared by both sinks below
+    t_env.create_temporary_view("sensor_stats_1m", t_env.sql_query("""
         SELECT 
             window_start,
             window_end,
@@ -115,47 +328,44 @@ def main():
             AVG(temperature) as avg_temp,
             AVG(vibration) as avg_vibration,
             AVG(pressure) as avg_pressure,
-            COUNT(*) FILTER (WHERE operational_state = 'anomaly' OR maintenance_needed = true) as alerts_count
+            COUNT(*) FILTER (WHERE operational_state = 'anomaly' OR maintenance_needed = true) as alerts_count,
+            -- Newest reading in the window, so the latency probe can time the window's output
+            MAX(produced_at) as last_produced_at
         FROM TABLE(
             TUMBLE(TABLE sensor_data, DESCRIPTOR(`timestamp`), INTERVAL '1' MINUTE))
         GROUP BY window_start, window_end, sensor_id
-    """)
+    """))
     
-    # Detect anomalies using simple thresholds
-    t_env.execute_sql("""
-        INSERT INTO anomaly_sink
-        SELECT
-            sensor_id,
-            CASE 
-                WHEN temperature > 85 THEN 'temperature_high'
-                WHEN vibration > 0.5 THEN 'vibration_high'
-                WHEN pressure < 80 THEN 'pressure_low'
-                ELSE 'unknown'
-            END as anomaly_type,
-            CASE
-                WHEN temperature > 85 THEN (temperature - 85) / 15
-                WHEN vibration > 0.5 THEN (vibration - 0.5) / 0.5
-                WHEN pressure < 80 THEN (80 - pressure) / 20
-                ELSE 0
-            END as severity,
-            `timestamp` as detection_time
-        FROM sensor_data
-        WHERE operational_state = 'anomaly'
+    # All inserts go into one statement set so they run as a single job: the
+    # planner reuses the shared source scan and window aggregate instead of
+    # reading raw-sensor-data once per INSERT
+    statements = t_env.create_statement_set()
+    
+    statements.add_insert_sql("""
+        INSERT INTO stats_sink
+        SELECT * FROM sensor_stats_1m
     """)
     
-    # Store aggregations in TimescaleDB
-    t_env.execute_sql("""
+    # Store aggregations in TimescaleDB straight from the window results
+    statements.add_insert_sql("""
         INSERT INTO timescale_sink
-        SELECT 
-            window_start,
-            window_end,
-            sensor_id,
-            avg_temp,
-            avg_vibration,
-            avg_pressure,
-            alerts_count
-        FROM stats_sink
+        SELECT window_start, window_end, sensor_id, avg_temp, avg_vibration, avg_pressure, alerts_count
+        FROM sensor_stats_1m
     """)
+    
+    # 5-minute windows sliding every 30 seconds
+    statements.add_insert_sql(f"""
+        INSERT INTO sliding_stats_sink
+        {sliding_stats_query()}
+    """)
+    
+    # Anomalies from the stateful per-sensor detector
+    statements.add_insert("anomaly_sink", detect_anomalies(t_env))
+    
+    # The detector is a DataStream pipeline, so the inserts are attached to the
+    # stream environment and everything is submitted as one job
+    statements.attach_as_datastream()
+    env.execute("sensor-processing")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,128 @@
+# health-api/src/collector.py
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+Check = Callable[[], Awaitable[Dict[str, Any]]]
+Summarize = Callable[[Dict[str, Optional[Dict[str, Any]]]], Dict[str, Any]]
+
+class SourceState:
+    """Latest result of one upstream check and how it was obtained"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.result: Optional[Dict[str, Any]] = None  # None while the source is failing
+        self.error: Optional[str] = None
+        self.updated: Optional[float] = None
+        self.last_success: Optional[float] = None
+        self.failures = 0  # Consecutive
+        self.refreshes = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": "ok" if self.result is not None else "unavailable",
+            "interval_seconds": self.interval,
+            "updated": self.updated,
+            "last_success": self.last_success,
+            "error": self.error,
+            "consecutive_failures": self.failures,
+            "refreshes": self.refreshes
+        }
+
+class MetricsCollector:
+    """Refresh every upstream source on its own interval and keep recent history.
+
+    Request handlers and push streams only read what was collected, so upstream
+    load is set by the intervals, not by how many dashboards are open. Each
+    refresh recomputes the summary, appends it to a ring buffer and wakes the
+    streams waiting for the next version.
+    """
+
+    def __init__(self, checks: Dict[str, Tuple[Check, float]], summarize: Summarize,
+                 timeout: float = 3.0, history_seconds: float = 600.0):
+        self.checks = {name: check for name, (check, _) in checks.items()}
+        self.sources = {name: SourceState(interval) for name, (_, interval) in checks.items()}
+        self.summarize = summarize
+        self.timeout = timeout
+        self.history_seconds = history_seconds
+        # Every refresh of every source adds a point
+        self.history: Deque[Tuple[float, Dict[str, Any]]] = deque(
+            maxlen=int(sum(history_seconds / interval for _, interval in checks.values())) + 1
+        )
+        self.summary: Optional[Dict[str, Any]] = None
+        self.version = 0
+        self._changed: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """Start one refresh loop per source; call from the running event loop"""
+        self._changed = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._refresh_forever(name))
+            for name in self.checks
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _refresh_forever(self, name: str):
+        source = self.sources[name]
+        while True:
+            started = time.monotonic()
+            await self.refresh(name)
+            await asyncio.sleep(max(0.0, source.interval - (time.monotonic() - started)))
+
+    async def refresh(self, name: str):
+        """Run one source's check under the timeout and publish the new summary"""
+        source = self.sources[name]
+        try:
+            source.result = await asyncio.wait_for(self.checks[name](), self.timeout)
+            source.error = None
+            source.failures = 0
+            source.last_success = time.time()
+        except Exception as e:
+            logger.error(f"{name} check failed: {e!r}")
+            source.result = None
+            source.error = str(e) or repr(e)
+            source.failures += 1
+        source.refreshes += 1
+        source.updated = time.time()
+        self._publish(source.updated)
+
+    def _publish(self, now: float):
+        self.summary = self.summarize({name: source.result for name, source in self.sources.items()})
+        self.history.append((now, self.summary))
+        self.version += 1
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = asyncio.Event()
+
+    def available(self) -> bool:
+        """Whether any source currently has a result"""
+        return any(source.result is not None for source in self.sources.values())
+
+    async def wait_for_update(self, version: int, timeout: float) -> bool:
+        """Wait until the summary moves past version; False on timeout"""
+        if self.version != version:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def recent(self, seconds: float, fields: Sequence[str]) -> Dict[str, List[Any]]:
+        """Summary fields over the last seconds as columns with a shared time column in ms"""
+        cutoff = time.time() - seconds
+        samples = [(timestamp, summary) for timestamp, summary in self.history if timestamp >= cutoff]
+        return {
+            "t": [int(timestamp * 1000) for timestamp, _ in samples],
+            **{field: [summary.get(field) for _, summary in samples] for field in fields}
+        }
@@ -0,0 +1,162 @@
+# health-api/src/history.py
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Sequence, Tuple
+
+import asyncpg
+
+FIELDS = ("temperature", "vibration", "pressure")
+
+# (name, bucket seconds, table, column expression per field), finest first
+SOURCES = (
+    ("raw", 0, "sensor_data", "{field}"),
+    ("1m", 60, "sensor_data_1m", "avg_{field}"),
+    ("1h", 3600, "sensor_data_1h", "avg_{field}"),
+)
+TIME_COLUMN = {"raw": "time", "1m": "bucket", "1h": "bucket"}
+
+# Rows are pre-bucketed in the database into this many buckets per output
+# point, keeping each bucket's first, last, min and max row of the first field,
+# so at most 4x this many rows per point reach the Python downsampler
+PREBUCKETS_PER_POINT = 2
+
+def to_utc(value: datetime) -> datetime:
+    """An aware UTC datetime; naive values are taken to be UTC already"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def choose_source(start: datetime, end: datetime, points: int) -> Tuple[str, int, str, str]:
+    """Coarsest source whose buckets are still finer than one output point"""
+    seconds_per_point = (end - start).total_seconds() / points
+    chosen = SOURCES[0]
+    for source in SOURCES:
+        if source[1] <= seconds_per_point:
+            chosen = source
+    return chosen
+
+def lttb_indices(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    """Largest-Triangle-Three-Buckets: indices of threshold points that keep the series' shape"""
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        count = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / count
+        avg_y = sum(ys[avg_start:avg_end]) / count
+
+        ax, ay = xs[a], ys[a]
+        best = range_start = int(i * every) + 1
+        best_area = -1.0
+        for j in range(range_start, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+def minmax_indices(ys: Sequence[float], threshold: int) -> List[int]:
+    """Minimum and maximum of each of threshold / 2 buckets, in time order"""
+    n = len(ys)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return list(range(n))
+
+    selected = []
+    size = n / buckets
+    for b in range(buckets):
+        lo, hi = int(b * size), int((b + 1) * size)
+        window = range(lo, hi)
+        low = min(window, key=ys.__getitem__)
+        high = max(window, key=ys.__getitem__)
+        selected.extend(sorted({low, high}))
+    return selected
+
+def history_query(table: str, time_column: str, column: str, fields: List[str], prebucketed: bool) -> str:
+    """SQL for one source; prebucketed queries take the time_bucket width as $4"""
+    columns = ", ".join(f"{column.format(field=field)} AS {field}" for field in fields)
+    if not prebucketed:
+        return f"""
+            SELECT sensor_id, {time_column} AS time, {columns}
+            FROM {table}
+            WHERE sensor_id = ANY($1::text[]) AND {time_column} >= $2 AND {time_column} < $3
+            ORDER BY sensor_id, {time_column}
+        """
+    bucket = "PARTITION BY sensor_id, prebucket"
+    return f"""
+        SELECT sensor_id, time, {", ".join(fields)}
+        FROM (
+            SELECT *,
+                row_number() OVER ({bucket} ORDER BY time) AS first_rank,
+                row_number() OVER ({bucket} ORDER BY time DESC) AS last_rank,
+                row_number() OVER ({bucket} ORDER BY {fields[0]} ASC NULLS LAST, time) AS min_rank,
+                row_number() OVER ({bucket} ORDER BY {fields[0]} DESC NULLS LAST, time) AS max_rank
+            FROM (
+                SELECT sensor_id, {time_column} AS time, {columns},
+                    time_bucket($4::interval, {time_column}) AS prebucket
+                FROM {table}
+                WHERE sensor_id = ANY($1::text[]) AND {time_column} >= $2 AND {time_column} < $3
+            ) source
+        ) ranked
+        WHERE first_rank = 1 OR last_rank = 1 OR min_rank = 1 OR max_rank = 1
+        ORDER BY sensor_id, time
+    """
+
+async def query_history(pool: asyncpg.Pool, sensor_ids: List[str], start: datetime, end: datetime,
+                        points: int, fields: List[str], method: str = "lttb") -> Dict[str, Any]:
+    """Fetch each sensor's series from the cheapest source and downsample it to points.
+
+    When the source is finer than PREBUCKETS_PER_POINT buckets per point, the
+    database first reduces each time_bucket to its first, last, min and max
+    rows, and LTTB or min/max only runs on that reduced set. Points are picked
+    from the first field and the other fields are sampled at the same rows, so
+    every sensor returns one shared time column.
+    """
+    start, end = to_utc(start), to_utc(end)
+    name, bucket_seconds, table, column = choose_source(start, end, points)
+    time_column = TIME_COLUMN[name]
+    prebucket_seconds = (end - start).total_seconds() / (points * PREBUCKETS_PER_POINT)
+    prebucketed = prebucket_seconds > bucket_seconds
+    query = history_query(table, time_column, column, fields, prebucketed)
+    args = [sensor_ids, start, end]
+    if prebucketed:
+        args.append(timedelta(seconds=prebucket_seconds))
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(query, *args)
+
+    grouped: Dict[str, List[asyncpg.Record]] = {}
+    for row in rows:
+        grouped.setdefault(row["sensor_id"], []).append(row)
+
+    series = {}
+    primary = fields[0]
+    for sensor_id, sensor_rows in grouped.items():
+        times = [int(row["time"].timestamp() * 1000) for row in sensor_rows]
+        values = [row[primary] if row[primary] is not None else 0.0 for row in sensor_rows]
+        if method == "minmax":
+            indices = minmax_indices(values, points)
+        else:
+            indices = lttb_indices(times, values, points)
+        series[sensor_id] = {
+            "t": [times[i] for i in indices],
+            **{field: [sensor_rows[i][field] for i in indices] for field in fields}
+        }
+
+    return {
+        "source": name,
+        "bucket_seconds": bucket_seconds,
+        "prebucket_seconds": round(prebucket_seconds, 3) if prebucketed else None,
+        "method": method,
+        "fields": fields,
+        "rows_fetched": len(rows),
+        "series": series
+    }
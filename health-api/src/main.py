@@ -1,13 +1,18 @@
 # health-api/src/main.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-import psycopg2
-from kafka import KafkaAdminClient
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from kubernetes import client, config
-import requests
+from upstream import KAFKA_BOOTSTRAP_SERVERS, Upstreams
+from metrics_sampler import KafkaMetricsSampler
+from history import FIELDS, query_history, to_utc
+from collector import MetricsCollector
+from probe import LatencyProbe
+import asyncio
+import json
 import logging
 import os
-from typing import Dict, Any
+from typing import AsyncIterator, Dict, Any, Optional
 from datetime import datetime, timedelta
 
 app = FastAPI()
@@ -26,160 +31,277 @@ logger = logging.getLogger(__name__)
 config.load_incluster_config()
 v1 = client.CoreV1Api()
 
-def parse_message_rate(metrics_text: str) -> float:
-    """Extract message rate from Kafka metrics"""
-    try:
-        # Look for messagesin metrics for raw-sensor-data topic
-        for line in metrics_text.split('\n'):
-            if 'kafka_server_brokertopicmetrics_messagesin_total{topic="raw-sensor-data"}' in line:
-                return float(line.split()[1])
-    except Exception as e:
-        logger.error(f"Failed to parse message rate: {e}")
-    return 0
+# Per-source timeout for the checks behind /metrics
+CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "3"))
+# How often the background collector refreshes each source, in seconds
+KAFKA_CHECK_INTERVAL = float(os.getenv("KAFKA_CHECK_INTERVAL", "5"))
+SENSORS_CHECK_INTERVAL = float(os.getenv("SENSORS_CHECK_INTERVAL", "2"))
+DB_STATS_TTL = float(os.getenv("DB_STATS_TTL", "15"))
+FLINK_CHECK_INTERVAL = float(os.getenv("FLINK_CHECK_INTERVAL", "5"))
+# Span of summaries kept for /metrics/history and streamed to new subscribers
+METRICS_HISTORY_SECONDS = float(os.getenv("METRICS_HISTORY_SECONDS", "600"))
+# Comment line sent on idle streams so proxies keep the connection open
+STREAM_KEEPALIVE = float(os.getenv("METRICS_STREAM_KEEPALIVE", "15"))
+
+# Broker metrics are scraped per broker pod through the headless service
+KAFKA_METRICS_HOST = os.getenv("KAFKA_METRICS_HOST", "iot-kafka-brokers.kafka.svc.cluster.local")
+KAFKA_METRICS_INTERVAL = float(os.getenv("KAFKA_METRICS_INTERVAL", "5"))
+
+# End-to-end latency probe: raw-sensor-data partitions to sample ("all" for every
+# one), the span its quantiles and rates cover, and how often the summary reads it
+PROBE_RAW_PARTITIONS = os.getenv("PROBE_RAW_PARTITIONS", "0")
+PROBE_WINDOW_SECONDS = float(os.getenv("PROBE_WINDOW_SECONDS", "60"))
+PROBE_CHECK_INTERVAL = float(os.getenv("PROBE_CHECK_INTERVAL", "5"))
+
+# Bounds on a single history request
+HISTORY_MAX_SENSORS = int(os.getenv("HISTORY_MAX_SENSORS", "50"))
+HISTORY_MAX_POINTS = int(os.getenv("HISTORY_MAX_POINTS", "5000"))
+
+# Summary fields kept as trends
+TREND_FIELDS = ("sensorCount", "messageRate", "processingLatency", "alerts")
+
+upstreams = Upstreams()
+sampler: Optional[KafkaMetricsSampler] = None
+collector: Optional[MetricsCollector] = None
+probe = LatencyProbe(
+    KAFKA_BOOTSTRAP_SERVERS,
+    None if PROBE_RAW_PARTITIONS == "all" else [int(p) for p in PROBE_RAW_PARTITIONS.split(",") if p],
+    window=PROBE_WINDOW_SECONDS
+)
+
+async def start_background():
+    global sampler, collector
+    await upstreams.start()
+    sampler = KafkaMetricsSampler(upstreams.http, KAFKA_METRICS_HOST, interval=KAFKA_METRICS_INTERVAL)
+    app.sampler_task = asyncio.create_task(sampler.run())
+    app.probe_task = asyncio.create_task(probe.run())
+    collector = MetricsCollector(
+        {
+            "kafka": (check_kafka, KAFKA_CHECK_INTERVAL),
+            "sensors": (check_sensors, SENSORS_CHECK_INTERVAL),
+            "timescaledb": (check_timescaledb, DB_STATS_TTL),
+            "flink": (check_flink, FLINK_CHECK_INTERVAL),
+            "probe": (check_probe, PROBE_CHECK_INTERVAL)
+        },
+        summarize_metrics,
+        timeout=CHECK_TIMEOUT,
+        history_seconds=METRICS_HISTORY_SECONDS
+    )
+    collector.start()
+
+async def stop_background():
+    if collector:
+        await collector.stop()
+    for task in ("sampler_task", "probe_task"):
+        if hasattr(app, task):
+            getattr(app, task).cancel()
+    await upstreams.stop()
+
+app.add_event_handler("startup", start_background)
+app.add_event_handler("shutdown", stop_background)
+
+async def check_kafka() -> Dict[str, Any]:
+    topics = await upstreams.list_topics()
+    
+    # Get message rates precomputed by the background sampler
+    message_rate = sampler.message_rate("raw-sensor-data")
+    
+    return {
+        "status": "healthy",
+        "topics": len(topics),
+        "message_rate": message_rate,
+        "details": {
+            "topics": topics
+        }
+    }
+
+def collected(name: str) -> Dict[str, Any]:
+    """A source's latest collected result, or 503 with its last error"""
+    source = collector.sources[name]
+    if source.result is None:
+        raise HTTPException(status_code=503, detail=source.error or f"No {name} data collected yet")
+    return source.result
 
 @app.get("/health/kafka")
 async def kafka_health() -> Dict[str, Any]:
-    try:
-        admin = KafkaAdminClient(
-            bootstrap_servers='iot-kafka-brokers.kafka.svc.cluster.local:9092',
-            client_id='health-checker'
-        )
-        topics = admin.list_topics()
+    return collected("kafka")
+
+@app.get("/metrics/kafka/rates")
+async def kafka_rates() -> Dict[str, Any]:
+    """Messages/sec and bytes/sec per topic and partition over each window"""
+    return {**sampler.rates, "last_error": sampler.last_error}
+
+async def check_timescaledb() -> Dict[str, Any]:
+    pool = await upstreams.db()
+    async with pool.acquire() as conn:
+        # Get active sensors in last minute from the 1-minute continuous
+        # aggregate, which only touches the last two buckets per sensor
+        active_count = await conn.fetchval("""
+            SELECT COUNT(DISTINCT sensor_id) 
+            FROM sensor_data_1m 
+            WHERE bucket > NOW() - INTERVAL '2 minutes'
+              AND last_seen > NOW() - INTERVAL '1 minute'
+        """)
         
-        # Get message rates
-        metrics_response = requests.get(
-            "http://kafka-metrics.kafka:9404/metrics",
-            timeout=3
-        )
-        message_rate = parse_message_rate(metrics_response.text)
+        # Get total record count from chunk statistics instead of a scan
+        total_count = await conn.fetchval("SELECT approximate_row_count('sensor_data')")
         
-        return {
-            "status": "healthy",
-            "topics": len(topics),
-            "message_rate": message_rate,
-            "details": {
-                "topics": topics
-            }
-        }
-    except Exception as e:
-        logger.error(f"Kafka health check failed: {e}")
-        raise HTTPException(status_code=503, detail=str(e))
+    return {
+        "status": "healthy", 
+        "active_sensors": active_count,
+        "total_records": total_count,
+        "total_records_approximate": True
+    }
 
 @app.get("/health/timescaledb")
 async def timescaledb_health() -> Dict[str, Any]:
+    return collected("timescaledb")
+
+@app.get("/history")
+async def history(sensor_ids: str, start: datetime, end: datetime, points: int = 500,
+                  fields: str = ",".join(FIELDS), method: str = "lttb") -> Dict[str, Any]:
+    """Downsampled series for dashboards, read from the coarsest source that still resolves points"""
+    ids = [s for s in sensor_ids.split(",") if s]
+    field_list = [f for f in fields.split(",") if f]
+    if not ids or len(ids) > HISTORY_MAX_SENSORS:
+        raise HTTPException(status_code=400, detail=f"Request 1 to {HISTORY_MAX_SENSORS} sensor_ids")
+    if not field_list or any(f not in FIELDS for f in field_list):
+        raise HTTPException(status_code=400, detail=f"fields must be drawn from {', '.join(FIELDS)}")
+    if not 3 <= points <= HISTORY_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"points must be between 3 and {HISTORY_MAX_POINTS}")
+    if method not in ("lttb", "minmax"):
+        raise HTTPException(status_code=400, detail="method must be lttb or minmax")
+    # Naive and aware query parameters cannot be compared
+    start, end = to_utc(start), to_utc(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+
     try:
-        conn = psycopg2.connect(
-            dbname=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT")
-        )
-        with conn.cursor() as cur:
-            # Get active sensors in last minute
-            cur.execute("""
-                SELECT COUNT(DISTINCT sensor_id) 
-                FROM sensor_data 
-                WHERE time > NOW() - INTERVAL '1 minute'
-            """)
-            active_count = cur.fetchone()[0]
-            
-            # Get total record count
-            cur.execute("SELECT count(*) FROM sensor_data")
-            total_count = cur.fetchone()[0]
-            
-        conn.close()
-        return {
-            "status": "healthy", 
-            "active_sensors": active_count,
-            "total_records": total_count
-        }
+        pool = await upstreams.db()
+        return await query_history(pool, ids, start, end, points, field_list, method)
     except Exception as e:
-        logger.error(f"TimescaleDB health check failed: {str(e)}", exc_info=True)
+        logger.error(f"History query failed: {e}", exc_info=True)
         raise HTTPException(status_code=503, detail=str(e))
 
+async def check_flink() -> Dict[str, Any]:
+    # Get job status; processing latency is measured end to end by the probe
+    response = await upstreams.http.get("http://flink-jobmanager.flink:8081/jobs/overview")
+    jobs = response.json()
+    
+    return {
+        "status": "healthy",
+        "running_jobs": len([j for j in jobs["jobs"] if j["state"] == "RUNNING"]),
+        "details": jobs
+    }
+
 @app.get("/health/flink")
 async def flink_health() -> Dict[str, Any]:
-    try:
-        # Get job status
-        response = requests.get(
-            "http://flink-jobmanager.flink:8081/jobs/overview", 
-            timeout=3
-        )
-        jobs = response.json()
-        
-        # Get metrics
-        metrics_response = requests.get(
-            "http://flink-jobmanager.flink:8081/metrics",
-            timeout=3
-        )
-        metrics = metrics_response.json()
-        
-        # Calculate average processing latency
-        processing_delay = next(
-            (m for m in metrics if m["id"] == "processing-delay-ms"),
-            {"value": 0}
-        )["value"]
-        
-        return {
-            "status": "healthy",
-            "running_jobs": len([j for j in jobs["jobs"] if j["state"] == "RUNNING"]),
-            "processing_latency": processing_delay,
-            "details": jobs
-        }
-    except Exception as e:
-        logger.error(f"Flink health check failed: {e}")
-        raise HTTPException(status_code=503, detail=str(e))
+    return collected("flink")
+
+async def check_sensors() -> Dict[str, Any]:
+    response = await upstreams.http.get("http://sensor-backend.sensor-backend:8000/status")
+    sensor_data = response.json()
+    
+    return {
+        "status": "healthy",
+        "active_sensors": sensor_data.get("active_sensors", 0),
+        "details": sensor_data
+    }
+
+async def check_probe() -> Dict[str, Any]:
+    if probe.last_error:
+        raise RuntimeError(probe.last_error)
+    return probe.snapshot()
+
+@app.get("/probe")
+async def probe_stats() -> Dict[str, Any]:
+    """Produce-to-stage latency, throughput and lost or duplicated readings over the probe's window"""
+    return probe.snapshot()
+
+@app.get("/probe/metrics", response_class=PlainTextResponse)
+async def probe_metrics() -> str:
+    """Prometheus exposition of the probe's latency histograms and sequence counters"""
+    return probe.exposition()
 
 @app.get("/health/sensors")
 async def sensors_health() -> Dict[str, Any]:
-    try:
-        response = requests.get(
-            "http://sensor-backend.sensor-backend:8000/status",
-            timeout=3
-        )
-        sensor_data = response.json()
-        
-        return {
-            "status": "healthy",
-            "active_sensors": len(sensor_data.get("active_sensors", [])),
-            "details": sensor_data
+    return collected("sensors")
+
+def summarize_metrics(results: Dict[str, Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Dashboard summary from each source's latest result; a down source only blanks its own fields"""
+    kafka_response = results["kafka"] or {}
+    sensor_response = results["sensors"] or {}
+    db_response = results["timescaledb"] or {}
+    flink_response = results["flink"] or {}
+    probe_response = results["probe"] or {}
+    
+    message_rate = kafka_response.get("message_rate", 0)
+    
+    # Prioritize the real-time backend count, falling back to the database
+    active_sensors = sensor_response.get("active_sensors", 0)
+    if active_sensors == 0:
+        active_sensors = db_response.get("active_sensors", 0)
+    
+    # Count alerts from anomaly detection
+    alerts = sum(
+        1 for j in flink_response.get("details", {}).get("jobs", [])
+        if j.get("alerts", 0) > 0
+    )
+    
+    return {
+        "sensorCount": active_sensors,
+        "messageRate": round(message_rate, 2),
+        # Median time from produce to the 1-minute stats output
+        "processingLatency": probe_response.get("stages", {}).get("stats", {}).get("latency_ms", {}).get("p50") or 0,
+        "alerts": alerts,
+        "sources": {
+            name: "ok" if result is not None else "unavailable"
+            for name, result in results.items()
         }
-    except Exception as e:
-        logger.error(f"Sensor health check failed: {e}")
-        raise HTTPException(status_code=503, detail=str(e))
+    }
 
 @app.get("/metrics")
 async def get_metrics() -> Dict[str, Any]:
-    try:
-        # Get Kafka metrics
-        kafka_response = await kafka_health()
-        message_rate = kafka_response.get("message_rate", 0)
-        
-        # Get active sensors (prioritize real-time backend count)
-        sensor_response = await sensors_health()
-        active_sensors = sensor_response.get("active_sensors", 0)
-        
-        # If sensor backend is down, fallback to database count
-        if active_sensors == 0:
-            db_response = await timescaledb_health()
-            active_sensors = db_response.get("active_sensors", 0)
-        
-        # Get Flink metrics
-        flink_response = await flink_health()
-        
-        # Count alerts from anomaly detection
-        alerts = sum(
-            1 for j in flink_response["details"].get("jobs", [])
-            if j.get("alerts", 0) > 0
-        )
-        
-        return {
-            "sensorCount": active_sensors,
-            "messageRate": round(message_rate, 2),
-            "processingLatency": flink_response.get("processing_latency", 0),
-            "alerts": alerts
-        }
-    except Exception as e:
-        logger.error(f"Metrics collection failed: {e}")
-        raise HTTPException(status_code=503, detail=str(e))
\ No newline at end of file
+    """Latest summary from the background collector; upstreams are never queried per request"""
+    if not collector.available():
+        raise HTTPException(status_code=503, detail="All upstream checks failed")
+    return collector.summary
+
+@app.get("/metrics/history")
+async def metrics_history(seconds: float = METRICS_HISTORY_SECONDS) -> Dict[str, Any]:
+    """Recent summaries as columns, one point per source refresh"""
+    return collector.recent(min(seconds, METRICS_HISTORY_SECONDS), TREND_FIELDS)
+
+@app.get("/metrics/sources")
+async def metrics_sources() -> Dict[str, Any]:
+    """Refresh interval, freshness and last error of every collected source"""
+    return {name: source.to_dict() for name, source in collector.sources.items()}
+
+def sse(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+async def metrics_events(request: Request, history_seconds: float) -> AsyncIterator[str]:
+    # Trends first, then the current summary and every later one. A slow reader
+    # skips straight to the newest summary instead of queueing the ones it missed.
+    yield sse("history", collector.recent(history_seconds, TREND_FIELDS))
+    version = 0  # Nothing has been collected at version 0
+    while not await request.is_disconnected():
+        if version != collector.version:
+            version = collector.version
+            yield sse("metrics", collector.summary, version)
+        elif not await collector.wait_for_update(version, STREAM_KEEPALIVE):
+            yield ": keepalive\n\n"
+
+@app.get("/metrics/stream")
+async def metrics_stream(request: Request, history_seconds: float = 300) -> StreamingResponse:
+    """Server-sent events: a history event, then a metrics event per collector refresh"""
+    return StreamingResponse(
+        metrics_events(request, min(history_seconds, METRICS_HISTORY_SECONDS)),
+        media_type="text/event-stream",
+        # Stop nginx from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
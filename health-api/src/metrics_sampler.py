@@ -0,0 +1,148 @@
+# health-api/src/metrics_sampler.py
+import asyncio
+import logging
+import re
+import socket
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Cumulative per-topic counters, counted on the partition leader's broker
+TOPIC_COUNTERS = {
+    "kafka_server_brokertopicmetrics_messagesin_total": "messages_in",
+    "kafka_server_brokertopicmetrics_bytesin_total": "bytes_in",
+    "kafka_server_brokertopicmetrics_bytesout_total": "bytes_out",
+}
+# Per-partition log end offset, reported by the leader and every follower
+PARTITION_OFFSET = "kafka_log_log_logendoffset"
+
+# One pass over the exposition text, matching only the series we keep
+_SAMPLE = re.compile(
+    r"^(" + "|".join(map(re.escape, [*TOPIC_COUNTERS, PARTITION_OFFSET])) + r")\{([^}]*)\}\s+(\S+)",
+    re.MULTILINE
+)
+_TOPIC = re.compile(r'topic="([^"]*)"')
+_PARTITION = re.compile(r'partition="([^"]*)"')
+
+class CounterSeries:
+    """Ring buffer of timestamped samples of one cumulative counter"""
+
+    def __init__(self, maxlen: int):
+        self.samples: Deque[Tuple[float, float]] = deque(maxlen=maxlen)
+
+    def add(self, timestamp: float, value: float):
+        self.samples.append((timestamp, value))
+
+    def rate(self, window: float) -> Optional[float]:
+        """Per-second increase over the last window seconds, tolerating counter resets"""
+        if len(self.samples) < 2:
+            return None
+        newest = self.samples[-1][0]
+        increase = 0.0
+        start = None
+        previous = None
+        for timestamp, value in self.samples:
+            if timestamp < newest - window:
+                previous = value
+                start = timestamp
+                continue
+            if previous is not None:
+                increase += value - previous if value >= previous else value
+            else:
+                start = timestamp
+            previous = value
+        elapsed = newest - start
+        return increase / elapsed if elapsed > 0 else None
+
+class KafkaMetricsSampler:
+    """Scrape every broker's JMX exporter on an interval and precompute rates.
+
+    Brokers are found by resolving the headless broker service, so each
+    broker's counters stay in their own series; scraping the load-balanced
+    metrics service would mix brokers and produce meaningless deltas.
+    """
+
+    def __init__(self, http: httpx.AsyncClient, host: str, port: int = 9404,
+                 interval: float = 5.0, windows: Tuple[int, ...] = (10, 60, 300)):
+        self.http = http
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.windows = windows
+        self.maxlen = int(max(windows) / interval) + 2
+        self.series: Dict[Tuple[str, str, str, str], CounterSeries] = {}
+        self.rates: Dict[str, Any] = {"topics": {}, "partitions": {}, "updated": None}
+        self.last_error: Optional[str] = None
+
+    async def run(self):
+        """Scrape forever; errors are logged and retried on the next interval"""
+        while True:
+            try:
+                await self.scrape_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Kafka metrics scrape failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _brokers(self) -> List[str]:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            self.host, self.port, type=socket.SOCK_STREAM
+        )
+        return sorted({info[4][0] for info in infos})
+
+    async def scrape_once(self):
+        brokers = await self._brokers()
+        responses = await asyncio.gather(
+            *(self.http.get(f"http://{broker}:{self.port}/metrics") for broker in brokers),
+            return_exceptions=True
+        )
+        now = time.time()
+        for broker, response in zip(brokers, responses):
+            if isinstance(response, Exception):
+                logger.warning(f"Could not scrape broker {broker}: {response}")
+                continue
+            self.ingest(broker, response.text, now)
+        self.rates = self._compute_rates(now)
+
+    def ingest(self, broker: str, text: str, timestamp: float):
+        """Parse one broker's exposition text into the ring buffers"""
+        for match in _SAMPLE.finditer(text):
+            name, labels, value = match.groups()
+            topic = _TOPIC.search(labels)
+            if not topic:
+                continue
+            partition = _PARTITION.search(labels)
+            key = (broker, name, topic.group(1), partition.group(1) if partition else "")
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = CounterSeries(self.maxlen)
+            series.add(timestamp, float(value))
+
+    def _compute_rates(self, now: float) -> Dict[str, Any]:
+        topics: Dict[str, Dict[str, Dict[str, float]]] = {}
+        partitions: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for (broker, name, topic, partition), series in self.series.items():
+            if now - series.samples[-1][0] > 2 * self.interval:
+                continue  # Broker or partition no longer reported
+            for window in self.windows:
+                rate = series.rate(window)
+                if rate is None:
+                    continue
+                label = f"{window}s"
+                if name == PARTITION_OFFSET:
+                    # Replicas report the same offsets, so keep the highest, not the sum
+                    per_window = partitions.setdefault(topic, {}).setdefault(partition, {})
+                    per_window[label] = max(per_window.get(label, 0.0), rate)
+                else:
+                    per_metric = topics.setdefault(topic, {}).setdefault(TOPIC_COUNTERS[name], {})
+                    per_metric[label] = per_metric.get(label, 0.0) + rate
+        return {"topics": topics, "partitions": partitions, "updated": now}
+
+    def message_rate(self, topic: str, window: int = 60) -> float:
+        """Messages/sec into a topic over a window, from the last scrape"""
+        return self.rates["topics"].get(topic, {}).get("messages_in", {}).get(f"{window}s", 0.0)
@@ -0,0 +1,319 @@
+# health-api/src/probe.py
+import asyncio
+import json
+import logging
+import time
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from kafka import KafkaConsumer, TopicPartition
+
+logger = logging.getLogger(__name__)
+
+RAW_TOPIC = "raw-sensor-data"
+
+# Stage timed on each topic and the field with the produce time of the newest
+# reading behind a record
+STAGES = {
+    RAW_TOPIC: ("raw", "produced_at"),                  # Producer -> broker -> consumer
+    "sensor-stats": ("stats", "last_produced_at"),      # ... -> Flink 1-minute window output
+    "sensor-anomalies": ("anomalies", "produced_at"),   # ... -> Flink detector output
+}
+
+# Seconds; window outputs wait for their window to close, so the range reaches minutes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 15.0, 30.0, 60.0, 120.0, 300.0)
+
+# Must match SCHEMA_ID_HEADER and AvroReadingSerializer in the sensor backend's kafka_utils.py
+SCHEMA_ID_HEADER = 'schema-id'
+AVRO_READING_SCHEMA_ID = 2
+_DOUBLES_SIZE = 24
+
+def _read_long(data: bytes, pos: int) -> Tuple[int, int]:
+    shift = 0
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    return (value >> 1) ^ -(value & 1), pos
+
+def _skip_string(data: bytes, pos: int) -> int:
+    length, pos = _read_long(data, pos)
+    return pos + length
+
+def decode_raw(value: bytes, headers: Optional[List[Tuple[str, bytes]]]) -> Optional[Dict[str, Any]]:
+    """sensor_id, seq and produced_at of a raw reading, or None for other records"""
+    schema = next((int(v) for k, v in headers or () if k == SCHEMA_ID_HEADER), 0)
+    if schema == AVRO_READING_SCHEMA_ID:
+        length, pos = _read_long(value, 0)
+        sensor_id = value[pos:pos + length].decode('utf-8')
+        pos = _skip_string(value, pos + length + _DOUBLES_SIZE) + 2  # operational_state, two booleans
+        _, pos = _read_long(value, pos)  # timestamp
+        seq, pos = _read_long(value, pos)
+        produced_at_ms, _ = _read_long(value, pos)
+        return {"sensor_id": sensor_id, "seq": seq, "produced_at": produced_at_ms / 1000}
+    if schema == 0:
+        message = json.loads(value.decode('utf-8'))
+        return message if "sensor_id" in message else None
+    return None  # Older schemas carry no sequence or produce time
+
+def parse_time(value: Any) -> Optional[float]:
+    """Epoch seconds from a number, or from a Flink JSON timestamp in UTC.
+
+    Flink drops trailing zeros from the fraction (12:00:00.5, or no fraction
+    at all), which datetime.fromisoformat before Python 3.11 rejects, so the
+    fraction is parsed separately.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    whole, _, fraction = str(value).replace("T", " ").rstrip("Z").partition(".")
+    if fraction and not fraction.isdigit():
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    parsed = datetime.strptime(whole, "%Y-%m-%d %H:%M:%S")
+    seconds = parsed.replace(tzinfo=timezone.utc).timestamp()
+    return seconds + float(f"0.{fraction}") if fraction else seconds
+
+class Histogram:
+    """Fixed-bucket latency histogram with interpolated quantiles"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def add(self, other: "Histogram"):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+class StageStats:
+    """Latency and throughput of one stage, in total and over the recent window"""
+
+    def __init__(self):
+        self.total = Histogram()
+        self.current = Histogram()
+        self.previous = Histogram()
+        self.messages = 0
+        self.last_message: Optional[float] = None
+
+    def observe(self, latency: Optional[float], now: float):
+        self.messages += 1
+        self.last_message = now
+        if latency is not None:
+            latency = max(latency, 0.0)  # Clock skew between hosts
+            self.total.observe(latency)
+            self.current.observe(latency)
+
+    def rotate(self):
+        self.previous, self.current = self.current, Histogram()
+
+    def recent(self) -> Histogram:
+        recent = Histogram()
+        recent.add(self.previous)
+        recent.add(self.current)
+        return recent
+
+class LatencyProbe:
+    """Time readings through each pipeline stage and check their sequence numbers.
+
+    A consumer outside any group reads from the latest offset of a few
+    raw-sensor-data partitions and of every partition of the Flink output
+    topics. Readings are keyed by sensor, so a raw partition holds all of its
+    sensors' readings in order: a jump in a sensor's seq is a lost reading and
+    a repeat is a duplicate, while the cost stays proportional to the sampled
+    partitions rather than the whole stream.
+    """
+
+    def __init__(self, bootstrap_servers: str, raw_partitions: Optional[List[int]] = None,
+                 window: float = 60.0):
+        self.bootstrap_servers = bootstrap_servers
+        self.raw_partitions = raw_partitions  # None reads every partition
+        self.window = window
+        self.consumer: Optional[KafkaConsumer] = None
+        self.assigned: Dict[str, List[int]] = {}
+        self.stages = {stage: StageStats() for stage, _ in STAGES.values()}
+        self.last_seq: Dict[str, int] = {}
+        self.lost = 0
+        self.duplicates = 0
+        self.restarts = 0
+        self.malformed = 0
+        self.last_error: Optional[str] = None
+        self._window_started = time.time()
+        self._window_seconds = 0.0  # Span covered by previous + current
+
+    async def run(self):
+        """Consume forever; errors are logged and the consumer is rebuilt"""
+        while True:
+            try:
+                if self.consumer is None:
+                    await asyncio.to_thread(self._connect)
+                await asyncio.to_thread(self.poll_once)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Latency probe failed: {e}")
+                if self.consumer is not None:
+                    consumer, self.consumer = self.consumer, None
+                    await asyncio.to_thread(consumer.close)
+                await asyncio.sleep(5)
+
+    def _connect(self):
+        consumer = KafkaConsumer(
+            bootstrap_servers=self.bootstrap_servers,
+            client_id='health-latency-probe',
+            group_id=None,
+            enable_auto_commit=False
+        )
+        assignment = []
+        for topic in STAGES:
+            partitions = sorted(consumer.partitions_for_topic(topic) or ())
+            if topic == RAW_TOPIC and self.raw_partitions is not None:
+                partitions = [p for p in partitions if p in self.raw_partitions]
+            self.assigned[topic] = partitions
+            assignment += [TopicPartition(topic, p) for p in partitions]
+        consumer.assign(assignment)
+        consumer.seek_to_end()
+        self.consumer = consumer
+
+    def poll_once(self):
+        batches = self.consumer.poll(timeout_ms=1000, max_records=10000)
+        now = time.time()
+        for partition, records in batches.items():
+            for record in records:
+                try:
+                    self.ingest(partition.topic, record.value, record.headers, now)
+                except (ValueError, TypeError, KeyError, IndexError) as e:
+                    # One bad record must not cost the rest of the batch or the consumer's position
+                    self.malformed += 1
+                    logger.debug(f"Skipping malformed record at {partition.topic}:"
+                                 f"{partition.partition}@{record.offset}: {e}")
+        if now - self._window_started >= self.window:
+            for stats in self.stages.values():
+                stats.rotate()
+            self._window_seconds = now - self._window_started
+            self._window_started = now
+
+    def ingest(self, topic: str, value: bytes, headers: Optional[List[Tuple[str, bytes]]], now: float):
+        """Time one record received at now and, for readings, check its sequence number"""
+        stage, field = STAGES[topic]
+        if topic == RAW_TOPIC:
+            message = decode_raw(value, headers)
+            if message is None:
+                return
+            if message.get("seq") is not None:
+                self._check_sequence(message["sensor_id"], message["seq"])
+        else:
+            message = json.loads(value.decode('utf-8'))
+        produced_at = parse_time(message.get(field))
+        self.stages[stage].observe(None if produced_at is None else now - produced_at, now)
+
+    def _check_sequence(self, sensor_id: str, seq: int):
+        last = self.last_seq.get(sensor_id)
+        if last is None or seq == last + 1:
+            self.last_seq[sensor_id] = seq
+        elif seq > last + 1:
+            self.lost += seq - last - 1
+            self.last_seq[sensor_id] = seq
+        elif seq == 0:
+            # Generator restarted, or the sensor was removed and added again
+            self.restarts += 1
+            self.last_seq[sensor_id] = seq
+        else:
+            self.duplicates += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per-stage latency quantiles and throughput over the recent window, plus sequence checks"""
+        elapsed = self._window_seconds + (time.time() - self._window_started)
+        stages = {}
+        for stage, stats in self.stages.items():
+            recent = stats.recent()
+            stages[stage] = {
+                "messages": stats.messages,
+                "messages_per_sec": round(recent.count / elapsed, 2) if elapsed > 0 else 0.0,
+                "latency_ms": {
+                    name: round(value * 1000, 1) if value is not None else None
+                    for name, value in (
+                        ("p50", recent.quantile(0.5)),
+                        ("p95", recent.quantile(0.95)),
+                        ("p99", recent.quantile(0.99)),
+                    )
+                },
+                "last_message": stats.last_message
+            }
+        return {
+            "stages": stages,
+            "sequence": {
+                "sensors_tracked": len(self.last_seq),
+                "lost": self.lost,
+                "duplicates": self.duplicates,
+                "restarts": self.restarts
+            },
+            "malformed": self.malformed,
+            "partitions": self.assigned,
+            "window_seconds": round(elapsed, 1),
+            "last_error": self.last_error
+        }
+
+    def exposition(self, prefix: str = "pipeline_probe_") -> str:
+        """Prometheus text format of the cumulative counters and latency histograms"""
+        lines = []
+
+        def header(name: str, kind: str, help_text: str) -> str:
+            lines.append(f"# HELP {prefix}{name} {help_text}")
+            lines.append(f"# TYPE {prefix}{name} {kind}")
+            return prefix + name
+
+        name = header("messages_total", "counter", "Records consumed by the probe per stage")
+        for stage, stats in self.stages.items():
+            lines.append(f'{name}{{stage="{stage}"}} {stats.messages}')
+
+        name = header("latency_seconds", "histogram", "Time from produce to arrival at each stage")
+        for stage, stats in self.stages.items():
+            cumulative = 0
+            for bound, count in zip((*stats.total.buckets, "+Inf"), stats.total.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {stats.total.sum!r}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {stats.total.count}')
+
+        for key, help_text in (
+            ("lost", "Readings missing from a sensor's sequence"),
+            ("duplicates", "Readings whose sequence number was already seen"),
+            ("restarts", "Sensor sequences that restarted from zero")
+        ):
+            name = header(f"sequence_{key}_total", "counter", help_text)
+            lines.append(f"{name} {getattr(self, key)}")
+
+        name = header("malformed_total", "counter", "Records the probe could not decode")
+        lines.append(f"{name} {self.malformed}")
+
+        name = header("sensors_tracked", "gauge", "Sensors whose sequence numbers are checked")
+        lines.append(f"{name} {len(self.last_seq)}")
+        return "\n".join(lines) + "\n"
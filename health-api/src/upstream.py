@@ -0,0 +1,92 @@
+# health-api/src/upstream.py
+import asyncio
+import logging
+import os
+import threading
+from typing import Optional
+
+import asyncpg
+import httpx
+from kafka import KafkaAdminClient
+
+logger = logging.getLogger(__name__)
+
+KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "iot-kafka-brokers.kafka.svc.cluster.local:9092")
+
+class Upstreams:
+    """Long-lived clients shared by every health check.
+
+    One HTTP connection pool, one Postgres pool and one Kafka admin client are
+    opened at startup and reused, instead of a new connection per request.
+    """
+
+    def __init__(self):
+        self.http: Optional[httpx.AsyncClient] = None
+        self.db_pool: Optional[asyncpg.Pool] = None
+        self._db_lock = asyncio.Lock()
+        self._kafka_admin: Optional[KafkaAdminClient] = None
+        # KafkaAdminClient is not thread-safe. The lock is held by the worker
+        # thread, not the awaiting task, so a call abandoned by a timeout keeps
+        # the client until it actually returns
+        self._kafka_lock = threading.Lock()
+
+    async def start(self):
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(3.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+
+    async def stop(self):
+        if self.http:
+            await self.http.aclose()
+        if self.db_pool:
+            await self.db_pool.close()
+        await asyncio.to_thread(self._close_admin)
+
+    async def db(self) -> asyncpg.Pool:
+        """Postgres pool, created on first use so startup does not depend on the database"""
+        if self.db_pool is not None:
+            return self.db_pool
+        async with self._db_lock:
+            # Concurrent first requests wait for one pool instead of each opening their own
+            if self.db_pool is None:
+                self.db_pool = await asyncpg.create_pool(
+                    database=os.getenv("DB_NAME"),
+                    user=os.getenv("DB_USER"),
+                    password=os.getenv("DB_PASSWORD"),
+                    host=os.getenv("DB_HOST"),
+                    port=int(os.getenv("DB_PORT", "5432")),
+                    min_size=1,
+                    max_size=5
+                )
+        return self.db_pool
+
+    async def list_topics(self):
+        """List topics on the persistent admin client; the blocking call runs in a thread"""
+        return await asyncio.to_thread(self._list_topics)
+
+    def _list_topics(self):
+        # Fail fast instead of queueing threads behind a call that is still hung
+        if not self._kafka_lock.acquire(blocking=False):
+            raise RuntimeError("Kafka admin client is still busy with an earlier request")
+        try:
+            if self._kafka_admin is None:
+                self._kafka_admin = KafkaAdminClient(
+                    bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
+                    client_id='health-checker'
+                )
+            return self._kafka_admin.list_topics()
+        except Exception:
+            # Drop a broken client so the next check reconnects
+            if self._kafka_admin is not None:
+                admin, self._kafka_admin = self._kafka_admin, None
+                admin.close()
+            raise
+        finally:
+            self._kafka_lock.release()
+
+    def _close_admin(self):
+        with self._kafka_lock:
+            if self._kafka_admin is not None:
+                admin, self._kafka_admin = self._kafka_admin, None
+                admin.close()
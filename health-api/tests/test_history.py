@@ -0,0 +1,74 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from history import lttb_indices, minmax_indices, query_history, to_utc
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    async def fetch(self, query, *args):
+        self.calls.append((query, args))
+        return self.rows
+
+class FakePool:
+    def __init__(self, rows):
+        self.conn = FakeConnection(rows)
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return pool.conn
+
+            async def __aexit__(self, *exc):
+                return False
+        return Acquire()
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def rows(count: int, step: float = 1.0):
+    return [
+        {"sensor_id": "sensor_1", "time": START + timedelta(seconds=i * step),
+         "temperature": 70.0 + (i % 7), "pressure": 100.0}
+        for i in range(count)
+    ]
+
+def test_to_utc_makes_naive_and_offset_times_comparable():
+    naive = datetime(2024, 1, 1, 12)
+    offset = datetime(2024, 1, 1, 13, tzinfo=timezone(timedelta(hours=1)))
+    assert to_utc(naive) == to_utc(offset) == datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+    assert to_utc(offset).tzinfo == timezone.utc
+
+def test_raw_source_is_prebucketed_in_sql():
+    pool = FakePool(rows(400))
+    result = asyncio.run(query_history(
+        pool, ["sensor_1"], START.replace(tzinfo=None), START + timedelta(hours=1),
+        100, ["temperature", "pressure"]
+    ))
+    query, args = pool.conn.calls[0]
+    assert "time_bucket($4::interval, time)" in query
+    assert args[1].tzinfo == timezone.utc
+    assert args[3] == timedelta(seconds=3600 / 200)
+    assert result["source"] == "raw" and result["prebucket_seconds"] == 18.0
+    series = result["series"]["sensor_1"]
+    assert len(series["t"]) == 100
+    assert len(series["temperature"]) == len(series["pressure"]) == 100
+
+def test_aggregate_source_finer_than_prebuckets_is_read_directly():
+    pool = FakePool(rows(150, step=60.0))
+    result = asyncio.run(query_history(
+        pool, ["sensor_1"], START, START + timedelta(minutes=150), 100, ["temperature"]
+    ))
+    query, args = pool.conn.calls[0]
+    assert "time_bucket" not in query and len(args) == 3
+    assert result["source"] == "1m" and result["prebucket_seconds"] is None
+
+def test_downsamplers_keep_endpoints_and_extremes():
+    ys = [0.0] * 50 + [10.0] + [0.0] * 49
+    xs = list(range(100))
+    lttb = lttb_indices(xs, ys, 10)
+    assert len(lttb) == 10 and lttb[0] == 0 and lttb[-1] == 99 and 50 in lttb
+    assert 50 in minmax_indices(ys, 10)
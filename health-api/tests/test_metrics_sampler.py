@@ -0,0 +1,62 @@
+import pytest
+
+from metrics_sampler import CounterSeries, KafkaMetricsSampler
+
+def series(*samples):
+    counter = CounterSeries(maxlen=100)
+    for timestamp, value in samples:
+        counter.add(timestamp, value)
+    return counter
+
+def test_rate_needs_two_samples():
+    assert series().rate(60) is None
+    assert series((0.0, 100.0)).rate(60) is None
+    assert series((0.0, 100.0), (5.0, 150.0)).rate(60) == 10.0
+
+def test_rate_over_a_window_uses_the_sample_before_it_as_baseline():
+    counter = series(*((t, t * 2.0) for t in range(0, 65, 5)))
+    assert counter.rate(10) == pytest.approx(2.0)
+    assert counter.rate(300) == pytest.approx(2.0)
+
+def test_counter_reset_counts_the_new_value_as_the_increase():
+    # Broker restarted between 10s and 15s: 100 -> 20 means 20 new messages
+    counter = series((0.0, 0.0), (5.0, 50.0), (10.0, 100.0), (15.0, 20.0), (20.0, 70.0))
+    assert counter.rate(60) == pytest.approx((50 + 50 + 20 + 50) / 20)
+
+def test_scrape_gap_spreads_the_increase_over_the_gap():
+    counter = series((0.0, 0.0), (5.0, 10.0), (10.0, 20.0), (40.0, 80.0), (45.0, 90.0))
+    # The last sample before the 10s window is 30s back, so the rate spans the whole gap
+    assert counter.rate(10) == pytest.approx((90 - 20) / 35)
+
+def test_ring_buffer_keeps_only_the_newest_samples():
+    counter = CounterSeries(maxlen=3)
+    for t in range(10):
+        counter.add(float(t), t * 10.0)
+    assert [t for t, _ in counter.samples] == [7.0, 8.0, 9.0]
+    assert counter.rate(300) == pytest.approx(10.0)
+
+def exposition(messages: float, offset: float) -> str:
+    return (
+        "# TYPE kafka_server_brokertopicmetrics_messagesin_total counter\n"
+        f'kafka_server_brokertopicmetrics_messagesin_total{{topic="raw-sensor-data",}} {messages}\n'
+        f'kafka_log_log_logendoffset{{partition="0",topic="raw-sensor-data",}} {offset}\n'
+        'kafka_server_brokertopicmetrics_messagesin_total{} 5.0\n'
+    )
+
+def test_topic_rates_sum_brokers_and_partition_rates_take_the_leader():
+    sampler = KafkaMetricsSampler(http=None, host="kafka", interval=5.0, windows=(10,))
+    for t in (0.0, 5.0, 10.0):
+        # Leader and follower both report the partition's offset; each leads other topics
+        sampler.ingest("10.0.0.1", exposition(messages=t * 100, offset=t * 100), t)
+        sampler.ingest("10.0.0.2", exposition(messages=t * 50, offset=t * 90), t)
+    rates = sampler._compute_rates(10.0)
+    assert rates["topics"]["raw-sensor-data"]["messages_in"]["10s"] == pytest.approx(150.0)
+    assert rates["partitions"]["raw-sensor-data"]["0"]["10s"] == pytest.approx(100.0)
+    assert sampler.message_rate("raw-sensor-data", 10) == 0.0  # Not published until a scrape
+
+    # A broker that stops reporting drops out instead of freezing its last rate
+    sampler.ingest("10.0.0.1", exposition(messages=1500, offset=1500), 15.0)
+    sampler.ingest("10.0.0.1", exposition(messages=2000, offset=2000), 25.0)
+    rates = sampler._compute_rates(25.0)
+    # Only 10.0.0.1 remains, measured from its 10s sample across the missed scrape
+    assert rates["topics"]["raw-sensor-data"]["messages_in"]["10s"] == pytest.approx((2000 - 1000) / 15)
@@ -0,0 +1,55 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from kafka import TopicPartition
+
+from probe import RAW_TOPIC, LatencyProbe, parse_time
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024-01-01 12:00:00.5", 1_704_110_400.5),
+    ("2024-01-01 12:00:00", 1_704_110_400.0),
+    ("2024-01-01T12:00:00.123Z", 1_704_110_400.123),
+    ("2024-01-01 12:00:00.123456789", 1_704_110_400.123456789),
+    (1_704_110_400, 1_704_110_400.0),
+    (None, None),
+])
+def test_parse_time_accepts_flink_fractions(value, expected):
+    assert parse_time(value) == pytest.approx(expected)
+
+def test_parse_time_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_time("2024-01-01 12:00:00.5x")
+
+class FakeConsumer:
+    def __init__(self, batches):
+        self.batches = batches
+
+    def poll(self, timeout_ms=None, max_records=None):
+        return self.batches
+
+def record(offset: int, value: bytes):
+    return SimpleNamespace(offset=offset, value=value, headers=[])
+
+def test_malformed_records_are_counted_and_skipped():
+    stats = [
+        record(0, json.dumps({"sensor_id": "sensor_1", "last_produced_at": "2024-01-01 12:00:00.5"}).encode()),
+        record(1, b"not json"),
+        record(2, json.dumps({"sensor_id": "sensor_1", "last_produced_at": "yesterday"}).encode()),
+        record(3, json.dumps({"sensor_id": "sensor_2", "last_produced_at": "2024-01-01 12:00:01"}).encode()),
+    ]
+    raw = [record(0, json.dumps({"sensor_id": "sensor_1", "seq": 0, "produced_at": 1.0}).encode()),
+           record(1, b"\xff")]
+    probe = LatencyProbe("broker:9092")
+    probe.consumer = consumer = FakeConsumer({
+        TopicPartition("sensor-stats", 0): stats,
+        TopicPartition(RAW_TOPIC, 0): raw,
+    })
+    probe.poll_once()
+
+    assert probe.consumer is consumer
+    assert probe.malformed == 3
+    assert probe.stages["stats"].messages == 2
+    assert probe.stages["raw"].messages == 1
+    assert probe.snapshot()["malformed"] == 3
+    assert "pipeline_probe_malformed_total 3" in probe.exposition()
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+import pytest
+
+import upstream
+from upstream import Upstreams
+
+class SlowAdmin:
+    """KafkaAdminClient stand-in whose list_topics blocks until released"""
+    instances = []
+
+    def __init__(self, **config):
+        self.release = threading.Event()
+        self.active = 0
+        self.overlapped = False
+        SlowAdmin.instances.append(self)
+
+    def list_topics(self):
+        self.active += 1
+        self.overlapped |= self.active > 1
+        self.release.wait(5)
+        self.active -= 1
+        return ["raw-sensor-data"]
+
+    def close(self):
+        pass
+
+def test_timed_out_list_topics_keeps_the_admin_client(monkeypatch):
+    SlowAdmin.instances = []
+    monkeypatch.setattr(upstream, "KafkaAdminClient", SlowAdmin)
+    upstreams = Upstreams()
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(upstreams.list_topics(), 0.05)
+        # The abandoned call still owns the client
+        with pytest.raises(RuntimeError):
+            await upstreams.list_topics()
+        SlowAdmin.instances[0].release.set()
+        await asyncio.sleep(0.05)
+        return await upstreams.list_topics()
+
+    assert asyncio.run(scenario()) == ["raw-sensor-data"]
+    assert len(SlowAdmin.instances) == 1
+    assert not SlowAdmin.instances[0].overlapped
+
+def test_concurrent_first_requests_share_one_pool(monkeypatch):
+    created = []
+
+    async def create_pool(**config):
+        await asyncio.sleep(0.01)
+        created.append(object())
+        return created[-1]
+
+    monkeypatch.setattr(upstream.asyncpg, "create_pool", create_pool)
+    upstreams = Upstreams()
+
+    async def scenario():
+        return await asyncio.gather(*(upstreams.db() for _ in range(5)))
+
+    pools = asyncio.run(scenario())
+    assert len(created) == 1 and all(pool is created[0] for pool in pools)
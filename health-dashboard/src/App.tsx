@@ -65,13 +65,6 @@ const App = () => {
           }), {})
         );
 
-        // Fetch metrics
-        const metricsResponse = await fetch('/api/metrics');
-        if (metricsResponse.ok) {
-          const metricsData = await metricsResponse.json();
-          setMetrics(metricsData);
-        }
-        
         setLastUpdated(new Date());
       } catch (error) {
         console.error('Failed to fetch health data:', error);
@@ -86,6 +79,17 @@ const App = () => {
     return () => clearInterval(interval);
   }, []);
 
+  useEffect(() => {
+    // Metrics are pushed by the health API whenever its collector refreshes a source
+    const events = new EventSource('/api/metrics/stream');
+    events.addEventListener('metrics', (event) => {
+      setMetrics(JSON.parse((event as MessageEvent).data));
+      setLastUpdated(new Date());
+    });
+    events.onerror = () => console.error('Metrics stream interrupted, reconnecting');
+    return () => events.close();
+  }, []);
+
   const getServiceIcon = (service: string) => {
     switch (service) {
       case 'kafka':
@@ -0,0 +1,15 @@
+# Build the Docker image
+docker build -t localhost:5000/sensor-ingestion .
+
+# Push the Docker image to the local registry
+docker push localhost:5000/sensor-ingestion
+
+# Apply the Kubernetes deployment using the YAML files in the k8s directory
+kubectl apply -f k8s/01-ingestion-namespace.yaml
+kubectl apply -f k8s/02-ingestion-configmap.yaml -n sensor-ingestion
+kubectl apply -f k8s/03-ingestion-deployment.yaml -n sensor-ingestion
+kubectl apply -f k8s/04-ingestion-service.yaml -n sensor-ingestion
+
+# Verify the deployment
+kubectl get all -n sensor-ingestion
+kubectl logs --namespace sensor-ingestion -l app=sensor-ingestion
@@ -0,0 +1,71 @@
+# ingestion/src/decoding.py
+import json
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+# Must match SCHEMA_ID_HEADER and the serializers in the sensor backend's kafka_utils.py
+SCHEMA_ID_HEADER = 'schema-id'
+JSON_SCHEMA_ID = 0
+AVRO_READING_SCHEMA_ID = 2
+# Readings written before seq and produced_at were added
+AVRO_READING_V1_SCHEMA_ID = 1
+
+_doubles = struct.Struct('<ddd')
+
+def _read_long(data: bytes, pos: int) -> Tuple[int, int]:
+    shift = 0
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    return (value >> 1) ^ -(value & 1), pos
+
+def _read_string(data: bytes, pos: int) -> Tuple[str, int]:
+    length, pos = _read_long(data, pos)
+    return data[pos:pos + length].decode('utf-8'), pos + length
+
+def _decode_avro_reading(data: bytes, with_sequence: bool = True) -> Dict[str, Any]:
+    sensor_id, pos = _read_string(data, 0)
+    temperature, vibration, pressure = _doubles.unpack_from(data, pos)
+    operational_state, pos = _read_string(data, pos + _doubles.size)
+    flags = pos
+    timestamp_ms, pos = _read_long(data, pos + 2)
+    reading = {
+        "sensor_id": sensor_id,
+        "timestamp": timestamp_ms / 1000,
+        "temperature": temperature,
+        "vibration": vibration,
+        "pressure": pressure,
+        "operational_state": operational_state,
+        "maintenance_needed": data[flags] == 1,
+        "is_test": data[flags + 1] == 1
+    }
+    if with_sequence:
+        reading["seq"], pos = _read_long(data, pos)
+        produced_at_ms, _ = _read_long(data, pos)
+        reading["produced_at"] = produced_at_ms / 1000
+    return reading
+
+def schema_id(headers: Optional[List[Tuple[str, bytes]]]) -> int:
+    """Schema id from the record headers; records without one predate the header and are JSON"""
+    for key, value in headers or ():
+        if key == SCHEMA_ID_HEADER:
+            return int(value)
+    return JSON_SCHEMA_ID
+
+def decode_reading(value: bytes, headers: Optional[List[Tuple[str, bytes]]]) -> Optional[Dict[str, Any]]:
+    """Decode a raw-sensor-data record, or None if it is not a sensor reading"""
+    schema = schema_id(headers)
+    if schema == AVRO_READING_SCHEMA_ID:
+        return _decode_avro_reading(value)
+    if schema == AVRO_READING_V1_SCHEMA_ID:
+        return _decode_avro_reading(value, with_sequence=False)
+    if schema == JSON_SCHEMA_ID:
+        message = json.loads(value.decode('utf-8'))
+        # Startup probes share the topic but carry no reading
+        return message if "sensor_id" in message else None
+    raise ValueError(f"Unknown schema id {schema}")
@@ -0,0 +1,212 @@
+# ingestion/src/ingest.py
+import asyncio
+import logging
+from datetime import datetime, timezone
+from time import monotonic
+from typing import Any, Dict, List, Optional, Tuple
+
+import asyncpg
+from kafka import KafkaConsumer
+from kafka.errors import CommitFailedError
+
+from decoding import decode_reading
+
+COLUMNS = (
+    "time", "sensor_id", "temperature", "vibration", "pressure",
+    "operational_state", "maintenance_needed", "is_test"
+)
+
+# COPY cannot skip conflicts, so each batch lands in a per-connection staging
+# table first and is moved over with ON CONFLICT DO NOTHING; replayed records
+# after a crash or rebalance are dropped instead of duplicated.
+CREATE_STAGING = """
+    CREATE TEMP TABLE IF NOT EXISTS sensor_data_staging
+    (LIKE sensor_data INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+"""
+MERGE_STAGING = f"""
+    INSERT INTO sensor_data ({", ".join(COLUMNS)})
+    SELECT {", ".join(COLUMNS)} FROM sensor_data_staging
+    ON CONFLICT (sensor_id, time) DO NOTHING
+"""
+
+def to_record(reading: Dict[str, Any]) -> Tuple:
+    """COPY row for a reading; raises KeyError, TypeError or ValueError for a malformed one.
+
+    Converting here keeps a bad value out of the batch, where COPY would reject
+    the whole batch on every retry.
+    """
+    return (
+        datetime.fromtimestamp(float(reading["timestamp"]), tz=timezone.utc),
+        str(reading["sensor_id"]),
+        float(reading["temperature"]),
+        float(reading["vibration"]),
+        float(reading["pressure"]),
+        str(reading["operational_state"]),
+        bool(reading["maintenance_needed"]),
+        bool(reading["is_test"])
+    )
+
+class IngestStats:
+    """Counters shared by all partition workers"""
+
+    def __init__(self):
+        self.started = monotonic()
+        self.rows_written = 0
+        self.duplicates = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.worker_restarts = 0
+        self.batches = 0
+        self.last_batch_seconds = 0.0
+        self._window_start = monotonic()
+        self._window_rows = 0
+        self.rows_per_sec = 0.0
+
+    def record_batch(self, written: int, duplicates: int, seconds: float):
+        self.rows_written += written
+        self.duplicates += duplicates
+        self.batches += 1
+        self.last_batch_seconds = seconds
+        self._window_rows += written
+        elapsed = monotonic() - self._window_start
+        if elapsed >= 5:
+            self.rows_per_sec = self._window_rows / elapsed
+            self._window_rows = 0
+            self._window_start = monotonic()
+
+    def to_dict(self) -> Dict[str, Any]:
+        uptime = monotonic() - self.started
+        return {
+            "rows_written": self.rows_written,
+            "rows_per_sec": round(self.rows_per_sec, 1),
+            "avg_rows_per_sec": round(self.rows_written / uptime, 1) if uptime > 0 else 0.0,
+            "duplicates_skipped": self.duplicates,
+            "non_readings_skipped": self.skipped,
+            "invalid_records_skipped": self.invalid,
+            "worker_restarts": self.worker_restarts,
+            "batches": self.batches,
+            "last_batch_ms": round(self.last_batch_seconds * 1000, 1)
+        }
+
+class PartitionWorker:
+    """One consumer in the ingest group; Kafka assigns it a share of the partitions.
+
+    Records are micro-batched until batch_size rows or max_latency seconds after
+    the first record, written with binary COPY, and only then are the offsets
+    committed, so a crash replays at most the unwritten batch. run_forever()
+    rebuilds the consumer after any failure, so a partition never silently
+    stops ingesting.
+    """
+
+    def __init__(self, worker_id: int, consumer_options: Dict[str, Any], topic: str,
+                 pool: asyncpg.Pool, stats: IngestStats,
+                 batch_size: int, max_latency: float):
+        self.worker_id = worker_id
+        self.topic = topic
+        self.consumer_options = consumer_options
+        self.consumer: Optional[KafkaConsumer] = None
+        self.pool = pool
+        self.stats = stats
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.logger = logging.getLogger(f"{__name__}.worker{worker_id}")
+
+    async def run_forever(self):
+        """Run the worker, restarting it with backoff whenever it fails"""
+        delay = 1.0
+        while True:
+            started = monotonic()
+            try:
+                await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.exception(f"Worker failed, restarting in {delay:.0f}s: {e!r}")
+            self.stats.worker_restarts += 1
+            if monotonic() - started > 60:
+                delay = 1.0  # Ran fine for a while; this is a new failure
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    async def run(self):
+        self.consumer = await asyncio.to_thread(
+            KafkaConsumer,
+            self.topic,
+            enable_auto_commit=False,
+            max_poll_records=self.batch_size,
+            **self.consumer_options
+        )
+        try:
+            while True:
+                records, consumed = await self._collect_batch()
+                if records:
+                    await self._write_with_retry(records)
+                # Also commit batches of only skipped or invalid records, or a
+                # partition of them would be re-read after every restart
+                if consumed:
+                    try:
+                        await asyncio.to_thread(self.consumer.commit)
+                    except CommitFailedError as e:
+                        # Partitions moved during a long write; the new owner
+                        # replays them and the unique index drops the duplicates
+                        self.logger.warning(f"Offset commit failed after rebalance: {e}")
+        finally:
+            await asyncio.to_thread(self.consumer.close)
+
+    async def _write_with_retry(self, records: List[Tuple]):
+        # The consumer has already moved past these records, so keep retrying the
+        # same batch rather than dropping it; offsets stay uncommitted meanwhile
+        delay = 1.0
+        while True:
+            try:
+                await self._write(records)
+                return
+            except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError) as e:
+                # InterfaceError: the connection was closed under us, e.g. by a database restart
+                self.logger.error(f"Batch write failed, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    async def _collect_batch(self) -> Tuple[List[Tuple], int]:
+        """COPY rows for the next batch, and how many records were consumed for it"""
+        records: List[Tuple] = []
+        consumed = 0
+        deadline = None
+        while len(records) < self.batch_size:
+            timeout = self.max_latency if deadline is None else deadline - monotonic()
+            if timeout <= 0:
+                break
+            polled = await asyncio.to_thread(
+                self.consumer.poll,
+                timeout_ms=int(timeout * 1000),
+                max_records=self.batch_size - len(records)
+            )
+            for partition_records in polled.values():
+                consumed += len(partition_records)
+                for message in partition_records:
+                    try:
+                        reading = decode_reading(message.value, message.headers)
+                        if reading is None:
+                            self.stats.skipped += 1
+                            continue
+                        records.append(to_record(reading))
+                    except Exception as e:
+                        self.logger.error(f"Invalid record at {message.topic}/{message.partition}@{message.offset}: {e!r}")
+                        self.stats.invalid += 1
+            if consumed and deadline is None:
+                deadline = monotonic() + self.max_latency
+            if not polled and deadline is None:
+                return records, consumed
+        return records, consumed
+
+    async def _write(self, records: List[Tuple]):
+        started = monotonic()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(CREATE_STAGING)
+                await conn.copy_records_to_table(
+                    "sensor_data_staging", records=records, columns=COLUMNS
+                )
+                status = await conn.execute(MERGE_STAGING)
+        written = int(status.split()[-1])
+        self.stats.record_batch(written, len(records) - written, monotonic() - started)
@@ -0,0 +1,78 @@
+# ingestion/src/main.py
+from fastapi import FastAPI
+from ingest import IngestStats, PartitionWorker
+import asyncio
+import asyncpg
+import logging
+import os
+from typing import Any, Dict, List
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+KAFKA_BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'iot-kafka-brokers.kafka.svc.cluster.local:9092')
+INGEST_TOPIC = os.getenv('INGEST_TOPIC', 'raw-sensor-data')
+INGEST_GROUP_ID = os.getenv('INGEST_GROUP_ID', 'timescale-ingest')
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '6'))
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '5000'))
+INGEST_MAX_LATENCY_MS = int(os.getenv('INGEST_MAX_LATENCY_MS', '1000'))
+STATS_LOG_INTERVAL = 30
+
+app = FastAPI()
+stats = IngestStats()
+tasks: List[asyncio.Task] = []
+
+async def log_stats():
+    while True:
+        await asyncio.sleep(STATS_LOG_INTERVAL)
+        logger.info(f"Ingest stats: {stats.to_dict()}")
+
+async def startup_event():
+    """Open the database pool and start one consumer per partition"""
+    app.pool = await asyncpg.create_pool(
+        database=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=int(os.getenv("DB_PORT", "5432")),
+        min_size=1,
+        max_size=INGEST_WORKERS
+    )
+    consumer_options = {
+        "bootstrap_servers": KAFKA_BOOTSTRAP_SERVERS.split(','),
+        "group_id": INGEST_GROUP_ID,
+        "auto_offset_reset": "earliest",
+        "client_id": "timescale-ingest"
+    }
+    for worker_id in range(INGEST_WORKERS):
+        worker = PartitionWorker(
+            worker_id, consumer_options, INGEST_TOPIC, app.pool, stats,
+            INGEST_BATCH_SIZE, INGEST_MAX_LATENCY_MS / 1000
+        )
+        tasks.append(asyncio.create_task(worker.run_forever()))
+    tasks.append(asyncio.create_task(log_stats()))
+    logger.info(f"Started {INGEST_WORKERS} ingest workers on {INGEST_TOPIC}")
+
+async def shutdown_event():
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await app.pool.close()
+
+@app.get("/status")
+async def status() -> Dict[str, Any]:
+    """Ingest throughput and worker liveness"""
+    workers = tasks[:INGEST_WORKERS]
+    return {
+        "workers": len(workers),
+        "workers_running": sum(1 for task in workers if not task.done()),
+        "batch_size": INGEST_BATCH_SIZE,
+        "max_latency_ms": INGEST_MAX_LATENCY_MS,
+        **stats.to_dict()
+    }
+
+app.add_event_handler("startup", startup_event)
+app.add_event_handler("shutdown", shutdown_event)
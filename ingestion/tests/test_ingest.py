@@ -0,0 +1,130 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from kafka import TopicPartition
+
+import ingest
+from ingest import COLUMNS, CREATE_STAGING, MERGE_STAGING, IngestStats, PartitionWorker
+
+class FakeConnection:
+    """Records the statements of one write; MERGE reports merged rows, as asyncpg's status does"""
+
+    def __init__(self, merged: int):
+        self.merged = merged
+        self.calls = []
+
+    def transaction(self):
+        conn = self
+
+        class Transaction:
+            async def __aenter__(self):
+                conn.calls.append("BEGIN")
+
+            async def __aexit__(self, *exc):
+                conn.calls.append("COMMIT" if exc[0] is None else "ROLLBACK")
+                return False
+        return Transaction()
+
+    async def execute(self, query):
+        self.calls.append(query)
+        return f"INSERT 0 {self.merged}" if query == MERGE_STAGING else "CREATE TABLE"
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.calls.append(("COPY", table, list(records), columns))
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def acquire(self):
+        conn = self.conn
+
+        class Acquire:
+            async def __aenter__(self):
+                return conn
+
+            async def __aexit__(self, *exc):
+                return False
+        return Acquire()
+
+class Stop(Exception):
+    pass
+
+class FakeConsumer:
+    """Hands out scripted polls, then empty ones until the worker commits or gives up"""
+
+    def __init__(self, polls):
+        self.polls = list(polls)
+        self.commits = 0
+        self.empty_polls = 0
+
+    def poll(self, timeout_ms=None, max_records=None):
+        if self.polls:
+            return self.polls.pop(0)
+        self.empty_polls += 1
+        if self.commits or self.empty_polls > 10:
+            raise Stop()
+        time.sleep(timeout_ms / 1000)  # A real poll waits out its timeout
+        return {}
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        pass
+
+def message(offset: int, payload: dict):
+    return SimpleNamespace(topic="raw-sensor-data", partition=0, offset=offset,
+                           value=json.dumps(payload).encode(), headers=[])
+
+def reading(sensor_id: str, timestamp: float) -> dict:
+    return {"sensor_id": sensor_id, "timestamp": timestamp, "temperature": 70.0, "vibration": 0.2,
+            "pressure": 100.0, "operational_state": "normal", "maintenance_needed": False,
+            "is_test": False}
+
+def worker(conn: FakeConnection, stats: IngestStats) -> PartitionWorker:
+    return PartitionWorker(0, {}, "raw-sensor-data", FakePool(conn), stats,
+                           batch_size=100, max_latency=0.01)
+
+def run_until_stopped(monkeypatch, partition_worker, polls) -> FakeConsumer:
+    consumer = FakeConsumer(polls)
+    monkeypatch.setattr(ingest, "KafkaConsumer", lambda *args, **kwargs: consumer)
+    with pytest.raises(Stop):
+        asyncio.run(partition_worker.run())
+    return consumer
+
+def test_write_copies_into_staging_and_merges_without_duplicates():
+    conn = FakeConnection(merged=2)
+    stats = IngestStats()
+    records = [ingest.to_record(reading(f"sensor_{i}", 1_700_000_000.0)) for i in range(3)]
+    asyncio.run(worker(conn, stats)._write(records))
+
+    assert conn.calls == [
+        "BEGIN", CREATE_STAGING, ("COPY", "sensor_data_staging", records, COLUMNS), MERGE_STAGING, "COMMIT"
+    ]
+    assert "ON CONFLICT (sensor_id, time) DO NOTHING" in MERGE_STAGING
+    assert stats.rows_written == 2 and stats.duplicates == 1
+
+def test_batches_without_readings_are_still_committed(monkeypatch):
+    conn = FakeConnection(merged=0)
+    stats = IngestStats()
+    key = TopicPartition("raw-sensor-data", 0)
+    polls = [
+        {key: [message(0, {"type": "startup"}), message(1, {"sensor_id": "sensor_1"})]},
+    ]
+    consumer = run_until_stopped(monkeypatch, worker(conn, stats), polls)
+    assert conn.calls == []  # Nothing to write
+    assert consumer.commits == 1
+    assert stats.skipped == 1 and stats.invalid == 1
+
+def test_mixed_batch_is_written_before_commit(monkeypatch):
+    conn = FakeConnection(merged=1)
+    stats = IngestStats()
+    key = TopicPartition("raw-sensor-data", 0)
+    polls = [{key: [message(0, reading("sensor_1", 1_700_000_000.0)), message(1, {"type": "startup"})]}]
+    consumer = run_until_stopped(monkeypatch, worker(conn, stats), polls)
+    assert conn.calls[-1] == "COMMIT" and consumer.commits == 1
+    assert stats.rows_written == 1
@@ -23,6 +23,8 @@ kubectl apply -f 04-kafka-servicemonitor.yaml -n monitoring
 kubectl apply -f 05-prometheus-pod.yaml -n monitoring
 kubectl apply -f 06-grafana-dashboards.yaml -n monitoring
 kubectl apply -f 07-grafana.yaml -n monitoring
+kubectl apply -f 08-sensor-backend-servicemonitor.yaml -n monitoring
+kubectl apply -f 09-health-api-servicemonitor.yaml -n monitoring
 
 # Wait for deployments
 kubectl wait deployment/grafana --for=condition=Available=True -n monitoring --timeout=300s